@@ -0,0 +1,186 @@
+"""
+Benchmark of the browser profiles: stock Chrome against the lean profile
+(client_side/lean_profile.py).
+
+A local server serves a page with images, a web font, a video and a
+third-party tracker script; every resource is answered after a delay, like
+over a real network. The tracker is served from "localhost" while the page
+is served from 127.0.0.1, so the lean profile can block it as a third-party
+host. For both profiles the benchmark launches Chrome through the
+BrowserLauncher and visits the page a number of times. It reports the
+launch time, the latency of `browser.visit`, the load time of the page by
+its navigation timing, and the number of resource requests per visit.
+
+Run from the root of the repository (needs Chrome and chromedriver):
+    python benchmarks/bench_browser_profile.py
+    python benchmarks/bench_browser_profile.py --visits 50 --images 40 --delay-ms 100
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugin_adapter_components.client_side.browser_launcher import BrowserLauncher
+
+# The load time of the page, from the navigation to the end of the load event
+LOAD_TIME_SCRIPT = """
+    var navigation = performance.getEntriesByType('navigation')[0];
+    return navigation ? navigation.loadEventEnd - navigation.startTime : null;
+"""
+
+
+"""
+Generate the page of the benchmark.
+param [Integer] port
+param [Integer] images
+return [String]
+"""
+def generate_page(port, images):
+    rows = "".join(('<li class="product"><img src="/images/{0}.png" alt="Product {0}">'
+        '<a href="/products/{0}">Product {0}</a><span class="price">{0}.00</span></li>').format(i)
+        for i in range(images))
+    return ("<html><head><title>Catalog</title>"
+        "<style>@font-face {{ font-family: Brand; src: url('/fonts/brand.woff2'); }}"
+        " body {{ font-family: Brand, sans-serif; }}</style>"
+        "<script async src=\"http://localhost:{0}/tracker.js\"></script></head>"
+        "<body><nav><a href=\"/\">Home</a></nav>"
+        "<video src=\"/media/intro.mp4\" preload=\"auto\"></video>"
+        "<main><ul>{1}</ul></main><footer>Footer</footer></body></html>").format(port, rows)
+
+
+"""
+Serves the page, and the resources after a delay.
+"""
+class PageHandler(BaseHTTPRequestHandler):
+    CONTENT_TYPES = {".png": "image/png", ".woff2": "font/woff2", ".mp4": "video/mp4",
+        ".js": "text/javascript"}
+
+    def do_GET(self):
+        server = self.server
+        if self.path == "/":
+            body = server.page.encode("utf-8")
+            content_type = "text/html; charset=utf-8"
+        else:
+            with server.lock:
+                server.resource_requests += 1
+            time.sleep(server.delay)
+            extension = os.path.splitext(self.path)[1]
+            content_type = self.CONTENT_TYPES.get(extension, "application/octet-stream")
+            body = b"" if extension == ".js" else bytes(server.resource_size)
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+"""
+Start the page server on a free port.
+param [argparse.Namespace] args
+return [ThreadingHTTPServer]
+"""
+def start_server(args):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    server.daemon_threads = True
+    server.page = generate_page(server.server_address[1], args.images)
+    server.delay = args.delay_ms / 1000
+    server.resource_size = args.resource_kb * 1024
+    server.resource_requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+"""
+Launch a browser with a profile and visit the page.
+param [ThreadingHTTPServer] server
+param [{String: Object}] lean; the LeanProfile options, None for stock Chrome
+param [argparse.Namespace] args
+return [{String: Object}]
+"""
+def run_profile(server, lean, args):
+    url = "http://127.0.0.1:{}/".format(server.server_address[1])
+    launcher = BrowserLauncher(headless=not args.headed, lean=lean)
+
+    started = time.perf_counter()
+    browser = launcher.launch()
+    launch_ms = (time.perf_counter() - started) * 1000
+
+    visits = []
+    loads = []
+    try:
+        browser.visit("about:blank")
+        requests_before = server.resource_requests
+        for _ in range(args.visits):
+            started = time.perf_counter()
+            browser.visit(url)
+            visits.append((time.perf_counter() - started) * 1000)
+            load_ms = browser.driver.execute_script(LOAD_TIME_SCRIPT)
+            if load_ms != None:
+                loads.append(load_ms)
+            browser.visit("about:blank")
+        requests = (server.resource_requests - requests_before) / args.visits
+    finally:
+        browser.quit()
+
+    return {"launch_ms": launch_ms, "visit_ms": visits, "load_ms": loads,
+        "requests": requests}
+
+
+"""
+param [[Float]] values
+return [(Float, Float, Float)] mean, median and 95th percentile
+"""
+def summarize(values):
+    if not values:
+        return 0.0, 0.0, 0.0
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return statistics.mean(ordered), statistics.median(ordered), p95
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--visits', type=int, default=20, help='Visits of the page per profile')
+    parser.add_argument('--images', type=int, default=30, help='Images on the page')
+    parser.add_argument('--delay-ms', type=float, default=50,
+        help='Milliseconds every resource is delayed, like network latency')
+    parser.add_argument('--resource-kb', type=int, default=64, help='Size of every resource')
+    parser.add_argument('--window-size', default="1280x800", help='Window size of the lean profile')
+    parser.add_argument('--headed', action='store_true', help='Show the browser windows')
+    args = parser.parse_args()
+
+    width, _, height = args.window_size.partition("x")
+    profiles = [
+        ("stock", None),
+        ("lean", {"block_hosts": ["localhost"], "window_size": (int(width), int(height))}),
+    ]
+
+    server = start_server(args)
+    try:
+        print("{:<8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>9}".format(
+            "profile", "launch ms", "visit ms", "visit p50", "visit p95", "load ms", "load p95", "requests"))
+        for name, lean in profiles:
+            result = run_profile(server, lean, args)
+            visit_mean, visit_p50, visit_p95 = summarize(result["visit_ms"])
+            load_mean, _, load_p95 = summarize(result["load_ms"])
+            print("{:<8} {:>10.0f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>9.1f}".format(
+                name, result["launch_ms"], visit_mean, visit_p50, visit_p95, load_mean, load_p95,
+                result["requests"]))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
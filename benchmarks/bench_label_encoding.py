@@ -0,0 +1,75 @@
+"""
+Benchmark of the encoding of page_update response labels: the CopyFrom based
+Handler.generate_value_label against the compiled LabelEncoder.
+
+Run from the root of the repository:
+    python benchmarks/bench_label_encoding.py --actions 100 1000 10000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugin_adapter_components.logger import Logger
+from plugin_adapter_components.handler import Handler
+from plugin_adapter_components.label_encoder import LabelEncoder
+
+
+"""
+Build a page_update `nodes` struct like the ones produced by the diff of a
+large page.
+param [Integer] actions; number of diff actions
+return [dict]
+"""
+def page_update_nodes(actions):
+    nodes = {"InsertNode": [], "InsertAttrib": [], "UpdateTextIn": [], "DeleteNode": []}
+    for i in range(actions):
+        path = "/html/body/div[2]/main/section[{}]/ul/li[{}]".format(i % 17 + 1, i + 1)
+        match i % 4:
+            case 0:
+                nodes["InsertNode"].append({"target": path, "tag": "li", "position": str(i % 9)})
+            case 1:
+                nodes["InsertAttrib"].append({"node": path, "name": "class", "value": "item item-{}".format(i)})
+            case 2:
+                nodes["UpdateTextIn"].append({"node": path, "text": "Product {} - in stock, ships in {} days".format(i, i % 5)})
+            case 3:
+                nodes["DeleteNode"].append({"node": path})
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--actions', type=int, nargs='+', default=[100, 1000, 10000],
+        help='Number of diff actions in the page_update payloads')
+    parser.add_argument('--repeat', type=int, default=20,
+        help='Encodings per measurement')
+    args = parser.parse_args()
+
+    logger = Logger()
+    handler = Handler(logger)
+    types = {'nodes': 'struct'}
+    encoder = LabelEncoder('page_update', 1, types, logger)
+
+    print("{:>8} {:>14} {:>14} {:>8}".format("actions", "legacy [ms]", "compiled [ms]", "speedup"))
+    for actions in args.actions:
+        values = {'nodes': page_update_nodes(actions)}
+
+        legacy_label = handler.generate_value_label('page_update', 1, types, values)
+        compiled_label = encoder.encode(values)
+        legacy_label.timestamp = compiled_label.timestamp = 0
+        if legacy_label.SerializeToString() != compiled_label.SerializeToString():
+            print("Encodings differ for {} actions".format(actions))
+            sys.exit(1)
+
+        legacy = min(timeit.repeat(lambda: handler.generate_value_label('page_update', 1, types, values),
+            number=args.repeat, repeat=3)) / args.repeat
+        compiled = min(timeit.repeat(lambda: encoder.encode(values),
+            number=args.repeat, repeat=3)) / args.repeat
+
+        print("{:>8} {:>14.3f} {:>14.3f} {:>7.1f}x".format(actions, legacy * 1e3, compiled * 1e3, legacy / compiled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark of the page diff engines: xmldiff against the Merkle-hashed subtree
+diff (client_side/merkle_diff.py), on pages of 10 KB up to 5 MB.
+
+Every page is compared with a copy in which a few elements are updated,
+inserted and deleted, like a page after a click. The benchmark reports the
+time per diff, the number of edit actions, and whether applying the actions
+to the page before (with xmldiff's patcher) yields the page after. The pages
+are generated, or taken from a directory of .html files.
+
+Run from the root of the repository:
+    python benchmarks/bench_page_diff.py --sizes 10 100 1000 5000
+    python benchmarks/bench_page_diff.py --corpus pages/ --xmldiff-max-kb 500
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree
+from xmldiff import main as xmldiff_main
+
+from plugin_adapter_components.client_side.page_diff import DIFF_ENGINES
+
+
+"""
+Generate a product listing page of about the given size.
+param [Integer] size_kb
+param [random.Random] rng
+return [String]
+"""
+def generate_page(size_kb, rng):
+    rows = []
+    size = 0
+    i = 0
+    while size < size_kb * 1024:
+        row = ('<li class="product" data-id="{0}"><a href="/products/{0}">Product {0}</a>'
+            '<span class="price">{1}.{2:02d}</span><p>In stock, ships in {3} days</p></li>').format(
+            i, rng.randint(1, 500), rng.randint(0, 99), rng.randint(1, 9))
+        rows.append(row)
+        size += len(row)
+        i += 1
+
+    sections = ["<section><ul>{}</ul></section>".format("".join(rows[start:start + 50]))
+        for start in range(0, len(rows), 50)]
+    return ("<html><head><title>Catalog</title></head><body><nav><a href=\"/\">Home</a></nav>"
+        "<main>{}</main><footer>Footer</footer></body></html>").format("".join(sections))
+
+
+"""
+Apply a few edits to a page, like an update after a click.
+param [lxml.etree._ElementTree] tree
+param [random.Random] rng
+param [Integer] edits
+return [lxml.etree._ElementTree]
+"""
+def mutate(tree, rng, edits):
+    tree = copy.deepcopy(tree)
+    elements = [element for element in tree.getroot().iter(tag=etree.Element)
+        if element.getparent() is not None and element.tag not in ("head", "body", "title")]
+
+    for _ in range(edits):
+        element = rng.choice(elements)
+        if element.getparent() is None:
+            continue
+        match rng.randrange(4):
+            case 0:
+                element.text = "Updated {}".format(rng.randrange(1000))
+            case 1:
+                element.set("class", "highlighted")
+            case 2:
+                new = etree.SubElement(element, "div", {"class": "notice"})
+                new.text = "Added to your cart"
+            case 3:
+                if element.getparent().tag != "html":
+                    element.getparent().remove(element)
+    return tree
+
+
+def parse(html):
+    return etree.parse(StringIO(html), etree.HTMLParser())
+
+
+def serialize(tree):
+    root = tree.getroot() if hasattr(tree, "getroot") else tree
+    return etree.tostring(root, encoding="unicode", method="html")
+
+
+"""
+Time an engine on a pair of pages.
+param [String] engine
+param [lxml.etree._ElementTree] before
+param [lxml.etree._ElementTree] after
+param [Integer] repeat
+return [(Float, Integer, Boolean)] milliseconds per diff, actions, whether
+the actions patch the page before into the page after
+"""
+def measure(engine, before, after, repeat):
+    diff_trees = DIFF_ENGINES[engine]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        actions = diff_trees(before, after)
+    elapsed_ms = (time.perf_counter() - started) / repeat * 1e3
+
+    patched = xmldiff_main.patch_tree(actions, before)
+    return elapsed_ms, len(actions), serialize(patched) == serialize(after)
+
+
+"""
+The pages to compare: (name, size in KB, html).
+param [argparse.Namespace] args
+param [random.Random] rng
+return [[(String, Float, String)]]
+"""
+def corpus(args, rng):
+    if args.corpus:
+        pages = []
+        for name in sorted(os.listdir(args.corpus)):
+            if name.endswith(".html"):
+                with open(os.path.join(args.corpus, name), encoding="utf-8") as page:
+                    html = page.read()
+                pages.append((name, len(html) / 1024, html))
+        return pages
+
+    pages = []
+    for size_kb in args.sizes:
+        html = generate_page(size_kb, rng)
+        pages.append(("generated", len(html) / 1024, html))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000],
+        help='Sizes of the generated pages in KB')
+    parser.add_argument('--corpus', help='Directory of .html pages instead of generated pages')
+    parser.add_argument('--edits', type=int, default=10, help='Edits applied to every page')
+    parser.add_argument('--repeat', type=int, default=3, help='Diffs per measurement')
+    parser.add_argument('--xmldiff-max-kb', type=float, default=1000,
+        help='Skip xmldiff for larger pages, it takes minutes on pages of megabytes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print("{:<16} {:>9} {:>8} {:>12} {:>8} {:>6} {:>8}".format(
+        "page", "size [KB]", "engine", "diff [ms]", "actions", "valid", "speedup"))
+    for name, size_kb, html in corpus(args, rng):
+        before = parse(html)
+        after = parse(serialize(mutate(before, rng, args.edits)))
+
+        results = {}
+        for engine in DIFF_ENGINES:
+            if engine == "xmldiff" and size_kb > args.xmldiff_max_kb:
+                continue
+            results[engine] = measure(engine, before, after, args.repeat)
+
+        for engine, (elapsed_ms, actions, valid) in results.items():
+            speedup = ""
+            if engine != "xmldiff" and "xmldiff" in results:
+                speedup = "{:.1f}x".format(results["xmldiff"][0] / elapsed_ms)
+            print("{:<16} {:>9.0f} {:>8} {:>12.1f} {:>8} {:>6} {:>8}".format(
+                name[:16], size_kb, engine, elapsed_ms, actions, "yes" if valid else "no", speedup))
+        if "xmldiff" not in results:
+            print("{:<16} {:>9.0f} {:>8} {:>12}".format(name[:16], size_kb, "xmldiff", "skipped"))
+
+
+if __name__ == '__main__':
+    main()
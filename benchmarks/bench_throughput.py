@@ -0,0 +1,184 @@
+"""
+End-to-end throughput benchmark of the plugin adapter against the local fake
+AMP broker (benchmarks/fake_amp.py).
+
+The adapter is started with plugin_adapter.start_plugin_adapter in a child
+process and driven through a scripted session. The benchmark reports the
+stimuli per second, the latency from a stimulus to its first response, the
+reset latency, and the memory, thread count and CPU time of the adapter
+process, so a soak with many resets shows whether resources leak.
+
+Run from the root of the repository:
+    python benchmarks/bench_throughput.py --count 2000 --reset-every 100
+    python benchmarks/bench_throughput.py --script session.json --broker-mode async
+    python benchmarks/bench_throughput.py --count 20000 --sut simulated
+    python benchmarks/bench_throughput.py --count 10000 --reset-every 1 --sut simulated
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_amp import FakeAmp
+
+
+"""
+Run the plugin adapter; the target of the child process.
+param [String] url
+param [Integer] log_level
+param [dict] options; keyword arguments of start_plugin_adapter
+"""
+def run_adapter(url, log_level, options):
+    os.chdir(REPOSITORY)
+    from plugin_adapter import start_plugin_adapter
+    start_plugin_adapter("bench@fake-amp", url, "fake-token", log_level, False, **options)
+
+
+"""
+Resident memory in KiB, number of threads and CPU seconds (user and system)
+of a process; zeros when they can not be read.
+param [Integer] pid
+return [(Integer, Integer, Float)]
+"""
+def process_usage(pid):
+    rss, threads, cpu = 0, 0, 0.0
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+                elif line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+        with open("/proc/{}/stat".format(pid)) as stat:
+            # The fields after the command name, which may contain spaces
+            fields = stat.read().rsplit(")", 1)[1].split()
+            cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        pass
+    return rss, threads, cpu
+
+
+"""
+Percentile of a list of seconds, in milliseconds.
+param [[Float]] values
+param [Float] quantile
+return [Float]
+"""
+def percentile_ms(values, quantile):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(quantile * len(values)))] * 1e3
+
+
+"""
+Keyword arguments of start_plugin_adapter from the command line arguments.
+param [argparse.Namespace] args
+return [dict]
+"""
+def adapter_options(args):
+    options = {
+        "broker_mode": args.broker_mode,
+        "reset_strategy": args.reset_strategy,
+        "sut_options": {"change_capture": args.change_capture, "diff_engine": args.diff_engine},
+        "sut_backend": args.sut,
+        "diff_workers": args.diff_workers,
+    }
+    if args.sut == "simulated":
+        options["sut_options"]["site"] = args.sut_site
+    if args.browser_pool > 0:
+        options["pool_options"] = {"size": args.browser_pool, "max_reuse": args.browser_max_reuse}
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--script', help='JSON file with the session script, see fake_amp.py')
+    parser.add_argument('--count', type=int, help='Number of stimuli')
+    parser.add_argument('--rate', type=float, help='Stimuli per second, 0 is as fast as possible')
+    parser.add_argument('--reset-every', type=int, help='Reset the SUT every N stimuli, 0 never resets')
+    parser.add_argument('--timeout', type=float, default=3600, help='Seconds the session may take')
+    parser.add_argument('--log-level', type=int, default=1)
+    parser.add_argument('--broker-mode', choices=['thread', 'async'], default='thread')
+    parser.add_argument('--sut', choices=['selenium', 'simulated'], default='selenium',
+        help='"simulated" measures the adapter without Chrome')
+    parser.add_argument('--sut-site', help='Directory the simulated SUT serves its pages from')
+    parser.add_argument('--change-capture', choices=['xmldiff', 'mutation'], default='xmldiff')
+    parser.add_argument('--reset-strategy', choices=['relaunch', 'session'], default='relaunch')
+    parser.add_argument('--diff-engine', choices=['xmldiff', 'merkle'], default='xmldiff')
+    parser.add_argument('--diff-workers', type=int, default=0)
+    parser.add_argument('--browser-pool', type=int, default=0)
+    parser.add_argument('--browser-max-reuse', type=int, default=0)
+    args = parser.parse_args()
+
+    script = {}
+    if args.script:
+        with open(args.script) as script_file:
+            script = json.load(script_file)
+    if args.count is not None:
+        script["count"] = args.count
+    if args.rate is not None:
+        script["rate"] = args.rate
+    if args.reset_every is not None:
+        script["reset_every"] = args.reset_every
+
+    amp = FakeAmp(script)
+    amp.start()
+
+    adapter = multiprocessing.Process(target=run_adapter,
+        args=(amp.url, args.log_level, adapter_options(args)), daemon=True)
+    adapter.start()
+
+    usage = [] # (time, KiB, threads, CPU seconds)
+    deadline = time.perf_counter() + args.timeout
+    while not amp.wait(0.25):
+        usage.append((time.perf_counter(),) + process_usage(adapter.pid))
+        if not adapter.is_alive() or time.perf_counter() > deadline:
+            break
+
+    adapter.join(timeout=30)
+    if adapter.is_alive():
+        adapter.terminate()
+
+    if amp.started_at is None:
+        print("The session did not start: {}".format(amp.errors))
+        sys.exit(1)
+
+    stopped_at = amp.stopped_at or time.perf_counter()
+    duration = stopped_at - amp.started_at - amp.script["drain"]
+    session_usage = [sample for sample in usage if sample[0] >= amp.started_at and sample[1]] \
+        or [(0, 0, 0, 0.0)]
+    session_memory = [sample[1] for sample in session_usage]
+    session_threads = [sample[2] for sample in session_usage]
+    session_cpu = session_usage[-1][3] - session_usage[0][3]
+
+    print("stimuli sent/confirmed: {}/{}".format(amp.stimuli_sent, amp.stimuli_confirmed))
+    print("responses:              {}".format(amp.responses))
+    print("throughput:             {:.1f} stimuli/s".format(amp.stimuli_confirmed / max(duration, 1e-9)))
+    print("response latency [ms]:  p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+        percentile_ms(amp.response_latencies, 0.5), percentile_ms(amp.response_latencies, 0.95),
+        percentile_ms(amp.response_latencies, 0.99), percentile_ms(amp.response_latencies, 1.0)))
+    print("reset latency [ms]:     p50 {:.1f}  p95 {:.1f}  max {:.1f}  ({} resets)".format(
+        percentile_ms(amp.reset_latencies, 0.5), percentile_ms(amp.reset_latencies, 0.95),
+        percentile_ms(amp.reset_latencies, 1.0), len(amp.reset_latencies)))
+    print("adapter memory [MiB]:   start {:.1f}  peak {:.1f}  end {:.1f}  growth {:+.1f}".format(
+        session_memory[0] / 1024, max(session_memory) / 1024, session_memory[-1] / 1024,
+        (session_memory[-1] - session_memory[0]) / 1024))
+    print("adapter threads:        start {}  peak {}  end {}".format(
+        session_threads[0], max(session_threads), session_threads[-1]))
+    print("adapter CPU:            {:.2f} s  ({:.3f} ms/stimulus)".format(
+        session_cpu, session_cpu / max(amp.stimuli_confirmed, 1) * 1e3))
+
+    if amp.errors:
+        print("errors: {}".format(amp.errors))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
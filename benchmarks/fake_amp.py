@@ -0,0 +1,255 @@
+"""
+A local stand-in for AMP: a websocket server which speaks the
+message_pb2.Message protocol of the plugin adapter (announcement,
+configuration, ready, label, reset and error), and drives one adapter session
+from a script.
+
+The script sends `count` stimuli, cycling through `stimuli`, at `rate`
+stimuli per second (0 sends the next stimulus as soon as the previous one is
+confirmed) and resets the SUT every `reset_every` stimuli. For example:
+
+    {
+        "count": 1000,
+        "rate": 0,
+        "reset_every": 100,
+        "drain": 2.0,
+        "stimuli": [
+            {"label": "visit", "parameters": {"_url": "data:text/html,<title>bench</title>"}}
+        ]
+    }
+"""
+import asyncio
+import sys
+import time
+from threading import Event, Thread
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+sys.path.insert(0, './api')
+import configuration_pb2
+import label_pb2
+import message_pb2
+
+
+DEFAULT_SCRIPT = {
+    "count": 1000,
+    "rate": 0,
+    "reset_every": 100,
+    "drain": 2.0,
+    "stimuli": [
+        {"label": "visit", "parameters": {"_url": "data:text/html,<title>bench</title><p>fake AMP</p>"}},
+    ],
+}
+
+
+class FakeAmp:
+    """
+    param [dict] script
+    param [Integer] port; 0 picks a free port
+    """
+    def __init__(self, script=None, port=0):
+        self.script = dict(DEFAULT_SCRIPT, **(script or {}))
+        self.port = port
+        self.url = None
+
+        self.listening = Event()
+        self.finished = Event()
+        self.thread = None
+        self.done = None
+
+        # Results
+        self.announcement = None
+        self.errors = []
+        self.stimuli_sent = 0
+        self.stimuli_confirmed = 0
+        self.responses = 0
+        self.response_latencies = [] # seconds from a stimulus to its first response
+        self.reset_latencies = [] # seconds from a reset to ready
+        self.started_at = None
+        self.stopped_at = None
+
+        # Session state
+        self.ready = None
+        self.confirmed = None
+        self.last_stimulus_at = None
+        self.awaiting_response = False
+
+
+    """ Start the server in a background thread and wait until it listens. """
+    def start(self):
+        self.thread = Thread(target=lambda: asyncio.run(self.run()), name="fake-amp", daemon=True)
+        self.thread.start()
+        self.listening.wait()
+
+
+    """
+    Wait until the scripted session is finished.
+    param [Float] timeout
+    return [Boolean] True when the session finished
+    """
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+
+    """ Serve a single adapter session. """
+    async def run(self):
+        self.done = asyncio.get_running_loop().create_future()
+        async with serve(self.session, "127.0.0.1", self.port, max_size=None) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self.url = "ws://127.0.0.1:{}/adapters".format(self.port)
+            self.listening.set()
+            await self.done
+        self.finished.set()
+
+
+    """
+    Run the script against a connected adapter.
+    param [ServerConnection] ws
+    """
+    async def session(self, ws):
+        self.ready = asyncio.Event()
+        self.confirmed = asyncio.Event()
+        reader = asyncio.create_task(self.read_frames(ws))
+
+        try:
+            await self.configure(ws)
+            await self.run_script(ws)
+            await asyncio.sleep(self.script["drain"])
+        except Exception as e:
+            self.errors.append("Fake AMP: {}".format(e))
+        finally:
+            self.stopped_at = time.perf_counter()
+            reader.cancel()
+            await ws.close()
+            if not self.done.done():
+                self.done.set_result(True)
+
+
+    """
+    Wait for the announcement, send the configuration and wait for ready.
+    param [ServerConnection] ws
+    """
+    async def configure(self, ws):
+        while self.announcement is None:
+            if self.errors:
+                raise RuntimeError(self.errors[-1])
+            await asyncio.sleep(0.01)
+
+        configuration = configuration_pb2.Configuration(items=[])
+        await ws.send(message_pb2.Message(configuration=configuration).SerializeToString())
+        await self.ready.wait()
+
+
+    """
+    Send the scripted stimuli and resets.
+    param [ServerConnection] ws
+    """
+    async def run_script(self, ws):
+        stimuli = [self.stimulus(step) for step in self.script["stimuli"]]
+        interval = 1.0 / self.script["rate"] if self.script["rate"] else 0.0
+        reset_every = self.script["reset_every"]
+
+        self.started_at = time.perf_counter()
+        for i in range(self.script["count"]):
+            if self.errors:
+                return
+
+            if reset_every and i and i % reset_every == 0:
+                await self.reset(ws)
+
+            pb_label = label_pb2.Label()
+            pb_label.CopyFrom(stimuli[i % len(stimuli)])
+            pb_label.correlation_id = i + 1
+
+            self.confirmed.clear()
+            self.last_stimulus_at = time.perf_counter()
+            self.awaiting_response = True
+            await ws.send(message_pb2.Message(label=pb_label).SerializeToString())
+            self.stimuli_sent += 1
+            await self.confirmed.wait()
+
+            if interval:
+                next_at = self.started_at + (i + 1) * interval
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+
+    """
+    Reset the SUT and wait until the adapter is ready again.
+    param [ServerConnection] ws
+    """
+    async def reset(self, ws):
+        self.ready.clear()
+        reset_at = time.perf_counter()
+        await ws.send(message_pb2.Message(reset=message_pb2.Message.Reset()).SerializeToString())
+        await self.ready.wait()
+        self.reset_latencies.append(time.perf_counter() - reset_at)
+
+
+    """
+    Read the frames of the adapter and record the results.
+    param [ServerConnection] ws
+    """
+    async def read_frames(self, ws):
+        try:
+            async for frame in ws:
+                self.handle_frame(frame)
+        except ConnectionClosed:
+            pass
+
+        # The adapter closed the connection before the script finished
+        self.errors.append("Adapter closed the connection")
+        self.ready.set()
+        self.confirmed.set()
+
+
+    """
+    Record the results of a frame of the adapter.
+    param [bytes] frame
+    """
+    def handle_frame(self, frame):
+        pb_message = message_pb2.Message()
+        pb_message.ParseFromString(frame)
+
+        if pb_message.HasField("announcement"):
+            self.announcement = pb_message.announcement
+        elif pb_message.HasField("ready"):
+            self.ready.set()
+        elif pb_message.HasField("error"):
+            self.errors.append(pb_message.error.message)
+            self.ready.set()
+            self.confirmed.set()
+        elif pb_message.HasField("label"):
+            if pb_message.label.type == label_pb2.Label.LabelType.STIMULUS:
+                self.stimuli_confirmed += 1
+                self.confirmed.set()
+            else:
+                self.responses += 1
+                if self.awaiting_response:
+                    self.awaiting_response = False
+                    self.response_latencies.append(time.perf_counter() - self.last_stimulus_at)
+
+
+    """
+    Build a stimulus label from a script step; the type of a parameter
+    follows from the type of its value in the script.
+    param [dict] step
+    return [label_pb2.Label]
+    """
+    def stimulus(self, step):
+        pb_label = label_pb2.Label(type=label_pb2.Label.LabelType.STIMULUS,
+            label=step["label"], channel="extern")
+
+        for name, value in step.get("parameters", {}).items():
+            param = pb_label.parameters.add()
+            param.name = name
+            if isinstance(value, bool):
+                param.value.boolean = value
+            elif isinstance(value, int):
+                param.value.integer = value
+            elif isinstance(value, float):
+                param.value.decimal = value
+            else:
+                param.value.string = str(value)
+
+        return pb_label
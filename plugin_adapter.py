@@ -1,28 +1,142 @@
+import time
+STARTED_NS = time.monotonic_ns() # start of the startup profile
+
 import socket
 import sys
+import signal
 import argparse
 
 from plugin_adapter_components.logger import Logger
 from plugin_adapter_components.adapter_core import AdapterCore
 from plugin_adapter_components.broker_connection import BrokerConnection
 from plugin_adapter_components.handler import Handler
+from plugin_adapter_components.latency_tracker import LatencyTracker
+from plugin_adapter_components.session_recorder import SessionRecorder
+from plugin_adapter_components.startup_profile import StartupProfile
+from plugin_adapter_components.client_side.update_coalescer import UpdateCoalescer
+
+IMPORTED_NS = time.monotonic_ns()
 
 """
 Start the plugin adapter to connect with AMP.
 """
-def start_plugin_adapter(name, url, token, log_level, extra_logs):
+def start_plugin_adapter(name, url, token, log_level, extra_logs,
+        broker_mode="thread", sut_options=None, pool_options=None,
+        reset_strategy="relaunch", log_file=None, log_async=False,
+        log_caller=True, latency_report=None, latency_port=None,
+        record_session=None, sut_backend="selenium", startup_report=False,
+        startup_budget=None, diff_workers=0, response_priorities=None):
     logger = Logger()
     logger.log_level(log_level & logger.LOG_ALL)
+    logger.capture_caller = log_caller
+    if log_file != None or log_async:
+        logger.log_to(log_file)
 
-    broker_connection = BrokerConnection(url, token, extra_logs, logger)
-    handler = Handler(logger)
+    latency = None
+    if latency_report != None or latency_port != None:
+        latency = LatencyTracker()
+        if latency_port != None:
+            latency.serve(latency_port)
+        if latency_report != None and hasattr(signal, "SIGUSR1"):
+            # Dump the latencies on demand with: kill -USR1 <pid>
+            latency.report_to(latency_report)
+            signal.signal(signal.SIGUSR1, lambda signum, frame: latency.request_dump())
 
-    adapter_core = AdapterCore(name, broker_connection, handler, logger)
+    recorder = None
+    if record_session != None:
+        recorder = SessionRecorder(record_session, name)
+
+    startup = None
+    if startup_report or startup_budget != None:
+        startup = StartupProfile(STARTED_NS, logger, startup_report, startup_budget)
+        startup.mark("imported", IMPORTED_NS)
+
+    if broker_mode == "async":
+        # websockets is only imported when the asyncio broker is used
+        from plugin_adapter_components.async_broker_connection import AsyncBrokerConnection
+        broker_connection = AsyncBrokerConnection(url, token, extra_logs, logger,
+            latency, recorder)
+    else:
+        broker_connection = BrokerConnection(url, token, extra_logs, logger,
+            latency, recorder)
+    handler = Handler(logger, sut_options, pool_options, reset_strategy, latency,
+        sut_backend, startup, diff_workers, response_priorities)
+
+    adapter_core = AdapterCore(name, broker_connection, handler, logger, latency,
+        startup)
 
     broker_connection.register_adapter_core(adapter_core)
     handler.register_adapter_core(adapter_core)
 
-    adapter_core.start()
+    # Load the SUT backend while connecting to AMP
+    handler.preload()
+
+    try:
+        adapter_core.start()
+    finally:
+        if recorder != None:
+            recorder.close()
+        if latency != None:
+            if latency_report != None:
+                latency.dump(latency_report)
+            latency.close()
+
+
+"""
+Parse a number per label of the command line, e.g. the readiness timeouts.
+param [String] value; e.g. "visit=10,click=2"
+return [{String: Float}]
+"""
+def parse_label_numbers(value):
+    numbers = {}
+    for item in value.split(","):
+        label, _, number = item.partition("=")
+        try:
+            numbers[label.strip()] = float(number)
+        except ValueError:
+            raise argparse.ArgumentTypeError("expected label=number, got \"{}\"".format(item))
+    return numbers
+
+
+"""
+Parse the page_update budget of the command line.
+param [String] value
+return [Integer]
+"""
+def parse_update_budget(value):
+    budget = int(value)
+    if 0 < budget < UpdateCoalescer.MIN_BUDGET:
+        raise argparse.ArgumentTypeError("expected 0 or at least {} bytes, got {}".format(
+            UpdateCoalescer.MIN_BUDGET, budget))
+    return budget
+
+
+"""
+Parse a text pattern of the diff scope of the command line.
+param [String] value
+return [String]
+"""
+def parse_text_pattern(value):
+    # The diff scope is only imported when text is ignored
+    from plugin_adapter_components.client_side.diff_scope import shared_pattern
+    try:
+        shared_pattern(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+"""
+Parse a window size of the command line.
+param [String] value; e.g. "1280x800"
+return [(Integer, Integer)]
+"""
+def parse_window_size(value):
+    width, _, height = value.lower().partition("x")
+    try:
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT, got \"{}\"".format(value))
 
 
 if __name__ == '__main__':
@@ -40,6 +154,76 @@ if __name__ == '__main__':
         help='AMP Adapter logger level: 1 = error, 2 = warning, 4 = info, 8 = debug or 15 = all', required=False)
     parser.add_argument('-el','--extra_logs',
         help='Show extra logs related to the socket: True', required=False)
+    parser.add_argument('-lf','--log_file',
+        help='Write the log to this rotating file from a background thread', required=False)
+    parser.add_argument('-la','--log_async', action='store_true',
+        help='Write the log to the stdout from a background thread')
+    parser.add_argument('-lnc','--log_no_caller', action='store_true',
+        help='Do not add the calling function to the log entries')
+    parser.add_argument('-lr','--latency_report',
+        help='Track label latencies and write them to this file on shutdown and on SIGUSR1 (.prom/.txt: Prometheus, otherwise JSON)', required=False)
+    parser.add_argument('-lp','--latency_port', type=int,
+        help='Track label latencies and serve them on localhost:<port>/metrics and /latency.json', required=False)
+    parser.add_argument('-rec','--record_session',
+        help='Record all broker messages to this session log, to be replayed with replay_session.py', required=False)
+    parser.add_argument('-sr','--startup_report', action='store_true',
+        help='Write the startup times and the preloaded imports to the stderr once the SUT is ready')
+    parser.add_argument('-sb','--startup_budget', type=float,
+        help='Warn when the announcement is sent later than this many milliseconds after the start', required=False)
+    parser.add_argument('-bm','--broker_mode', choices=['thread', 'async'], default='thread',
+        help='Broker connection: "thread" (websocket-client) or "async" (asyncio with a writer task)', required=False)
+    parser.add_argument('-s','--sut', choices=['selenium', 'simulated'], default='selenium',
+        help='SUT backend: "selenium" (Chrome) or "simulated" (browserless lxml pages, for load tests)', required=False)
+    parser.add_argument('-ss','--sut_site',
+        help='Directory the simulated SUT serves its pages from', required=False)
+    parser.add_argument('-cc','--change_capture', choices=['xmldiff', 'mutation'], default='xmldiff',
+        help='Page update detection: "xmldiff" (full page diff) or "mutation" (in-page MutationObserver)', required=False)
+    parser.add_argument('-de','--diff_engine', choices=['xmldiff', 'merkle'], default='xmldiff',
+        help='Page diff: "xmldiff" (minimal edit script) or "merkle" (skips equal subtrees by hash, for large pages)', required=False)
+    parser.add_argument('-sw','--selector_wait', type=float, default=0.5,
+        help='Seconds to wait for an element which is not in the page snapshot, instead of the 10 s implicit wait', required=False)
+    parser.add_argument('-pr','--page_readiness', choices=['event', 'none'], default='event',
+        help='Response sampling: "event" waits until the page has settled (readyState, pending requests, DOM quiet), "none" samples right away', required=False)
+    parser.add_argument('-rt','--ready_timeouts', type=parse_label_numbers, default=None,
+        help='Seconds the page may take to settle per label, e.g. "visit=10,click=2"', required=False)
+    parser.add_argument('-rq','--ready_quiet', type=float, default=0.1,
+        help='Seconds without DOM changes after which the page has settled', required=False)
+    parser.add_argument('-rp','--response_priorities', type=parse_label_numbers, default=None,
+        help='Priority of the responses per label, lower is sent first, e.g. "page_title=0,page_update=1"', required=False)
+    parser.add_argument('-uw','--update_window', type=float, default=0.0,
+        help='Seconds the page updates are merged into one page_update, 0 sends every update by itself', required=False)
+    parser.add_argument('-ub','--update_budget', type=parse_update_budget, default=0,
+        help='Bytes of a page_update, larger updates are truncated; 0 is unlimited, at least 128 otherwise', required=False)
+    parser.add_argument('-sn','--snapshot', choices=['html', 'cdp'], default='html',
+        help='Page snapshots: "html" (serialized page source) or "cdp" (DOM node table through the Chrome DevTools Protocol)', required=False)
+    parser.add_argument('-bf','--browser_profile', choices=['stock', 'lean'], default='stock',
+        help='Chrome profile: "stock" or "lean" (no images, media, web fonts, extensions, background networking or GPU compositing)', required=False)
+    parser.add_argument('-bh','--block_host', action='append', default=None,
+        help='Third-party host the lean profile blocks, with its subdomains, e.g. "www.google-analytics.com"; may be repeated', required=False)
+    parser.add_argument('-ws','--window_size', type=parse_window_size, default=(1280, 800),
+        help='Window size of the lean profile, e.g. "1280x800"', required=False)
+    parser.add_argument('-bc','--browser_cache',
+        help='Directory of the HTTP and code cache the browsers share across restarts; cookies and storage are still wiped per test case', required=False)
+    parser.add_argument('-bcs','--browser_cache_size', type=int, default=1024,
+        help='Megabytes the shared browser cache may take', required=False)
+    parser.add_argument('-bca','--browser_cache_age', type=float, default=7,
+        help='Days after which an unused part of the shared browser cache is removed', required=False)
+    parser.add_argument('-dr','--diff_root', action='append', default=None,
+        help='CSS selector of a part of the page which is compared, e.g. "#app"; may be repeated', required=False)
+    parser.add_argument('-di','--diff_ignore', action='append', default=None,
+        help='CSS selector of elements which are not compared, e.g. ".ad"; may be repeated', required=False)
+    parser.add_argument('-dia','--diff_ignore_attribute', action='append', default=None,
+        help='Name of an attribute which is not compared, e.g. "data-csrf"; may be repeated', required=False)
+    parser.add_argument('-dit','--diff_ignore_text', action='append', default=None,
+        type=parse_text_pattern, help='Regular expression of text which is not compared, e.g. "\\d+:\\d+"; may be repeated', required=False)
+    parser.add_argument('-dw','--diff_workers', type=int, default=0,
+        help='Worker processes the page updates are computed in, 0 computes them in the event thread', required=False)
+    parser.add_argument('-bp','--browser_pool', type=int, default=0,
+        help='Number of pre-launched standby browsers, 0 launches a browser on every reset', required=False)
+    parser.add_argument('-br','--browser_max_reuse', type=int, default=0,
+        help='Times a pooled browser is reused before it is quit, 0 quits it after every test case', required=False)
+    parser.add_argument('-rs','--reset_strategy', choices=['relaunch', 'session'], default='relaunch',
+        help='Reset: "relaunch" restarts the browser, "session" wipes the browser session', required=False)
 
     args = parser.parse_args()
 
@@ -55,4 +239,54 @@ if __name__ == '__main__':
     if args.extra_logs == None or args.extra_logs != "True":
         extra_logs = False
 
-    start_plugin_adapter(name, args.url, args.token, log_level, extra_logs)
+    sut_options = {
+        "change_capture": args.change_capture,
+        "diff_engine": args.diff_engine,
+        "selector_wait": args.selector_wait,
+        "page_readiness": args.page_readiness,
+        "ready_timeouts": args.ready_timeouts,
+        "ready_quiet": args.ready_quiet,
+        "update_window": args.update_window,
+        "update_budget": args.update_budget,
+        "snapshot_source": args.snapshot,
+    }
+    if args.diff_root or args.diff_ignore or args.diff_ignore_attribute or args.diff_ignore_text:
+        sut_options["diff_scope"] = {
+            "roots": args.diff_root,
+            "ignore": args.diff_ignore,
+            "attributes": args.diff_ignore_attribute,
+            "text": args.diff_ignore_text,
+        }
+    if args.browser_profile == "lean":
+        sut_options["browser_profile"] = {
+            "block_hosts": args.block_host,
+            "window_size": args.window_size,
+        }
+    if args.browser_cache != None:
+        sut_options["browser_cache"] = {
+            "directory": args.browser_cache,
+            "size_mb": args.browser_cache_size,
+            # The pool's standby browsers, the browser in use and the one
+            # which is being quit after a reset
+            "slots": args.browser_pool + 2,
+            "max_age": args.browser_cache_age * 24 * 3600,
+        }
+    if args.sut == "simulated":
+        sut_options["site"] = args.sut_site
+
+    pool_options = None
+    if args.browser_pool > 0:
+        pool_options = {
+            "size": args.browser_pool,
+            "max_reuse": args.browser_max_reuse,
+        }
+
+    start_plugin_adapter(name, args.url, args.token, log_level, extra_logs,
+        broker_mode=args.broker_mode, sut_options=sut_options,
+        pool_options=pool_options, reset_strategy=args.reset_strategy,
+        log_file=args.log_file, log_async=args.log_async,
+        log_caller=not args.log_no_caller, latency_report=args.latency_report,
+        latency_port=args.latency_port, record_session=args.record_session,
+        sut_backend=args.sut, startup_report=args.startup_report,
+        startup_budget=args.startup_budget, diff_workers=args.diff_workers,
+        response_priorities=args.response_priorities)
@@ -20,11 +20,14 @@ One can see the {AdapterCore} as the generic part of the adapter and the
 {Handler} as the implementation specific part of the adapter.
 """
 class AdapterCore():
-    def __init__(self, name, broker_connection, handler, logger):
+    def __init__(self, name, broker_connection, handler, logger, latency=None,
+            startup=None):
         self.name = name
         self.broker_connection = broker_connection
         self.handler = handler
         self.logger = logger
+        self.latency = latency # LatencyTracker; None when latencies are not tracked
+        self.startup = startup # StartupProfile; None when the startup is not profiled
         self.state_machine = StateMachine()
 
 
@@ -41,11 +44,18 @@ class AdapterCore():
     def broker_connection_opened(self):
         if self.state_machine.is_disconnected():
             self.state_machine.set_connected()
+            if self.startup != None:
+                self.startup.mark("connected")
 
             self.broker_connection.send_announcement(self.name,
                 self.handler.supported_labels(), self.handler.configuration)
 
             self.state_machine.set_announced()
+            if self.startup != None:
+                self.startup.mark("announced")
+
+            # Start the SUT while waiting for the configuration
+            self.handler.warm_up()
         else:
             self.logger.info("AdapterCore", "Connection opened while already connected")
 
@@ -60,26 +70,31 @@ class AdapterCore():
         if self.state_machine.is_announced():
             self.logger.info("AdapterCore", "Configuration received")
             self.state_machine.set_configured()
+            if self.startup != None:
+                self.startup.mark("configured")
 
-            # Start the SUT
+            # Start the SUT, or await its warm-up
             self.logger.info("AdapterCore", "Connecting to the SUT")
             try:
                 self.handler.start()
             except Exception as e:
-                self.logger.error("AdapterCore", "Error connection to the SUT: {}".format(e))
+                self.logger.error("AdapterCore", "Error connection to the SUT: {}", e)
                 self.send_error(str(e))
                 return
 
             self.logger.debug("AdapterCore", "Sending ready")
             self.broker_connection.send_ready()
             self.state_machine.set_ready()
+            if self.startup != None:
+                self.startup.mark("ready")
+                self.startup.finish()
         elif self.state_machine.is_connected():
             message = "Configuration received while not yet announced"
-            self.logger.error("AdapterCore", "{}".format(message))
+            self.logger.error("AdapterCore", message)
             self.send_error(message)
         else:
             message = "Configuration received while already configured"
-            self.logger.error("AdapterCore", "{}".format(message))
+            self.logger.error("AdapterCore", message)
             self.send_error(message)
 
 
@@ -93,26 +108,28 @@ class AdapterCore():
             # Check if type label_pb2.Label.LabelType.STIMULUS
             if label.type != 0:
                 message = "Label is not a stimulus"
-                self.logger.error("AdapterCore", "{}".format(message))
+                self.logger.error("AdapterCore", message)
                 self.send_error(message)
 
              # Confirm the label
-            self.logger.debug("AdapterCore", "Confirming stimulus label: {}".format(label.label))
+            self.logger.debug("AdapterCore", "Confirming stimulus label: {}", label.label)
             self.broker_connection.send_stimulus(label, '', time.time_ns(), correlation_id)
+            if self.latency != None:
+                self.latency.stamp(correlation_id, "confirmed")
 
             try:
                 # Perform the stimulus action which could trigger a
                 # response.
-                self.logger.debug("AdapterCore", "Stimulating label: {}".format(label.label))
+                self.logger.debug("AdapterCore", "Stimulating label: {}", label.label)
                 physical_label = self.handler.stimulate(label)
             except Exception as e:
                 e = str(e)
-                self.logger.error("AdapterCore", "exception: {}".format(e))
+                self.logger.error("AdapterCore", "exception: {}", e)
                 self.send_error("error while stimulating the SUT: " + e)
 
         else:
             message = "Label received while not ready"
-            self.logger.error("AdapterCore", "{}".format(message))
+            self.logger.error("AdapterCore", message)
             self.send_error(message)
 
 
@@ -134,7 +151,7 @@ class AdapterCore():
                 #     return
             except Exception as e:
                 message = "Error while resetting connection to the SUT: " + str(e)
-                self.logger.error("AdapterCore", "{}".format(message))
+                self.logger.error("AdapterCore", message)
                 self.send_error(message)
                 return
 
@@ -143,7 +160,7 @@ class AdapterCore():
             self.state_machine.set_ready()
         else:
             message = 'Reset received while not ready'
-            self.logger.error("AdapterCore", "{}".format(message))
+            self.logger.error("AdapterCore", message)
             self.send_error(message)
 
 
@@ -153,8 +170,9 @@ class AdapterCore():
     """
     def error_received(self, message):
         self.state_machine.set_error()
+        self.handler.cancel_warm_up()
         message = "Error message received" + message
-        self.logger.error("AdapterCore", "{}".format(message))
+        self.logger.error("AdapterCore", message)
         # NOTE: we do not send an error message back.
         self.broker_connection.close(reason=message)
 
@@ -166,6 +184,7 @@ class AdapterCore():
     def send_error(self, message):
         if self.handler != None:
             self.handler.stop_threads = True
+            self.handler.cancel_warm_up()
 
         self.broker_connection.send_error(message)
         self.broker_connection.close(reason=message)
@@ -176,13 +195,41 @@ class AdapterCore():
     param [label_pb2.Label] pb_label
     param [String] physical_label
     param [Integer] timestamp
+    param [Integer] correlation_id; of the stimulus which caused the response
     """
-    def send_response(self, pb_label, physical_label, timestamp):
+    def send_response(self, pb_label, physical_label, timestamp, correlation_id=None):
         # Check if type is label_pb2.Label.LabelType.RESPONSE
         if pb_label.type == 1:
             self.broker_connection.send_response(pb_label, physical_label,
-                timestamp)
+                timestamp, correlation_id)
         else:
             message = "Response label is not of type"
-            self.logger.error("AdapterCore", "{}".format(message))
+            self.logger.error("AdapterCore", message)
             self.send_error("Response label is not of type")
+
+
+    """
+    Serialize a response from the SUT, so it can be sent later with
+    #send_frame.
+    param [label_pb2.Label] pb_label
+    param [Integer] timestamp
+    return [bytes] None when the label is not a response
+    """
+    def response_frame(self, pb_label, timestamp):
+        # Check if type is label_pb2.Label.LabelType.RESPONSE
+        if pb_label.type == 1:
+            return self.broker_connection.response_frame(pb_label, timestamp)
+
+        message = "Response label is not of type"
+        self.logger.error("AdapterCore", message)
+        self.send_error("Response label is not of type")
+        return None
+
+
+    """
+    Send a serialized response back to AMP.
+    param [bytes] frame
+    param [Integer] correlation_id; of the stimulus which caused the response
+    """
+    def send_frame(self, frame, correlation_id=None):
+        self.broker_connection.send_frame(frame, correlation_id)
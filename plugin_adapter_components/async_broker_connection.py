@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from websockets.asyncio.client import connect
+
+from .broker_connection import BrokerConnection
+from .session_recorder import OUTBOUND
+
+"""
+The {AsyncBrokerConnection} is an asyncio based variant of the
+{BrokerConnection}.
+
+Inbound frames are read and decoded on the event loop. The call backs on the
+{AdapterCore} (which may reset the SUT or relaunch a browser) are handed to a
+single worker thread, so they are executed in the order the frames arrived
+without ever stalling the reader. Outbound protobuf frames are serialized by
+the calling thread and put on an ordered queue which is drained by one writer
+task, so frames sent from the SUT threads can not interleave.
+
+When the connection ends, the error call back runs while the websocket is
+still open and the frames queued by then, like the error frame, are written
+before the event loop stops; the connection can not be used once the loop
+has stopped.
+"""
+class AsyncBrokerConnection(BrokerConnection):
+    # Seconds the queued frames may take to be written when the connection ends
+    DRAIN_TIMEOUT = 5.0
+
+    """
+    param [String] url The websocket URL of the AMP instance that
+    should be connected to.
+    param [String] token; Token to authorize with.
+    param [Boolean] extra_logs
+    param [LatencyTracker] latency; None when latencies are not tracked
+    param [SessionRecorder] recorder; None when the session is not recorded
+    """
+    def __init__(self, url, token, extra_logs, logger, latency=None, recorder=None):
+        super().__init__(url, token, extra_logs, logger, latency, recorder)
+        self.loop = None # event loop; initialized on #connect
+        self.outbound = None # queue of (frame, correlation_id); initialized on #connect
+        self.writer = None # writer task; initialized on #connect
+        self.callbacks = None # worker for adapter core call backs
+
+
+    """ Connect to AMP, blocks until the connection is closed. """
+    def connect(self):
+        self.logger.info("BrokerConnection", "Connecting to AMP (asyncio)")
+
+        if self.extra_logs:
+            logging.basicConfig(level=logging.DEBUG)
+            logging.getLogger("websockets").setLevel(logging.DEBUG)
+
+        self.callbacks = ThreadPoolExecutor(max_workers=1,
+            thread_name_prefix="broker-callbacks")
+        try:
+            asyncio.run(self.run())
+        finally:
+            self.callbacks.shutdown(wait=True)
+
+
+    """ Open the websocket and run the reader and writer until it closes. """
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.outbound = asyncio.Queue()
+
+        ssl_context = None
+        if self.url.startswith("wss://"):
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+
+        try:
+            async with connect(self.url, ssl=ssl_context, max_size=None,
+                    additional_headers={"Authorization": "Bearer " + self.token}) as ws:
+                self.websocket = ws
+                self.writer = asyncio.create_task(self.write_frames(ws))
+                self.dispatch(self.on_open, ws)
+
+                try:
+                    async for frame in ws:
+                        self.on_message(ws, frame)
+
+                    close_code, close_reason = ws.close_code, ws.close_reason
+                except Exception as e:
+                    # Queue the error frame while the websocket is open
+                    await asyncio.wrap_future(self.dispatch(self.on_error, ws, e))
+                    close_code, close_reason = None, str(e)
+
+                await self.drain()
+        except Exception as e:
+            await asyncio.wrap_future(self.dispatch(self.on_error, self.websocket, e))
+            close_code, close_reason = None, str(e)
+        finally:
+            if self.writer != None and not self.writer.done():
+                self.writer.cancel()
+
+        self.dispatch(self.on_close, self.websocket, close_code, close_reason)
+
+
+    """
+    Write the frames which are queued, then stop the writer. Frames which
+    can not be written within DRAIN_TIMEOUT are dropped.
+    """
+    async def drain(self):
+        self.outbound.put_nowait(None)
+        try:
+            await asyncio.wait_for(self.writer, self.DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.logger.warning("BrokerConnection", "Dropped the frames which were not written within {} s",
+                self.DRAIN_TIMEOUT)
+
+
+    """
+    Drain the outbound queue in order, one frame at a time.
+    param [ClientConnection] ws
+    """
+    async def write_frames(self, ws):
+        while True:
+            item = await self.outbound.get()
+            if item is None:
+                break
+
+            frame, correlation_id = item
+            try:
+                await ws.send(frame)
+                self.logger.debug("BrokerConnection", "Success send")
+                if self.recorder != None:
+                    self.recorder.record(OUTBOUND, frame, correlation_id)
+                if correlation_id != None and self.latency != None:
+                    self.latency.stamp(correlation_id, "response_written")
+            except Exception as e:
+                self.logger.error("BrokerConnection", "Failed sending message, exception: {}", e)
+
+
+    """
+    Run an adapter core call back on the call back worker.
+    param [function] callback
+    return [concurrent.futures.Future] done when the call back has run
+    """
+    def dispatch(self, callback, *args):
+        return self.callbacks.submit(self.run_callback, callback, *args)
+
+
+    """
+    Run a call back and log the exceptions it raises.
+    param [function] callback
+    """
+    def run_callback(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            self.logger.error("BrokerConnection", "Call back {} failed: {}", callback.__name__, e)
+
+
+    """
+    Handler for when a message is received from AMP. The message is decoded
+    on the event loop and handled on the call back worker.
+    param [ClientConnection] ws
+    param [bytes] message
+    """
+    def on_message(self, ws, message):
+        received_ns = time.monotonic_ns()
+        self.logger.debug("BrokerConnection", "Received a message")
+        self.dispatch(self.handle_message, self.parse_message(message), received_ns)
+
+
+    """
+    Handler for when the connection is closed with AMP.
+    param [ClientConnection] ws
+    param [Integer] close_status_code
+    param [String] close_msg
+    """
+    def on_close(self, ws, close_status_code, close_msg):
+        self.logger.info("BrokerConnection", "Stopped connection with code: {}", close_status_code)
+        self.logger.info("BrokerConnection", "The stop reason is: {}", close_msg)
+
+        # Stop the SUT response handler thread
+        if self.adapter_core != None and self.adapter_core.handler != None:
+            self.adapter_core.handler.stop_threads = True
+            self.adapter_core.handler.stop()
+
+
+    """
+    Handler for when an error occurs with the connection to AMP
+    param [ClientConnection] ws
+    param [String] err
+    """
+    def on_error(self, ws, err):
+        self.logger.error("BrokerConnection", "Got a connection error: {}", str(err))
+        self.adapter_core.send_error(str(err))
+
+
+    """
+    Close the websocket with the given response close code and close
+    reason. Frames which are already queued are written first. Does
+    nothing once the event loop has stopped.
+    param [String] reason
+    param [Integer] code
+    """
+    def close(self, reason="", code=-1):
+        if self.stopped():
+            return
+
+        if self.websocket != None and self.loop != None:
+            self.logger.info("BrokerConnection", "Closing the connection due to: {}", reason)
+            self.logger.info("BrokerConnection", "With error code: {}", code)
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+
+            # Stop the SUT response handler thread
+            if self.adapter_core != None and self.adapter_core.handler != None:
+                self.adapter_core.handler.stop_threads = True
+        else:
+            self.logger.warning("BrokerConnection", "No websocket initialized to close")
+
+
+    """ Flush the outbound queue and close the websocket. """
+    async def shutdown(self):
+        self.outbound.put_nowait(None)
+        if self.writer != None:
+            await self.writer
+        await self.websocket.close()
+
+
+    """
+    Whether the event loop of the connection has stopped.
+    return [Boolean]
+    """
+    def stopped(self):
+        return self.loop != None and (self.loop.is_closed() or not self.loop.is_running())
+
+
+    """
+    Sends a serialized message to AMP. May be called from any thread; the
+    frame is written by the writer task.
+    param [bytes] frame
+    param [Integer] correlation_id; of the stimulus a response belongs to
+    """
+    def send_frame(self, frame, correlation_id=None):
+        if self.websocket is None or self.loop is None or self.stopped():
+            self.logger.warning("BrokerConnection", "No connection to websocket (yet). Is the adapter connected to AMP?")
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self.outbound.put_nowait,
+                    (frame, correlation_id))
+            except Exception as e:
+                self.logger.error("BrokerConnection", "Failed sending message, exception: {}", e)
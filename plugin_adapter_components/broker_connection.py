@@ -1,11 +1,18 @@
 import websocket
 import sys
 import ssl
+import time
 
 sys.path.insert(0, './api')
 import announcement_pb2
 import configuration_pb2
 import message_pb2
+from google.protobuf.internal.encoder import _VarintBytes
+
+from .session_recorder import INBOUND, OUTBOUND
+
+# Tag of the label field of a Message: field number 4, length delimited
+LABEL_TAG = bytes([message_pb2.Message.DESCRIPTOR.fields_by_name["label"].number << 3 | 2])
 
 """
 The {BrokerConnection} holds the connection with the broker. It is responsible
@@ -13,20 +20,25 @@ for handling the websocket as well as encoding/decoding the Protobuf messages.
 
 The {BrokerConnection} calls back on the {AdapterCore}.
 """
+
 class BrokerConnection:
     """
     param [String] url The websocket URL of the AMP instance that
     should be connected to.
     param [String] token; Token to authorize with.
     param [Boolean] extra_logs
+    param [LatencyTracker] latency; None when latencies are not tracked
+    param [SessionRecorder] recorder; None when the session is not recorded
     """
-    def __init__(self, url, token, extra_logs, logger):
+    def __init__(self, url, token, extra_logs, logger, latency=None, recorder=None):
         self.url = url
         self.token = token
         self.adapter_core = None # callback to adapter; register separately
         self.websocket = None # reference to websocket; initialized on #connect
         self.extra_logs = extra_logs
         self.logger = logger
+        self.latency = latency
+        self.recorder = recorder
 
 
     """
@@ -52,13 +64,13 @@ class BrokerConnection:
     param [String] close_msg
     """
     def on_close(self, ws, close_status_code, close_msg):
-        self.logger.info("BrokerConnection", "Stopped connection with code: {}".format(close_status_code))
-        self.logger.info("BrokerConnection", "The stop reason is: {}".format(close_msg))
+        self.logger.info("BrokerConnection", "Stopped connection with code: {}", close_status_code)
+        self.logger.info("BrokerConnection", "The stop reason is: {}", close_msg)
         self.websocket.close()
 
         # Stop the SUT response handler thread
         if self.adapter_core != None and self.adapter_core.handler != None:
-            self.adapter_core.handler.stop_sut_thread = True
+            self.adapter_core.handler.stop_threads = True
             self.adapter_core.handler.stop()
 
 
@@ -68,8 +80,9 @@ class BrokerConnection:
     param [bytes] message
     """
     def on_message(self, ws, message):
+        received_ns = time.monotonic_ns()
         self.logger.debug("BrokerConnection", "Received a message")
-        self.parse_and_handle_message(message)
+        self.parse_and_handle_message(message, received_ns)
 
 
     """
@@ -79,7 +92,7 @@ class BrokerConnection:
     """
     def on_error(self, ws, err):
         print(err)
-        self.logger.error("BrokerConnection", "Got a connection error: {}".format(str(err)))
+        self.logger.error("BrokerConnection", "Got a connection error: {}", str(err))
         self.adapter_core.send_error(str(err))
 
         self.logger.debug("BrokerConnection", "Closing the connection...")
@@ -137,16 +150,29 @@ class BrokerConnection:
     param [label_pb2.Label] pb_label
     param [String] physical_label
     param [Integer] timestamp
+    param [Integer] correlation_id; of the stimulus which caused the response
     """
-    def send_response(self, pb_label, physical_label, timestamp):
+    def send_response(self, pb_label, physical_label, timestamp, correlation_id=None):
         self.logger.debug("BrokerConnection", "Sending response")
 
         if physical_label != None:
             pb_label = physical_label
 
-        pb_label.timestamp = timestamp
+        self.send_frame(self.response_frame(pb_label, timestamp), correlation_id)
 
-        self.send_message(message_pb2.Message(label=pb_label))
+
+    """
+    Serialize a response to a Message frame, without copying the label into
+    a Message first: the frame is the label field of a Message, i.e. its tag,
+    the length of the label and the serialized label.
+    param [label_pb2.Label] pb_label
+    param [Integer] timestamp
+    return [bytes]
+    """
+    def response_frame(self, pb_label, timestamp):
+        pb_label.timestamp = timestamp
+        label = pb_label.SerializeToString()
+        return LABEL_TAG + _VarintBytes(len(label)) + label
 
 
     """
@@ -185,13 +211,13 @@ class BrokerConnection:
     """
     def close(self, reason="", code=-1):
         if self.websocket != None:
-            self.logger.info("BrokerConnection", "Closing the connection due to: {}".format(reason))
-            self.logger.info("BrokerConnection", "With error code: {}".format(code))
+            self.logger.info("BrokerConnection", "Closing the connection due to: {}", reason)
+            self.logger.info("BrokerConnection", "With error code: {}", code)
             self.websocket.close()
 
             # Stop the SUT response handler thread
             if self.adapter_core != None and self.adapter_core.handler != None:
-                self.adapter_core.handler.stop_sut_thread = True
+                self.adapter_core.handler.stop_threads = True
         else:
             self.logger.warning("BrokerConnection", "No websocket initialized to close")
 
@@ -200,23 +226,48 @@ class BrokerConnection:
     Parses and handles a byte array from the web-socket into
     the correct protobuff object.
     param [bytes] message
+    param [Integer] received_ns; time.monotonic_ns() when the frame arrived
+    """
+    def parse_and_handle_message(self, message, received_ns=None):
+        self.handle_message(self.parse_message(message), received_ns)
+
+
+    """
+    Parses a byte array from the web-socket into a protobuff object.
+    param [bytes] message
+    return [message_pb2.Message]
     """
-    def parse_and_handle_message(self, message):
+    def parse_message(self, message):
+        if self.recorder != None:
+            self.recorder.record(INBOUND, message)
+
         pb_message = message_pb2.Message()
 
         try:
             pb_message.ParseFromString(message)
         except Exception as e:
-            self.logger.error("BrokerConnection", "Could not decode message due to: {}".format(e))
+            self.logger.error("BrokerConnection", "Could not decode message due to: {}", e)
+
+        return pb_message
 
+
+    """
+    Handles a decoded protobuff message by calling back on the adapter core.
+    param [message_pb2.Message] pb_message
+    param [Integer] received_ns; time.monotonic_ns() when the frame arrived
+    """
+    def handle_message(self, pb_message, received_ns=None):
         if pb_message.HasField("configuration"):
             self.logger.debug("BrokerConnection", "Received a configuration")
             self.adapter_core.configuration_received(pb_message.configuration)
         elif pb_message.HasField("error"):
             self.logger.debug("BrokerConnection", "Received an error")
-            self.adapter_core.error_received(message.error.message)
+            self.adapter_core.error_received(pb_message.error.message)
         elif pb_message.HasField("label"):
             self.logger.debug("BrokerConnection", "Received a label")
+            if self.latency != None:
+                self.latency.begin(pb_message.label.correlation_id,
+                    pb_message.label.label, received_ns)
             self.adapter_core.label_received(pb_message.label,
                 pb_message.label.correlation_id)
         elif pb_message.HasField("reset"):
@@ -225,21 +276,39 @@ class BrokerConnection:
         elif pb_message.HasField("ready"):
             self.logger.debug("BrokerConnection", "Received ready, this should not be send")
         else:
-            self.logger.debug("BrokerConnection", "Unknown message type: {}".format(pb_message))
+            self.logger.debug("BrokerConnection", "Unknown message type: {}", pb_message)
 
 
     """
     Sends the given `protobuff message` to AMP
     param [message_pb2.Message] pb_message
+    param [Integer] correlation_id; of the stimulus a response belongs to
+    """
+    def send_message(self, pb_message, correlation_id=None):
+        try:
+            frame = pb_message.SerializeToString()
+        except Exception as e:
+            self.logger.error("BrokerConnection", "Failed sending message, exception: {}", e)
+            return
+        self.send_frame(frame, correlation_id)
+
+
+    """
+    Sends a serialized message to AMP.
+    param [bytes] frame
+    param [Integer] correlation_id; of the stimulus a response belongs to
     """
-    def send_message(self, pb_message):
+    def send_frame(self, frame, correlation_id=None):
         if self.websocket is None:
             self.logger.warning("BrokerConnection", "No connection to websocket (yet). Is the adapter connected to AMP?")
         else:
             try:
                 # send a protobuff message using binary data.
-                self.websocket.send(pb_message.SerializeToString(),
-                    websocket.ABNF.OPCODE_BINARY)
+                self.websocket.send(frame, websocket.ABNF.OPCODE_BINARY)
+                if self.recorder != None:
+                    self.recorder.record(OUTBOUND, frame, correlation_id)
                 self.logger.debug("BrokerConnection", "Success send")
+                if correlation_id != None and self.latency != None:
+                    self.latency.stamp(correlation_id, "response_written")
             except Exception as e:
-                self.logger.error("BrokerConnection", "Failed sending message, exception: {}".format(e))
+                self.logger.error("BrokerConnection", "Failed sending message, exception: {}", e)
@@ -0,0 +1,207 @@
+import os
+import shutil
+import time
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:
+    # Without file locks the slots are only shared within this process
+    fcntl = None
+
+"""
+The {BrowserCache} keeps the HTTP cache of Chrome, and the V8 code cache
+which Chrome keeps next to it, in a persistent directory, so the static
+assets of the SUT (JS bundles, CSS, fonts) are not downloaded and compiled
+again by every browser which is launched after a reset.
+
+Only the caches are shared. The browsers still get a fresh profile from
+chromedriver, and the sessions are wiped between test cases, so cookies and
+storage never carry over from one test case to the next. What is served from
+the cache is decided by the HTTP caching headers of the SUT, like for a user
+who revisits the site.
+
+A cache directory can only be used by one Chrome at a time, so the cache is
+divided into slots: every browser which is launched takes a free slot, and
+hands it back when it is quit. The slots are locked with file locks, so
+adapters which share the directory never use the same slot. When all slots
+are in use, a browser is launched with a cold cache of its own.
+
+Chrome caps the size of every slot at `size / slots`. Slots which were not
+used for `max_age` seconds are removed, and the least recently used slots
+are removed while the cache is larger than `size`; the cleanup runs at most
+once per `cleanup_interval`, over all adapters sharing the directory.
+"""
+class BrowserCache:
+    SLOT_PREFIX = "slot-"
+    LOCK_NAME = ".lock"
+    CLEANUP_STAMP = ".last-cleanup"
+
+    # Slots used by this process, by path, on top of the file locks
+    in_use = set()
+    in_use_lock = Lock()
+
+    """
+    param [String] directory; the cache directory, created when missing
+    param [Integer] size_mb; megabytes all slots together may take
+    param [Integer] slots; number of browsers which can use the cache at
+    the same time, at least the browser pool size plus one
+    param [Float] max_age; seconds after which an unused slot is removed
+    param [Float] cleanup_interval; seconds between cleanups
+    """
+    def __init__(self, directory, size_mb=1024, slots=4, max_age=7 * 24 * 3600,
+            cleanup_interval=3600):
+        self.directory = os.path.abspath(directory)
+        self.size = size_mb * 1024 * 1024
+        self.slots = max(slots, 1)
+        self.max_age = max_age
+        self.cleanup_interval = cleanup_interval
+        self.locks = {} # slot path -> file descriptor of its lock
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Counters
+        self.acquired = 0
+        self.cold = 0
+        self.removed = 0
+
+
+    """
+    Take a free slot.
+    return [String] the directory of the slot, None when all slots are used
+    """
+    def acquire(self):
+        self.cleanup()
+
+        for index in range(self.slots):
+            path = os.path.join(self.directory, "{}{}".format(self.SLOT_PREFIX, index))
+            if self.lock(path):
+                self.acquired += 1
+                return path
+
+        self.cold += 1
+        return None
+
+
+    """
+    Hand a slot back; its last use is the time it is handed back.
+    param [String] path
+    """
+    def release(self, path):
+        if path is None:
+            return
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.unlock(path)
+
+
+    """
+    Lock a slot for this process, creating it when missing.
+    param [String] path
+    return [Boolean] whether the slot was free
+    """
+    def lock(self, path):
+        with self.in_use_lock:
+            if path in self.in_use:
+                return False
+            self.in_use.add(path)
+
+        try:
+            os.makedirs(path, exist_ok=True)
+            descriptor = os.open(os.path.join(path, self.LOCK_NAME), os.O_CREAT | os.O_RDWR)
+        except OSError:
+            self.unlock(path)
+            return False
+
+        if fcntl != None:
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Used by another adapter
+                os.close(descriptor)
+                self.unlock(path)
+                return False
+
+        self.locks[path] = descriptor
+        return True
+
+
+    """
+    param [String] path
+    """
+    def unlock(self, path):
+        descriptor = self.locks.pop(path, None)
+        if descriptor != None:
+            # Closing the descriptor releases the file lock
+            os.close(descriptor)
+        with self.in_use_lock:
+            self.in_use.discard(path)
+
+
+    """
+    The size in bytes Chrome may let a slot grow to.
+    return [Integer]
+    """
+    def slot_size(self):
+        return self.size // self.slots
+
+
+    """
+    Remove the slots which were not used for max_age, then the least
+    recently used slots while the cache is larger than its size. Slots in
+    use are never removed.
+    """
+    def cleanup(self):
+        stamp = os.path.join(self.directory, self.CLEANUP_STAMP)
+        now = time.time()
+        try:
+            if now - os.path.getmtime(stamp) < self.cleanup_interval:
+                return
+        except OSError:
+            pass
+        with open(stamp, "a"):
+            os.utime(stamp)
+
+        slots = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(self.SLOT_PREFIX) and os.path.isdir(path):
+                slots.append((os.path.getmtime(path), directory_size(path), path))
+        slots.sort()
+
+        total = sum(size for _, size, _ in slots)
+        for used_at, size, path in slots:
+            if now - used_at < self.max_age and total <= self.size:
+                break
+            if not self.lock(path):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            self.unlock(path)
+            total -= size
+            self.removed += 1
+
+
+    """
+    Counters of the cache.
+    return [{String: Integer}]
+    """
+    def stats(self):
+        return {"acquired": self.acquired, "cold": self.cold, "removed": self.removed}
+
+
+"""
+The size in bytes of the files in a directory tree.
+param [String] path
+return [Integer]
+"""
+def directory_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
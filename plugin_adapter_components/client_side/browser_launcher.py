@@ -0,0 +1,72 @@
+from selenium.webdriver.chrome.options import Options
+from splinter import Browser
+
+from .browser_cache import BrowserCache
+from .lean_profile import LeanProfile
+
+"""
+The {BrowserLauncher} creates the browser instances which are used to test
+the SUT.
+"""
+class BrowserLauncher:
+    """
+    param [Boolean] headless
+    param [Integer] wait_time; seconds splinter waits for elements
+    param [{String: Object}] lean; block_hosts and window_size of the
+    LeanProfile the browser is launched with, None launches stock Chrome
+    param [{String: Object}] cache; directory, size_mb, slots and max_age of
+    the BrowserCache the browsers share, None gives every browser a cold
+    cache
+    """
+    def __init__(self, headless=True, wait_time=10, lean=None, cache=None):
+        self.headless = headless
+        self.wait_time = wait_time
+        self.profile = None
+        if lean != None:
+            self.profile = LeanProfile(**lean)
+        self.cache = None
+        if cache != None:
+            self.cache = BrowserCache(**cache)
+        self.cache_slots = {} # id(browser) -> its slot of the cache
+
+
+    """
+    Creates a new Selenium browser instance.
+    return [splinter.Browser]
+    """
+    def launch(self):
+        options = self.profile.options() if self.profile != None else Options()
+
+        slot = None
+        if self.cache != None:
+            slot = self.cache.acquire()
+            if slot != None:
+                options.add_argument("--disk-cache-dir={}".format(slot))
+                options.add_argument("--disk-cache-size={}".format(self.cache.slot_size()))
+
+        try:
+            browser = Browser('chrome', headless=self.headless, options=options)
+        except Exception:
+            if slot != None:
+                self.cache.release(slot)
+            raise
+
+        if slot != None:
+            self.cache_slots[id(browser)] = slot
+        if self.profile != None:
+            self.profile.apply(browser)
+        browser.wait_time = self.wait_time
+        return browser
+
+
+    """
+    Quit a browser which was launched by this launcher, and hand its slot of
+    the cache back.
+    param [splinter.Browser] browser
+    """
+    def quit(self, browser):
+        try:
+            browser.quit()
+        finally:
+            if self.cache != None:
+                self.cache.release(self.cache_slots.pop(id(browser), None))
@@ -0,0 +1,179 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition
+
+"""
+The {BrowserPool} keeps pre-launched standby browsers, so starting the SUT
+after a reset does not have to wait for a browser cold start.
+
+A browser is taken from the pool with #acquire and handed back with
+#release. A released browser is recycled (its session is wiped) and put back
+on standby until it has been used `max_reuse` times; otherwise it is quit.
+Launching, recycling and quitting happen on background workers.
+"""
+class BrowserPool:
+    """
+    param [BrowserLauncher] launcher
+    param [Logger] logger
+    param [Integer] size; number of standby browsers
+    param [Integer] max_reuse; times a browser is used before it is quit,
+    0 quits a browser after every use
+    param [function] recycle; wipes the session of a browser, by default the
+    cookies are deleted and about:blank is opened
+    """
+    def __init__(self, launcher, logger, size=1, max_reuse=0, recycle=None):
+        self.launcher = launcher
+        self.logger = logger
+        self.size = max(size, 1)
+        self.max_reuse = max_reuse
+        self.recycle = recycle or self.default_recycle
+
+        self.condition = Condition()
+        self.standby = deque() # (browser, uses)
+        self.uses = {} # id(browser) -> uses, for the browsers in use
+        self.pending = 0 # browsers being launched or recycled
+        self.closed = False
+
+        self.workers = ThreadPoolExecutor(max_workers=self.size + 1,
+            thread_name_prefix="browser-pool")
+
+
+    """ Launch browsers until the standby set is full. """
+    def fill(self):
+        with self.condition:
+            missing = self.size - len(self.standby) - self.pending
+            if self.closed or missing <= 0:
+                return
+            self.pending += missing
+
+        for _ in range(missing):
+            self.workers.submit(self.launch_standby)
+
+
+    """ Launch a browser and put it on standby. """
+    def launch_standby(self):
+        browser = None
+        try:
+            browser = self.launcher.launch()
+        except Exception as e:
+            self.logger.error("BrowserPool", "Could not launch a standby browser: {}", e)
+
+        self.add_standby(browser, 0)
+
+
+    """
+    Put a browser on standby, or quit it when the pool is full or closed.
+    param [splinter.Browser] browser; None when a launch failed
+    param [Integer] uses
+    """
+    def add_standby(self, browser, uses):
+        with self.condition:
+            self.pending -= 1
+            keep = browser != None and not self.closed and len(self.standby) < self.size
+            if keep:
+                self.standby.append((browser, uses))
+            self.condition.notify_all()
+
+        if browser != None and not keep:
+            self.quit(browser)
+
+
+    """
+    Take a browser from the pool. Waits for a browser which is being launched
+    and launches one directly when none is on its way.
+    return [splinter.Browser]
+    """
+    def acquire(self):
+        self.fill()
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.standby or self.pending == 0)
+            if self.standby:
+                browser, uses = self.standby.popleft()
+            else:
+                browser, uses = None, 0
+
+        if browser is None:
+            self.logger.debug("BrowserPool", "No standby browser, launching one")
+            browser = self.launcher.launch()
+
+        with self.condition:
+            self.uses[id(browser)] = uses
+
+        # Replace the browser that was taken
+        self.fill()
+        return browser
+
+
+    """
+    Hand a browser back to the pool. It is recycled or quit in the
+    background.
+    param [splinter.Browser] browser
+    """
+    def release(self, browser):
+        with self.condition:
+            uses = self.uses.pop(id(browser), 0) + 1
+            closed = self.closed
+            reuse = not closed and uses < self.max_reuse
+            if reuse:
+                self.pending += 1
+
+        if closed:
+            self.quit(browser)
+        elif reuse:
+            self.workers.submit(self.recycle_standby, browser, uses)
+        else:
+            self.workers.submit(self.quit, browser)
+
+
+    """
+    Wipe the session of a used browser and put it back on standby.
+    param [splinter.Browser] browser
+    param [Integer] uses
+    """
+    def recycle_standby(self, browser, uses):
+        try:
+            self.recycle(browser)
+        except Exception as e:
+            self.logger.warning("BrowserPool", "Could not recycle a browser: {}", e)
+            with self.condition:
+                self.pending -= 1
+            self.quit(browser)
+            self.fill()
+            return
+
+        self.add_standby(browser, uses)
+
+
+    """
+    Wipe the cookies of a browser and open a blank page.
+    param [splinter.Browser] browser
+    """
+    def default_recycle(self, browser):
+        browser.driver.delete_all_cookies()
+        browser.visit("about:blank")
+
+
+    """
+    Quit a browser through its launcher, errors are logged.
+    param [splinter.Browser] browser
+    """
+    def quit(self, browser):
+        try:
+            self.launcher.quit(browser)
+        except Exception as e:
+            self.logger.warning("BrowserPool", "Could not quit a browser: {}", e)
+
+
+    """ Quit all standby browsers and stop the background workers. """
+    def close(self):
+        with self.condition:
+            self.closed = True
+            standby = list(self.standby)
+            self.standby.clear()
+            self.condition.notify_all()
+
+        for browser, _ in standby:
+            self.quit(browser)
+
+        self.workers.shutdown(wait=True)
@@ -0,0 +1,247 @@
+import hashlib
+import time
+from array import array
+
+from lxml import etree
+
+"""
+The {CdpSnapshot} takes the page snapshots through the Chrome DevTools
+Protocol instead of `browser.html`.
+
+`browser.html` makes the browser serialize the whole DOM to an HTML string,
+which is sent as JSON over WebDriver and parsed again by lxml.
+DOMSnapshot.captureSnapshot instead returns the DOM as flat arrays (parent
+index, node type, name, value and attributes per node) over a table of
+unique strings. The {NodeTable} keeps these arrays, hashes them for the
+snapshot cache, and builds the lxml tree the diff engines compare directly
+from them, without an HTML string in between.
+"""
+class CdpSnapshot:
+    CAPTURE_PARAMETERS = {
+        "computedStyles": [],
+        "includeDOMRects": False,
+        "includePaintOrder": False,
+    }
+
+    def __init__(self, logger):
+        self.logger = logger
+
+        # Counters
+        self.captures = 0
+        self.capture_ns = 0
+        self.nodes = 0
+
+
+    """
+    Capture the DOM of the current page.
+    param [splinter.Browser] browser
+    param [DiffScope] scope; the tree is limited to, None builds the whole
+    document
+    return [NodeTable]
+    """
+    def capture(self, browser, scope=None):
+        started = time.monotonic_ns()
+        snapshot = browser.driver.execute_cdp_cmd("DOMSnapshot.captureSnapshot",
+            self.CAPTURE_PARAMETERS)
+        table = NodeTable(snapshot["documents"][0], snapshot["strings"], scope)
+
+        self.captures += 1
+        self.capture_ns += time.monotonic_ns() - started
+        self.nodes += len(table.parents)
+        return table
+
+
+    """
+    Counters of the snapshots.
+    return [{String: Number}]
+    """
+    def stats(self):
+        captures = max(1, self.captures)
+        return {"captures": self.captures,
+            "mean_capture_ms": round(self.capture_ns / captures / 1e6, 3),
+            "mean_nodes": self.nodes // captures}
+
+
+"""
+The nodes of a DOMSnapshot document, in document order: a parent comes
+before its children.
+"""
+class NodeTable:
+    ELEMENT = 1
+    TEXT = 3
+    CDATA = 4
+    COMMENT = 8
+    DOCUMENT = 9
+
+    """
+    param [{String: Object}] document; a DocumentSnapshot
+    param [[String]] strings; the string table of the snapshot
+    param [DiffScope] scope; the tree is limited to, None builds the whole
+    document
+    """
+    def __init__(self, document, strings, scope=None):
+        nodes = document["nodes"]
+        self.strings = strings
+        self.parents = nodes["parentIndex"]
+        self.types = nodes["nodeType"]
+        self.names = nodes["nodeName"]
+        self.values = nodes["nodeValue"]
+        self.attributes = nodes.get("attributes") or [[] for _ in self.parents]
+        self.pseudo = set(nodes.get("pseudoType", {}).get("index", []))
+        # The element children of the document nodes are the roots
+        self.documents = {index for index, node_type in enumerate(self.types)
+            if node_type == self.DOCUMENT}
+        self.title = self.string(document.get("title", -1))
+        self.url = self.string(document.get("documentURL", -1))
+        self.size = sum(len(string) for string in strings)
+        self.scope = scope
+        self.tree = None
+
+
+    """
+    param [Integer] index; in the string table, -1 is no string
+    return [String]
+    """
+    def string(self, index):
+        return self.strings[index] if index >= 0 else None
+
+
+    """
+    Content hash of the snapshot. Equal DOMs give equal arrays and string
+    tables, so the hash is taken over those instead of a serialization.
+    With a diff scope the hash is taken over the scoped tree instead, so
+    changes the scope leaves out, like a ticking clock, do not change it.
+    return [bytes]
+    """
+    def digest(self):
+        digest = hashlib.blake2b(digest_size=16)
+        if self.scope != None:
+            digest.update(etree.tostring(self.to_etree().getroot(), encoding="utf-8"))
+            return digest.digest()
+
+        for values in (self.parents, self.types, self.names, self.values):
+            digest.update(array("i", values).tobytes())
+        flattened = array("i")
+        for attributes in self.attributes:
+            flattened.append(len(attributes))
+            flattened.extend(attributes)
+        digest.update(flattened.tobytes())
+        digest.update("\x00".join(self.strings).encode("utf-8"))
+        return digest.digest()
+
+
+    """
+    Build the lxml tree of the document, like the one lxml parses from the
+    page source: elements with lower case tags, their attributes, text,
+    tails and comments. Shadow roots, template contents and pseudo elements
+    are not part of the page source and are left out, as are attributes
+    which lxml does not accept. The tree is built once, when it is first
+    needed: snapshots with an unchanged digest are never built.
+    return [lxml.etree._ElementTree]
+    """
+    def to_etree(self):
+        if self.tree != None:
+            return self.tree
+
+        strings = self.strings
+        types = self.types
+        values = self.values
+        pseudo = self.pseudo
+        sub_element = etree.SubElement
+        elements = {} # node index -> element, for the nodes which are built
+        last_child = {} # node index -> the last child element which is built
+        root = None
+
+        for index, parent_index in enumerate(self.parents):
+            node_type = types[index]
+            parent = elements.get(parent_index)
+
+            if node_type == self.ELEMENT:
+                if parent is None:
+                    # The root, or a descendant of a node which is left out
+                    if root != None or parent_index not in self.documents:
+                        continue
+                    root = self.element(index)
+                    if root != None:
+                        elements[index] = root
+                    continue
+                if pseudo and index in pseudo:
+                    continue
+
+                tag, attributes = self.tag_and_attributes(index)
+                try:
+                    element = sub_element(parent, tag, attributes)
+                except ValueError:
+                    element = self.element(index)
+                    if element is None:
+                        continue
+                    parent.append(element)
+                elements[index] = element
+                last_child[parent_index] = element
+            elif parent is None:
+                continue
+            elif node_type == self.TEXT or node_type == self.CDATA:
+                value = values[index]
+                text = strings[value] if value >= 0 else ""
+                previous = last_child.get(parent_index)
+                if previous is None:
+                    parent.text = parent.text + text if parent.text else text
+                else:
+                    previous.tail = previous.tail + text if previous.tail else text
+            elif node_type == self.COMMENT:
+                try:
+                    comment = etree.Comment(self.string(values[index]) or "")
+                except ValueError:
+                    # lxml does not accept "--" in a comment
+                    continue
+                parent.append(comment)
+                last_child[parent_index] = comment
+
+        if root is None:
+            root = etree.Element("html")
+        if self.scope != None:
+            root = self.scope.prune(root)
+        self.tree = etree.ElementTree(root)
+        return self.tree
+
+
+    """
+    The lower case tag and the attributes of an element node.
+    param [Integer] index
+    return [(String, {String: String})]
+    """
+    def tag_and_attributes(self, index):
+        strings = self.strings
+        pairs = self.attributes[index]
+        attributes = {strings[pairs[position]]: strings[pairs[position + 1]]
+            for position in range(0, len(pairs) - 1, 2)} if pairs else {}
+        return strings[self.names[index]].lower(), attributes
+
+
+    """
+    Create the element of a node, without the attributes lxml does not
+    accept.
+    param [Integer] index
+    return [lxml.etree._Element] None when lxml does not accept the tag
+    """
+    def element(self, index):
+        tag, attributes = self.tag_and_attributes(index)
+        try:
+            element = etree.Element(tag)
+        except ValueError:
+            return None
+
+        for name, value in attributes.items():
+            try:
+                element.set(name, value)
+            except ValueError:
+                pass
+        return element
+
+
+    """
+    The tree serialized to HTML, for consumers which need the page source.
+    return [String]
+    """
+    def html(self):
+        return etree.tostring(self.to_etree().getroot(), encoding="unicode", method="html")
@@ -0,0 +1,221 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+
+from lxml import etree
+
+from .page_diff import diff_trees, group_actions
+
+"""
+The {DiffPool} computes the page updates in worker processes, so the CPU
+bound xmldiff comparison of two page sources neither blocks the execution of
+the next stimulus nor holds the GIL against the websocket thread.
+
+The two page sources of a diff are handed to a worker through one block of
+shared memory instead of pickled strings; only the small `nodes` result is
+sent back. The results are delivered to their call backs in the order the
+diffs were submitted.
+
+At most `max_pending` diffs are handed to the workers at once; further diffs
+wait in the pool, without shared memory, until a diff is delivered. A diff
+is never dropped, as the SUT has moved on to its next snapshot.
+"""
+class DiffPool:
+    """
+    param [Integer] workers; number of worker processes
+    param [Logger] logger
+    param [Integer] max_pending; diffs which may be in progress at once,
+    further diffs wait until one is delivered
+    """
+    def __init__(self, workers, logger, max_pending=None):
+        self.logger = logger
+        self.max_pending = max_pending or 4 * workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        self.lock = Lock()
+        self.delivery_lock = Lock()
+        self.pending = deque() # [future, call back, shared memory] in submission order
+        self.waiting = deque() # (before, after, call back, engine) in submission order
+
+        # Counters
+        self.submitted = 0
+        self.waited = 0
+        self.max_waiting = 0
+        self.failed = 0
+
+
+    """
+    Number of diffs which are waiting, in progress or waiting for delivery.
+    return [Integer]
+    """
+    def __len__(self):
+        with self.lock:
+            return len(self.pending) + len(self.waiting)
+
+
+    """
+    Compare two page sources in a worker process, as soon as fewer than
+    max_pending diffs are in progress.
+    param [String] before
+    param [String] after
+    param [function] callback; called with the page_update nodes, in
+    submission order, from a thread of the pool
+    param [String] engine; name of the diff engine in DIFF_ENGINES
+    """
+    def submit(self, before, after, callback, engine="xmldiff"):
+        with self.lock:
+            self.waiting.append((before, after, callback, engine))
+            if len(self.pending) >= self.max_pending:
+                self.waited += 1
+                self.max_waiting = max(self.max_waiting, len(self.waiting))
+            started = self.start_waiting()
+
+        self.watch(started)
+
+
+    """
+    Hand the waiting diffs to the workers while fewer than max_pending are in
+    progress; the lock must be held.
+    return [[concurrent.futures.Future]] of the diffs which were started
+    """
+    def start_waiting(self):
+        started = []
+        while self.waiting and len(self.pending) < self.max_pending:
+            before, after, callback, engine = self.waiting.popleft()
+            before = before.encode("utf-8")
+            after = after.encode("utf-8")
+
+            shared = SharedMemory(create=True, size=max(1, len(before) + len(after)))
+            shared.buf[:len(before)] = before
+            shared.buf[len(before):len(before) + len(after)] = after
+
+            future = self.executor.submit(diff_shared, shared.name, len(before), len(after), engine)
+            self.pending.append([future, callback, shared])
+            self.submitted += 1
+            started.append(future)
+        return started
+
+
+    """
+    Deliver the results of diffs once they are done; outside the locks, as
+    a diff which is done already delivers right away.
+    param [[concurrent.futures.Future]] futures
+    """
+    def watch(self, futures):
+        for future in futures:
+            future.add_done_callback(lambda future: self.deliver())
+
+
+    """
+    Deliver the results of the finished diffs at the head of the queue, so
+    the results are delivered in submission order, and start the diffs
+    which were waiting for them.
+    """
+    def deliver(self):
+        started = []
+        with self.delivery_lock:
+            while True:
+                with self.lock:
+                    if not self.pending or not self.pending[0][0].done():
+                        break
+                    future, callback, shared = self.pending.popleft()
+                    started.extend(self.start_waiting())
+
+                release(shared)
+                try:
+                    nodes = future.result()
+                except Exception as e:
+                    self.failed += 1
+                    self.logger.warning("DiffPool", "Diff failed: {}", e)
+                    continue
+
+                callback(nodes)
+
+        self.watch(started)
+
+
+    """
+    Counters of the pool.
+    return [{String: Integer}]
+    """
+    def stats(self):
+        with self.lock:
+            return {"pending": len(self.pending), "waiting": len(self.waiting),
+                "submitted": self.submitted, "waited": self.waited,
+                "max_waiting": self.max_waiting, "failed": self.failed}
+
+
+    """ Stop the worker processes; diffs which have not started are dropped. """
+    def close(self):
+        self.logger.debug("DiffPool", "Closing the diff pool: {}", self.stats())
+        with self.lock:
+            self.waiting.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+        with self.lock:
+            pending = list(self.pending)
+            self.pending.clear()
+        for future, callback, shared in pending:
+            release(shared)
+
+
+"""
+Release a block of shared memory of a diff.
+param [SharedMemory] shared
+"""
+def release(shared):
+    shared.close()
+    try:
+        shared.unlink()
+    except FileNotFoundError:
+        pass
+
+
+"""
+Compare two page sources which are stored one after the other in shared
+memory; runs in a worker process.
+param [String] name; of the shared memory
+param [Integer] before_size; bytes of the page source before
+param [Integer] after_size; bytes of the page source after
+param [String] engine; name of the diff engine in DIFF_ENGINES
+return [{String: [{String: String}]}] the page_update nodes
+"""
+def diff_shared(name, before_size, after_size, engine="xmldiff"):
+    shared = attach(name)
+    try:
+        before = bytes(shared.buf[:before_size]).decode("utf-8")
+        after = bytes(shared.buf[before_size:before_size + after_size]).decode("utf-8")
+    finally:
+        shared.close()
+
+    parser = etree.HTMLParser()
+    before_tree = etree.parse(StringIO(before), parser)
+    after_tree = etree.parse(StringIO(after), parser)
+    return group_actions(diff_trees(before_tree, after_tree, engine))
+
+
+"""
+Attach to a block of shared memory of the parent process in a worker. The
+parent owns the block and unlinks it, so the worker must not register it
+with the resource tracker: a tracker of its own reports the block as leaked
+when the worker stops, and unregistering it from the tracker it shares with
+the parent makes the unlink of the parent fail.
+param [String] name
+return [SharedMemory]
+"""
+def attach(name):
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    # Before Python 3.13 attaching always registers the block; a worker runs
+    # one diff at a time, so the registration can be switched off meanwhile
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
@@ -0,0 +1,294 @@
+import copy
+import re
+
+import lxml.html
+from lxml import etree
+from lxml.cssselect import CSSSelector
+
+# Escapes which Python knows and JavaScript reads as a plain letter; the
+# escapes only JavaScript knows (e.g. \p, \k) do not compile in Python
+UNSHARED_ESCAPES = set("AZaNU")
+
+# The (?... groups both read the same way: non-capturing and lookarounds
+SHARED_GROUPS = {":", "=", "!", "<=", "<!"}
+
+"""
+The {DiffScope} limits the page snapshots which are diffed to the parts of
+the page the model cares about, so clocks, ad slots, CSRF tokens, analytics
+scripts and style churn neither cost diff time nor produce page updates.
+
+- Root selectors (e.g. "#app") select the subtrees which are compared. The
+  elements on the way from the document to a root, and their siblings, are
+  kept as empty placeholders, so the XPaths of the page updates are the
+  XPaths in the real page.
+- Ignored selectors replace the matching elements by empty placeholders.
+- Ignored attributes are removed from every element.
+- Text which matches an ignored regular expression is removed.
+
+In the browser the scope is applied by a script which serializes only the
+scoped copy of the document, so the pruned parts are never transferred,
+parsed or compared. The simulated browser applies the same rules to its
+lxml document, and CDP snapshots to the tree built from their node table.
+Selectors are matched in the scoped copy, where the elements outside the
+roots have no attributes.
+
+The text patterns are run by JavaScript in the browser and by Python
+otherwise, so they are limited to the syntax both read the same way:
+characters and classes, \d \w \s \b, quantifiers, groups (...) and
+(?:...), alternation, ^ and $, lookarounds and backreferences by number.
+Named groups, inline flags, comments and the escapes only one of them
+knows (e.g. \A, \Z, \p) are rejected by #shared_pattern. Note that $
+also matches before a final newline in Python.
+"""
+class DiffScope:
+    SOURCE_SCRIPT = """
+        var roots = arguments[0], ignore = arguments[1], attributes = arguments[2];
+        var texts = arguments[3].map(function (pattern) { return new RegExp(pattern, 'g'); });
+
+        // Elements of an inert document do not load images or run scripts
+        var inert = document.implementation.createHTMLDocument('');
+        var html = document.documentElement;
+        function placeholder(el) { return inert.createElement(el.localName); }
+
+        var found = [];
+        roots.forEach(function (selector) {
+            document.querySelectorAll(selector).forEach(function (el) { found.push(el); });
+        });
+        found = found.filter(function (el) {
+            return !found.some(function (other) { return other !== el && other.contains(el); });
+        });
+
+        var top;
+        if (roots.length && found.indexOf(html) < 0) {
+            var copies = new Map();
+            var filled = new Set();
+            top = placeholder(html);
+            copies.set(html, top);
+
+            found.forEach(function (root) {
+                var chain = [];
+                for (var el = root; el !== html; el = el.parentElement) { chain.unshift(el); }
+
+                var parent = html;
+                chain.forEach(function (el) {
+                    if (!filled.has(parent)) {
+                        filled.add(parent);
+                        for (var child = parent.firstElementChild; child; child = child.nextElementSibling) {
+                            var empty = placeholder(child);
+                            copies.set(child, empty);
+                            copies.get(parent).appendChild(empty);
+                        }
+                    }
+                    parent = el;
+                });
+
+                var copy = inert.importNode(root, true);
+                copies.get(root).replaceWith(copy);
+                copies.set(root, copy);
+                filled.add(root);
+            });
+        } else {
+            top = inert.importNode(html, true);
+        }
+
+        if (ignore.length) {
+            top.querySelectorAll(ignore.join(',')).forEach(function (el) {
+                // Not when an ignored ancestor was replaced already
+                if (top.contains(el)) { el.replaceWith(placeholder(el)); }
+            });
+        }
+
+        attributes.forEach(function (name) {
+            top.removeAttribute(name);
+            top.querySelectorAll('[' + CSS.escape(name) + ']').forEach(function (el) {
+                el.removeAttribute(name);
+            });
+        });
+
+        if (texts.length) {
+            var walker = inert.createTreeWalker(top, NodeFilter.SHOW_TEXT);
+            for (var node = walker.nextNode(); node; node = walker.nextNode()) {
+                var data = node.data;
+                texts.forEach(function (re) { data = data.replace(re, ''); });
+                if (data !== node.data) { node.data = data; }
+            }
+        }
+
+        return top.outerHTML;
+    """
+
+    """
+    param [[String]] roots; CSS selectors of the subtrees which are
+    compared, none compares the whole document
+    param [[String]] ignore; CSS selectors of the elements which are not
+    compared
+    param [[String]] attributes; names of the attributes which are not
+    compared
+    param [[String]] text; regular expressions of the text which is not
+    compared
+    """
+    def __init__(self, roots=None, ignore=None, attributes=None, text=None):
+        self.roots = list(roots or [])
+        self.ignore = list(ignore or [])
+        self.attributes = list(attributes or [])
+        self.text = list(text or [])
+
+        self.root_selectors = [CSSSelector(selector, translator="html") for selector in self.roots]
+        self.ignore_selector = None
+        if self.ignore:
+            self.ignore_selector = CSSSelector(",".join(self.ignore), translator="html")
+        self.text_patterns = [shared_pattern(pattern) for pattern in self.text]
+
+
+    """
+    The scoped page source of a browser.
+    param [splinter.Browser] browser
+    return [String]
+    """
+    def source(self, browser):
+        return browser.execute_script(self.SOURCE_SCRIPT, self.roots, self.ignore,
+            self.attributes, self.text)
+
+
+    """
+    The scoped page source of a parsed document, for browsers which do not
+    run scripts. The document is not modified.
+    param [lxml.html.HtmlElement] document; the root element
+    return [String]
+    """
+    def source_of(self, document):
+        return lxml.html.tostring(self.prune(document), encoding="unicode")
+
+
+    """
+    Copy the scoped parts of a document.
+    param [lxml.html.HtmlElement] document; the root element
+    return [lxml.html.HtmlElement]
+    """
+    def prune(self, document):
+        top = None
+        if self.root_selectors:
+            top = self.scoped_copy(document)
+        if top is None:
+            top = copy.deepcopy(document)
+
+        if self.ignore_selector != None:
+            for element in self.ignore_selector(top):
+                parent = element.getparent()
+                # Not when an ignored ancestor was replaced already
+                if parent != None and any(ancestor is top for ancestor in element.iterancestors()):
+                    replacement = placeholder(element)
+                    replacement.tail = element.tail
+                    parent.replace(element, replacement)
+
+        if self.attributes:
+            for element in top.iter(tag=etree.Element):
+                for name in self.attributes:
+                    element.attrib.pop(name, None)
+
+        if self.text_patterns:
+            for element in top.iter(tag=etree.Element):
+                element.text = self.strip_text(element.text)
+                element.tail = self.strip_text(element.tail)
+        return top
+
+
+    """
+    Copy the roots of a document with placeholders for the elements on the
+    way to them and their siblings.
+    param [lxml.html.HtmlElement] document
+    return [lxml.html.HtmlElement] None when the document itself is a root
+    """
+    def scoped_copy(self, document):
+        found = dict.fromkeys(element for selector in self.root_selectors
+            for element in selector(document))
+        if document in found:
+            return None
+        roots = [element for element in found
+            if not any(ancestor in found for ancestor in element.iterancestors())]
+
+        top = placeholder(document)
+        copies = {document: top}
+        filled = set()
+        for root in roots:
+            # The elements below the document down to the root
+            chain = list(root.iterancestors())[::-1][1:] + [root]
+            parent = document
+            for element in chain:
+                if parent not in filled:
+                    filled.add(parent)
+                    for child in parent.iterchildren(tag=etree.Element):
+                        copies[child] = placeholder(child)
+                        copies[parent].append(copies[child])
+                parent = element
+
+            root_copy = copy.deepcopy(root)
+            root_copy.tail = None
+            copies[root].getparent().replace(copies[root], root_copy)
+            copies[root] = root_copy
+            filled.add(root)
+        return top
+
+
+    """
+    param [String] text
+    return [String]
+    """
+    def strip_text(self, text):
+        if not text:
+            return text
+        for pattern in self.text_patterns:
+            text = pattern.sub("", text)
+        return text
+
+
+"""
+Compile a text pattern, when it only uses the regular expression syntax
+which JavaScript and Python read the same way.
+param [String] pattern
+return [re.Pattern]
+"""
+def shared_pattern(pattern):
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        raise ValueError("invalid pattern \"{}\": {}".format(pattern, e))
+
+    index = 0
+    in_class = False
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            escape = pattern[index + 1:index + 2]
+            if escape in UNSHARED_ESCAPES:
+                raise ValueError("\\{} in pattern \"{}\" differs between JavaScript and Python".format(
+                    escape, pattern))
+            index += 2
+            continue
+
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+            # A ] right after [ or [^ is a literal in Python only
+            if pattern[index + 1:index + 2] == "]" or pattern[index + 1:index + 3] == "^]":
+                raise ValueError("[] in pattern \"{}\" differs between JavaScript and Python".format(
+                    pattern))
+        elif char == "(" and pattern[index + 1:index + 2] == "?":
+            group = pattern[index + 2:index + 4]
+            if group[:1] not in SHARED_GROUPS and group not in SHARED_GROUPS:
+                raise ValueError("(?{} in pattern \"{}\" differs between JavaScript and Python".format(
+                    group[:1], pattern))
+        index += 1
+
+    return compiled
+
+
+"""
+An empty element with the tag of an element, which keeps the positions of
+its siblings.
+param [lxml.html.HtmlElement] element
+return [lxml.html.HtmlElement]
+"""
+def placeholder(element):
+    return lxml.html.Element(element.tag)
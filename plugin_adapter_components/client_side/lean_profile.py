@@ -0,0 +1,95 @@
+from selenium.webdriver.chrome.options import Options
+
+"""
+The {LeanProfile} launches Chrome without the work the models never look at.
+The models assert on the structure and the text of the pages, so images,
+media, web fonts and third-party trackers only cost load time.
+
+- Images are disabled by a content setting, so they are not requested.
+- Web fonts and media files, by their extension, and the requests to the
+  blocked hosts are blocked through the Chrome DevTools Protocol.
+- Extensions, background networking (component updates, sync, the safe
+  browsing and metrics pings), GPU compositing and audio are disabled.
+- The window size is capped, so layout and painting stay cheap on pages
+  which grow with the viewport.
+
+Blocked requests fail like unreachable resources: `onerror` handlers of the
+page run, and images keep the size of their attributes or none.
+"""
+class LeanProfile:
+    ARGUMENTS = [
+        "--disable-extensions",
+        "--disable-component-extensions-with-background-pages",
+        "--disable-background-networking",
+        "--disable-component-update",
+        "--disable-default-apps",
+        "--disable-sync",
+        "--disable-domain-reliability",
+        "--metrics-recording-only",
+        "--no-first-run",
+        "--disable-gpu",
+        "--disable-gpu-compositing",
+        "--disable-software-rasterizer",
+        "--mute-audio",
+        "--autoplay-policy=user-gesture-required",
+        "--blink-settings=imagesEnabled=false",
+    ]
+
+    PREFERENCES = {
+        "profile.managed_default_content_settings.images": 2,
+    }
+
+    # URL patterns of the web fonts and media files
+    BLOCKED_RESOURCES = [
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+        "*.mp4", "*.webm", "*.ogv", "*.mov", "*.m3u8",
+        "*.mp3", "*.ogg", "*.oga", "*.wav", "*.m4a", "*.aac", "*.flac",
+    ]
+
+    """
+    param [[String]] block_hosts; third-party hosts whose requests are
+    blocked, including their subdomains, e.g. "www.google-analytics.com"
+    param [(Integer, Integer)] window_size; width and height of the window
+    """
+    def __init__(self, block_hosts=None, window_size=(1280, 800)):
+        self.block_hosts = list(block_hosts or [])
+        self.window_size = tuple(window_size)
+        self.blocked_urls = self.BLOCKED_RESOURCES + [pattern
+            for host in self.block_hosts for pattern in host_patterns(host)]
+
+
+    """
+    The launch options of the browser.
+    return [selenium.webdriver.chrome.options.Options]
+    """
+    def options(self):
+        options = Options()
+        for argument in self.ARGUMENTS:
+            options.add_argument(argument)
+        options.add_argument("--window-size={},{}".format(*self.window_size))
+        options.add_experimental_option("prefs", dict(self.PREFERENCES))
+        return options
+
+
+    """
+    Block the fonts, media and hosts in a launched browser. The blocking
+    applies to the tab of the DevTools session, which is the tab the SUT is
+    tested in; the session wipe closes the other tabs.
+    param [splinter.Browser] browser
+    """
+    def apply(self, browser):
+        driver = browser.driver
+        if not hasattr(driver, "execute_cdp_cmd"):
+            return
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.blocked_urls})
+
+
+"""
+The URL patterns of a host and its subdomains, with and without a port.
+param [String] host
+return [[String]]
+"""
+def host_patterns(host):
+    return ["*://{}/*".format(host), "*://{}:*".format(host),
+        "*://*.{}/*".format(host), "*://*.{}:*".format(host)]
@@ -0,0 +1,238 @@
+import copy
+import hashlib
+from difflib import SequenceMatcher
+
+from lxml import etree
+from xmldiff import actions, utils
+
+"""
+A diff engine for large pages which hashes every element subtree bottom-up
+(tag, attributes, text, and the hashes and tails of its children), like a
+Merkle tree.
+
+Subtrees with equal hashes are equal and are skipped in O(1); only the
+regions whose hashes differ are compared. The children of two matching
+elements are aligned on their hashes, elements which only differ inside are
+compared recursively, and the remaining children are deleted or inserted.
+Renamed and moved elements are reported as a delete and an insert.
+
+The engine emits the same xmldiff actions (InsertNode, DeleteNode,
+UpdateTextIn, UpdateTextAfter, InsertAttrib, UpdateAttrib, DeleteAttrib) as
+xmldiff, with lxml XPaths which are valid when the actions are applied in
+order to the before tree, so the page_update nodes keep their structure.
+Comments and processing instructions are not compared.
+"""
+
+
+"""
+Compute the edit actions between two parsed pages.
+param [lxml.etree._ElementTree] before
+param [lxml.etree._ElementTree] after
+return [[xmldiff.actions]]
+"""
+def diff_trees(before, after):
+    return MerkleDiff(before, after).diff()
+
+
+class MerkleDiff:
+    """
+    param [lxml.etree._ElementTree] before; is not modified
+    param [lxml.etree._ElementTree] after
+    """
+    def __init__(self, before, after):
+        # The actions are applied to a copy of the before tree while they are
+        # generated, so every XPath refers to the tree as it is at that point
+        self.tree = copy.deepcopy(before)
+        self.after = after
+        self.hashes = {} # element -> subtree hash, of both trees
+        self.actions = []
+
+
+    """
+    return [[xmldiff.actions]]
+    """
+    def diff(self):
+        left = self.tree.getroot()
+        right = self.after.getroot()
+        if left is None or right is None:
+            return []
+
+        self.hash_tree(left)
+        self.hash_tree(right)
+
+        if left.tag != right.tag:
+            # The documents have nothing in common
+            self.delete(left)
+            return self.actions
+
+        self.match(left, right)
+        return self.actions
+
+
+    """
+    Hash all subtrees of a tree, children before their parents.
+    param [lxml.etree._Element] root
+    """
+    def hash_tree(self, root):
+        hashes = self.hashes
+        for element in reversed(list(root.iter(tag=etree.Element))):
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(element.tag.encode("utf-8"))
+            for name, value in sorted(element.attrib.items()):
+                digest.update(b"\x01" + name.encode("utf-8") + b"=" + value.encode("utf-8"))
+            digest.update(b"\x02" + (element.text or "").encode("utf-8"))
+            for child in children(element):
+                digest.update(b"\x03" + hashes[child] + (child.tail or "").encode("utf-8"))
+            hashes[element] = digest.digest()
+
+
+    """
+    Edit an element of the before tree until it equals an element of the
+    after tree with the same tag.
+    param [lxml.etree._Element] left; in the before tree
+    param [lxml.etree._Element] right; in the after tree
+    """
+    def match(self, left, right):
+        if self.hashes.get(left) == self.hashes[right]:
+            return
+
+        self.match_attributes(left, right)
+
+        if (left.text or "") != (right.text or ""):
+            self.add(actions.UpdateTextIn(self.path(left), right.text, left.text))
+            left.text = right.text
+
+        self.match_children(left, right)
+
+
+    """
+    param [lxml.etree._Element] left
+    param [lxml.etree._Element] right
+    """
+    def match_attributes(self, left, right):
+        for name in [name for name in left.attrib if name not in right.attrib]:
+            self.add(actions.DeleteAttrib(self.path(left), name))
+            del left.attrib[name]
+
+        for name, value in right.attrib.items():
+            if name not in left.attrib:
+                self.add(actions.InsertAttrib(self.path(left), name, value))
+                left.set(name, value)
+            elif left.get(name) != value:
+                self.add(actions.UpdateAttrib(self.path(left), name, value))
+                left.set(name, value)
+
+
+    """
+    Align the children of two elements on their hashes; equal children are
+    kept, children with the same tag in a replaced region are compared, the
+    others are deleted and inserted.
+    param [lxml.etree._Element] left
+    param [lxml.etree._Element] right
+    """
+    def match_children(self, left, right):
+        left_children = children(left)
+        right_children = children(right)
+
+        matcher = SequenceMatcher(None, [self.hashes[child] for child in left_children],
+            [self.hashes[child] for child in right_children], autojunk=False)
+
+        pairs = [] # (left child or None, right child) in the order of the after tree
+        deleted = []
+        for operation, i1, i2, j1, j2 in matcher.get_opcodes():
+            if operation == "equal":
+                pairs.extend(zip(left_children[i1:i2], right_children[j1:j2]))
+            elif operation == "delete":
+                deleted.extend(left_children[i1:i2])
+            elif operation == "insert":
+                pairs.extend((None, child) for child in right_children[j1:j2])
+            else:
+                self.pair_replaced(left_children[i1:i2], right_children[j1:j2], pairs, deleted)
+
+        for child in deleted:
+            self.delete(child)
+
+        previous = None
+        for left_child, right_child in pairs:
+            if left_child is None:
+                left_child = self.insert(left, previous, right_child.tag)
+            self.match(left_child, right_child)
+
+            if (left_child.tail or "") != (right_child.tail or ""):
+                self.add(actions.UpdateTextAfter(self.path(left_child), right_child.tail,
+                    left_child.tail))
+                left_child.tail = right_child.tail
+            previous = left_child
+
+
+    """
+    Pair the children of a replaced region in order on their tags.
+    param [[lxml.etree._Element]] left_children
+    param [[lxml.etree._Element]] right_children
+    param [[(lxml.etree._Element, lxml.etree._Element)]] pairs; appended to
+    param [[lxml.etree._Element]] deleted; appended to
+    """
+    def pair_replaced(self, left_children, right_children, pairs, deleted):
+        matcher = SequenceMatcher(None, [child.tag for child in left_children],
+            [child.tag for child in right_children], autojunk=False)
+
+        for operation, i1, i2, j1, j2 in matcher.get_opcodes():
+            if operation == "equal":
+                pairs.extend(zip(left_children[i1:i2], right_children[j1:j2]))
+                continue
+            deleted.extend(left_children[i1:i2])
+            pairs.extend((None, child) for child in right_children[j1:j2])
+
+
+    """
+    Insert a new, empty element after a sibling; #match fills it in.
+    param [lxml.etree._Element] parent
+    param [lxml.etree._Element] previous; sibling the element is inserted
+    after, None inserts it as the first child
+    param [String] tag
+    return [lxml.etree._Element]
+    """
+    def insert(self, parent, previous, tag):
+        position = 0 if previous is None else parent.index(previous) + 1
+        self.add(actions.InsertNode(self.path(parent), tag, position))
+
+        element = etree.Element(tag)
+        parent.insert(position, element)
+        return element
+
+
+    """
+    Delete an element; its tail text goes with it, like when xmldiff applies
+    a DeleteNode. The text around it is compared afterwards.
+    param [lxml.etree._Element] element
+    """
+    def delete(self, element):
+        self.add(actions.DeleteNode(self.path(element)))
+
+        parent = element.getparent()
+        if parent != None:
+            parent.remove(element)
+
+
+    def add(self, action):
+        self.actions.append(action)
+
+
+    """
+    The XPath of an element, always with the index of its last step, like
+    xmldiff builds it.
+    param [lxml.etree._Element] element; in the before tree
+    return [String] the XPath of the element
+    """
+    def path(self, element):
+        return utils.getpath(element, self.tree)
+
+
+"""
+The element children of an element; comments and processing instructions are
+skipped.
+param [lxml.etree._Element] element
+return [[lxml.etree._Element]]
+"""
+def children(element):
+    return [child for child in element if isinstance(child.tag, str)]
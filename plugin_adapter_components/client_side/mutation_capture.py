@@ -0,0 +1,232 @@
+from xmldiff import actions
+
+from .page_diff import group_actions
+
+"""
+The {MutationCapture} records the changes of a page with a MutationObserver
+which is injected into the page, instead of serializing and diffing the whole
+document on every poll.
+
+The observer turns every mutation record into an xmldiff style action
+(InsertNode, DeleteNode, UpdateTextIn, UpdateTextAfter, InsertAttrib,
+UpdateAttrib, DeleteAttrib) with the XPaths xmldiff gives them, where the
+last step always has an index (see xmldiff.utils.getpath), and with the old
+text of the text updates. Draining the records is a
+single cheap script call, and an idle page returns an empty list.
+"""
+class MutationCapture:
+    # Maximum number of records kept in the page before the capture gives up
+    # and a full diff is needed.
+    MAX_RECORDS = 5000
+
+    INSTALL_SCRIPT = """
+        if (window.__adapterMutations) { return true; }
+
+        var maxRecords = arguments[0];
+        var records = [];
+        var overflow = false;
+
+        // The XPath of an element like lxml builds it: a step only has an
+        // index when siblings have the same tag
+        function elementPath(el) {
+            var parts = [];
+            while (el && el.nodeType === 1) {
+                var tag = el.tagName.toLowerCase();
+                var index = 0, count = 0;
+                var sibling = el.parentNode ? el.parentNode.firstElementChild : null;
+                for (; sibling; sibling = sibling.nextElementSibling) {
+                    if (sibling.tagName === el.tagName) {
+                        count++;
+                        if (sibling === el) { index = count; }
+                    }
+                }
+                parts.unshift(count > 1 ? tag + '[' + index + ']' : tag);
+                el = el.parentElement;
+            }
+            return '/' + parts.join('/');
+        }
+
+        // The XPath of an element like xmldiff builds it: the last step
+        // always has an index
+        function path(el) {
+            var elPath = elementPath(el);
+            return elPath.charAt(elPath.length - 1) === ']' ? elPath : elPath + '[1]';
+        }
+
+        // The text of the text nodes from a node up to the next element; the
+        // changed text node counts with its old data, '' when it was added
+        function leadingText(node, changed, oldData) {
+            var text = '';
+            for (; node && node.nodeType !== 1; node = node.nextSibling) {
+                if (node === changed) { text += oldData; }
+                else if (node.nodeType === 3) { text += node.data; }
+            }
+            return text;
+        }
+
+        // The leading text of an element before a text node was removed from
+        // it after a sibling (null when it was the first child)
+        function textBeforeRemoval(parent, previous, removedData) {
+            if (!previous) { return removedData + leadingText(parent.firstChild); }
+            var text = '';
+            for (var node = parent.firstChild; node && node.nodeType !== 1; node = node.nextSibling) {
+                if (node.nodeType === 3) { text += node.data; }
+                if (node === previous) { return text + removedData + leadingText(node.nextSibling); }
+            }
+            return text;
+        }
+
+        function push(record) {
+            if (records.length >= maxRecords) { overflow = true; return; }
+            records.push(record);
+        }
+
+        function inserted(el) {
+            var position = 0;
+            for (var s = el.previousElementSibling; s; s = s.previousElementSibling) { position++; }
+            push(['InsertNode', path(el.parentElement), el.tagName.toLowerCase(), position]);
+
+            var elPath = path(el);
+            for (var i = 0; i < el.attributes.length; i++) {
+                push(['InsertAttrib', elPath, el.attributes[i].name, el.attributes[i].value]);
+            }
+            var text = leadingText(el.firstChild);
+            if (text) { push(['UpdateTextIn', elPath, text, null]); }
+            for (var child = el.firstElementChild; child; child = child.nextElementSibling) {
+                inserted(child);
+            }
+        }
+
+        function removed(parent, node, previous) {
+            var tag = node.tagName;
+            var index = 1;
+            for (var s = previous; s; s = s.previousSibling) {
+                if (s.nodeType === 1 && s.tagName === tag) { index++; }
+            }
+            push(['DeleteNode', elementPath(parent) + '/' + tag.toLowerCase() + '[' + index + ']']);
+        }
+
+        // A text node was added (oldData is undefined) or its data changed
+        function textChanged(node, oldData) {
+            var parent = node.parentElement;
+            if (!parent || !parent.isConnected) { return; }
+            if (oldData === undefined) { oldData = ''; }
+            var previous = node.previousSibling;
+            while (previous && previous.nodeType !== 1) { previous = previous.previousSibling; }
+            var start = previous ? previous.nextSibling : parent.firstChild;
+            var oldText = leadingText(start, node, oldData) || null;
+            if (previous) {
+                push(['UpdateTextAfter', path(previous), leadingText(start), oldText]);
+            } else {
+                push(['UpdateTextIn', path(parent), leadingText(start), oldText]);
+            }
+        }
+
+        function handle(mutations) {
+            for (var i = 0; i < mutations.length; i++) {
+                var m = mutations[i];
+                if (m.type === 'childList') {
+                    if (!m.target.isConnected) { continue; }
+                    for (var j = 0; j < m.removedNodes.length; j++) {
+                        var node = m.removedNodes[j];
+                        if (node.nodeType === 1) { removed(m.target, node, m.previousSibling); }
+                        else if (node.nodeType === 3 && m.target.nodeType === 1) {
+                            push(['UpdateTextIn', path(m.target), leadingText(m.target.firstChild),
+                                textBeforeRemoval(m.target, m.previousSibling, node.data) || null]);
+                        }
+                    }
+                    for (var k = 0; k < m.addedNodes.length; k++) {
+                        var added = m.addedNodes[k];
+                        if (!added.isConnected) { continue; }
+                        if (added.nodeType === 1) { inserted(added); }
+                        else if (added.nodeType === 3) { textChanged(added); }
+                    }
+                } else if (m.type === 'characterData') {
+                    textChanged(m.target, m.oldValue);
+                } else if (m.type === 'attributes') {
+                    if (!m.target.isConnected) { continue; }
+                    var name = m.attributeName;
+                    if (!m.target.hasAttribute(name)) {
+                        push(['DeleteAttrib', path(m.target), name]);
+                    } else if (m.oldValue === null) {
+                        push(['InsertAttrib', path(m.target), name, m.target.getAttribute(name)]);
+                    } else {
+                        push(['UpdateAttrib', path(m.target), name, m.target.getAttribute(name)]);
+                    }
+                }
+            }
+        }
+
+        var observer = new MutationObserver(handle);
+        observer.observe(document.documentElement, {
+            subtree: true, childList: true, attributes: true,
+            attributeOldValue: true, characterData: true, characterDataOldValue: true
+        });
+
+        window.__adapterMutations = {
+            drain: function () {
+                handle(observer.takeRecords());
+                var result = {records: records, overflow: overflow};
+                records = [];
+                overflow = false;
+                return result;
+            }
+        };
+        return true;
+    """
+
+    DRAIN_SCRIPT = """
+        return window.__adapterMutations ? window.__adapterMutations.drain() : null;
+    """
+
+    ACTIONS = {
+        'InsertNode': actions.InsertNode,
+        'DeleteNode': actions.DeleteNode,
+        'UpdateTextIn': actions.UpdateTextIn,
+        'UpdateTextAfter': actions.UpdateTextAfter,
+        'InsertAttrib': actions.InsertAttrib,
+        'UpdateAttrib': actions.UpdateAttrib,
+        'DeleteAttrib': actions.DeleteAttrib,
+    }
+
+
+    def __init__(self, logger):
+        self.logger = logger
+
+
+    """
+    Inject the MutationObserver into the current document. Injecting into a
+    document which is already observed does nothing.
+    param [splinter.Browser] browser
+    """
+    def install(self, browser):
+        browser.execute_script(self.INSTALL_SCRIPT, self.MAX_RECORDS)
+
+
+    """
+    Take the mutations recorded since the previous drain.
+    param [splinter.Browser] browser
+    return [{String: [{String: String}]}] the page_update nodes, or None when
+    the records are unusable (the document was replaced or too many records
+    were captured) and a full diff is needed.
+    """
+    def drain(self, browser):
+        result = browser.execute_script(self.DRAIN_SCRIPT)
+
+        if result is None:
+            self.logger.debug("MutationCapture", "Document is not observed, a full diff is needed")
+            return None
+        if result["overflow"]:
+            self.logger.debug("MutationCapture", "Too many mutations recorded, a full diff is needed")
+            return None
+
+        return group_actions(self.to_actions(result["records"]))
+
+
+    """
+    Convert the raw records of the page into xmldiff actions.
+    param [[[String]]] records
+    return [[xmldiff.actions]]
+    """
+    def to_actions(self, records):
+        return [self.ACTIONS[record[0]](*record[1:]) for record in records]
@@ -0,0 +1,58 @@
+from xmldiff import main
+
+from . import merkle_diff
+
+"""
+Helpers which turn the differences between two versions of a page into the
+`nodes` parameter of a page_update response.
+
+The `nodes` struct groups the edit actions by their xmldiff action name, e.g.
+{'InsertNode': [{'target': ..., 'tag': ..., 'position': ...}], ...}, where
+every field of an action is converted to a string.
+"""
+
+# Actions which are not reported to AMP
+IGNORED_ACTIONS = ['MoveNode', 'RenameNode']
+
+# The engines which compute the edit actions, by name: "xmldiff" finds a
+# minimal edit script, "merkle" skips equal subtrees by their hashes and is
+# much faster on large pages
+DIFF_ENGINES = {
+    'xmldiff': main.diff_trees,
+    'merkle': merkle_diff.diff_trees,
+}
+
+
+"""
+Compute the edit actions between two parsed pages.
+param [lxml.etree._ElementTree] before
+param [lxml.etree._ElementTree] after
+param [String] engine; name of the engine in DIFF_ENGINES
+return [[xmldiff.actions]]
+"""
+def diff_trees(before, after, engine='xmldiff'):
+    return DIFF_ENGINES[engine](before, after)
+
+
+"""
+Group edit actions by action name into the `nodes` struct of a page_update.
+param [[xmldiff.actions]] actions
+return [{String: [{String: String}]}]
+"""
+def group_actions(actions):
+    nodes = {}
+    for action in actions:
+        action_name = type(action).__name__
+        if action_name in IGNORED_ACTIONS:
+            continue
+
+        attributes = {}
+        for field in action._fields:
+            attributes[field] = str(getattr(action, field))
+
+        if action_name in nodes:
+            nodes[action_name].append(attributes)
+        else:
+            nodes[action_name] = [attributes]
+
+    return nodes
@@ -0,0 +1,229 @@
+import time
+
+from selenium.common.exceptions import JavascriptException, TimeoutException, WebDriverException
+
+"""
+The {PageReadiness} waits until the page has settled after a stimulus, so the
+response is sampled as soon as the page is done instead of right away or on
+the next idle tick of the handler.
+
+A page has settled when
+- its document.readyState is "complete",
+- no fetch or XMLHttpRequest it started is pending, and
+- the DOM has not changed for a quiet period.
+
+The request counters and a MutationObserver are injected into the page
+before the action, so the requests the action starts are counted. With the
+Chrome DevTools Protocol they are also registered for every new document,
+so the requests a page starts while it loads are counted too. The wait is a
+single asynchronous script which is woken by the page events and answers as
+soon as the conditions hold, or when the timeout of the label has passed. A
+navigation during the wait replaces the document, the wait is then retried
+on the new document, a few times with a back-off.
+"""
+class PageReadiness:
+    # Seconds the page may take to settle after a label, by label name
+    DEFAULT_TIMEOUTS = {
+        "visit": 10.0,
+        "click_link": 10.0,
+        "click": 2.0,
+        "fill_in": 1.0,
+    }
+
+    # Times the wait is retried on a new document, and the first back-off
+    # in seconds, which doubles on every retry
+    MAX_RETRIES = 5
+    RETRY_DELAY = 0.05
+
+    # Installs the request counters and the MutationObserver, once per
+    # document
+    INSTALL_SCRIPT = """
+        (function () {
+            if (window.__adapterReadiness) { return; }
+            var state = window.__adapterReadiness = {
+                pending: 0, lastChange: performance.now(), listeners: []
+            };
+            var notify = function () {
+                var listeners = state.listeners.slice();
+                for (var i = 0; i < listeners.length; i++) { listeners[i](); }
+            };
+            var finished = function () { state.pending--; notify(); };
+
+            if (window.fetch) {
+                var fetch = window.fetch;
+                window.fetch = function () {
+                    state.pending++;
+                    var request = fetch.apply(this, arguments);
+                    request.then(finished, finished);
+                    return request;
+                };
+            }
+
+            var send = XMLHttpRequest.prototype.send;
+            XMLHttpRequest.prototype.send = function () {
+                state.pending++;
+                this.addEventListener('loadend', finished);
+                return send.apply(this, arguments);
+            };
+
+            new MutationObserver(function () {
+                state.lastChange = performance.now();
+                notify();
+            }).observe(document, {
+                subtree: true, childList: true, attributes: true, characterData: true
+            });
+            document.addEventListener('readystatechange', notify);
+        })();
+    """
+
+    WAIT_SCRIPT = INSTALL_SCRIPT + """
+        var state = window.__adapterReadiness;
+        var quietMs = arguments[0];
+        var timeoutMs = arguments[1];
+        var done = arguments[arguments.length - 1];
+
+        var started = performance.now();
+        var timer = null;
+        var answered = false;
+
+        function answer(settled) {
+            if (answered) { return; }
+            answered = true;
+            clearTimeout(timer);
+            clearTimeout(deadline);
+            var index = state.listeners.indexOf(check);
+            if (index >= 0) { state.listeners.splice(index, 1); }
+            done({settled: settled, readyState: document.readyState, pending: state.pending,
+                waitedMs: performance.now() - started});
+        }
+
+        function check() {
+            clearTimeout(timer);
+            if (document.readyState !== 'complete' || state.pending > 0) { return; }
+            var quietFor = performance.now() - state.lastChange;
+            if (quietFor >= quietMs) { answer(true); }
+            else { timer = setTimeout(check, quietMs - quietFor); }
+        }
+
+        var deadline = setTimeout(function () { answer(false); }, timeoutMs);
+        state.listeners.push(check);
+        check();
+    """
+
+    """
+    param [Logger] logger
+    param [{String: Float}] timeouts; seconds the page may take to settle,
+    by label name, on top of DEFAULT_TIMEOUTS
+    param [Float] quiet; seconds without DOM changes after which the page
+    has settled
+    """
+    def __init__(self, logger, timeouts=None, quiet=0.1):
+        self.logger = logger
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.quiet = quiet
+        self.script_timeout = None # of the driver, set for the longest wait
+        self.registered = False # INSTALL_SCRIPT runs on every new document
+
+        # Counters
+        self.settled = 0
+        self.timed_out = 0
+        self.waited = 0.0
+
+
+    """
+    Install the request counters and the MutationObserver in the current
+    document, before an action, and register them for every new document
+    when the browser supports the DevTools Protocol.
+    param [splinter.Browser] browser
+    """
+    def install(self, browser):
+        driver = browser.driver
+        try:
+            if not self.registered and hasattr(driver, "execute_cdp_cmd"):
+                driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument",
+                    {"source": self.INSTALL_SCRIPT})
+                self.registered = True
+            driver.execute_script(self.INSTALL_SCRIPT)
+        except WebDriverException as e:
+            # E.g. an open alert; the wait installs them when it can
+            self.logger.debug("PageReadiness", "Can not install the page counters: {}", e.msg)
+
+
+    """
+    Wait until the page has settled after a label.
+    param [splinter.Browser] browser
+    param [String] label; name of the label, selects the timeout
+    return [Boolean] whether the page settled before the timeout
+    """
+    def wait(self, browser, label):
+        timeout = self.timeouts.get(label, max(self.timeouts.values()))
+        started = time.monotonic()
+        deadline = started + timeout
+
+        settled = False
+        retries = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                self.set_script_timeout(browser, timeout + 1)
+                result = browser.driver.execute_async_script(self.WAIT_SCRIPT,
+                    self.quiet * 1000, remaining * 1000)
+            except (JavascriptException, TimeoutException) as e:
+                # The document was replaced during the wait
+                retries += 1
+                if retries > self.MAX_RETRIES:
+                    self.logger.warning("PageReadiness", "Waiting for the page after {} failed {} times: {}",
+                        label, retries, e.msg)
+                    break
+                self.logger.debug("PageReadiness", "Retrying the wait after {}: {}", label, e.msg)
+                time.sleep(min(self.RETRY_DELAY * 2 ** (retries - 1), max(0, deadline - time.monotonic())))
+                continue
+            except WebDriverException as e:
+                # An open alert blocks scripts; the page is as settled as it gets
+                self.logger.debug("PageReadiness", "Can not wait for the page: {}", e.msg)
+                settled = True
+                break
+
+            settled = result != None and result["settled"]
+            if not settled and result != None:
+                self.logger.debug("PageReadiness", "The page did not settle after {} in {} s: readyState {}, {} pending requests",
+                    label, timeout, result["readyState"], result["pending"])
+            break
+
+        if settled:
+            self.settled += 1
+        else:
+            self.timed_out += 1
+        self.waited += time.monotonic() - started
+        return settled
+
+
+    """
+    Make sure the driver does not abort the wait script before its own
+    timeout passes.
+    param [splinter.Browser] browser
+    param [Float] seconds
+    """
+    def set_script_timeout(self, browser, seconds):
+        if self.script_timeout is None or self.script_timeout < seconds:
+            browser.driver.set_script_timeout(seconds)
+            self.script_timeout = seconds
+
+
+    """ Forget the driver settings, the browser was replaced. """
+    def reset(self):
+        self.script_timeout = None
+        self.registered = False
+
+
+    """
+    Counters of the readiness waits.
+    return [{String: Number}]
+    """
+    def stats(self):
+        waits = self.settled + self.timed_out
+        return {"settled": self.settled, "timed_out": self.timed_out,
+            "mean_wait_ms": round(self.waited / waits * 1000, 1) if waits else 0}
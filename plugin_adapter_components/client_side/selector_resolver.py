@@ -0,0 +1,122 @@
+from collections import OrderedDict
+
+from cssselect import SelectorError
+from lxml.cssselect import CSSSelector
+from splinter.exceptions import ElementDoesNotExist
+
+"""
+The {SelectorResolver} finds the elements the stimuli act on, checking the
+CSS selector against the most recent page snapshot before WebDriver is asked.
+
+A selector which matches the snapshot is looked up once without waiting. A
+selector which does not match only gets a short explicit wait, in case the
+element is just appearing, instead of the full implicit wait of the browser,
+and fails fast otherwise. Selectors which cssselect can not evaluate are
+looked up with the implicit wait as before.
+
+The resolved element handles are cached until the page changes, i.e. until
+the digest of the snapshot changes or the SUT acts on the page.
+"""
+class SelectorResolver:
+    # Compiled CSS selectors which are kept
+    MAX_SELECTORS = 256
+
+    """
+    param [Logger] logger
+    param [Float] absent_wait; seconds WebDriver waits for an element which
+    is not in the snapshot
+    """
+    def __init__(self, logger, absent_wait=0.5):
+        self.logger = logger
+        self.absent_wait = absent_wait
+        # css selector -> CSSSelector, None for selectors cssselect can not
+        # evaluate; least recently used first
+        self.selectors = OrderedDict()
+        self.digest = None # of the snapshot the handles were resolved on
+        self.handles = {} # css selector -> element list
+
+        # Counters
+        self.cached = 0
+        self.present = 0
+        self.absent = 0
+        self.unchecked = 0
+
+
+    """
+    The elements matching a selector.
+    param [splinter.Browser] browser
+    param [String] css_selector
+    param [bytes] digest; of the current page snapshot
+    param [lxml.etree._ElementTree] tree; the current page snapshot
+    return [splinter.ElementList]
+    raise [ElementDoesNotExist] when no element matches
+    """
+    def resolve(self, browser, css_selector, digest, tree):
+        if digest != self.digest:
+            self.invalidate()
+            self.digest = digest
+
+        elements = self.handles.get(css_selector)
+        if elements != None:
+            self.cached += 1
+            return elements
+
+        in_snapshot = self.in_snapshot(tree, css_selector)
+        if in_snapshot is None:
+            self.unchecked += 1
+            elements = browser.find_by_css(css_selector)
+        elif in_snapshot:
+            self.present += 1
+            elements = browser.find_by_css(css_selector, wait_time=0)
+            if not elements:
+                # The page changed since the snapshot
+                elements = browser.find_by_css(css_selector, wait_time=self.absent_wait)
+        else:
+            self.absent += 1
+            elements = browser.find_by_css(css_selector, wait_time=self.absent_wait)
+
+        if not elements:
+            raise ElementDoesNotExist("no elements could be found with css \"{}\"".format(css_selector))
+
+        self.handles[css_selector] = elements
+        return elements
+
+
+    """
+    Whether a selector matches an element of the snapshot.
+    param [lxml.etree._ElementTree] tree
+    param [String] css_selector
+    return [Boolean] None when cssselect can not evaluate the selector
+    """
+    def in_snapshot(self, tree, css_selector):
+        if css_selector in self.selectors:
+            self.selectors.move_to_end(css_selector)
+            selector = self.selectors[css_selector]
+        else:
+            try:
+                selector = CSSSelector(css_selector, translator="html")
+            except SelectorError as e:
+                self.logger.debug("SelectorResolver", "Can not check selector {}: {}", css_selector, e)
+                selector = None
+            self.selectors[css_selector] = selector
+            if len(self.selectors) > self.MAX_SELECTORS:
+                self.selectors.popitem(last=False)
+
+        if selector is None or tree is None or tree.getroot() is None:
+            return None
+        return len(selector(tree.getroot())) > 0
+
+
+    """ Forget the resolved handles, the page has changed. """
+    def invalidate(self):
+        self.digest = None
+        self.handles.clear()
+
+
+    """
+    Counters of the resolver.
+    return [{String: Integer}]
+    """
+    def stats(self):
+        return {"cached": self.cached, "present": self.present,
+            "absent": self.absent, "unchecked": self.unchecked}
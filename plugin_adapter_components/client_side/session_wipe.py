@@ -0,0 +1,77 @@
+from selenium.common.exceptions import NoAlertPresentException, WebDriverException
+
+"""
+Wipes the state of a browser session without restarting the browser, so the
+same WebDriver session can be used for the next test case.
+"""
+
+# Clears the web storage of the current origin and deletes all IndexedDB
+# databases. Pages like about:blank have no storage, their errors are
+# ignored.
+CLEAR_STORAGE_SCRIPT = """
+    var done = arguments[arguments.length - 1];
+    try { window.localStorage.clear(); } catch (e) {}
+    try { window.sessionStorage.clear(); } catch (e) {}
+
+    if (!window.indexedDB || !window.indexedDB.databases) { done(true); return; }
+    window.indexedDB.databases().then(function (databases) {
+        databases.forEach(function (database) {
+            window.indexedDB.deleteDatabase(database.name);
+        });
+        done(true);
+    }, function () { done(false); });
+"""
+
+
+"""
+Wipe the session of a browser: dismiss open alerts, close all but the first
+tab, clear cookies, web storage and IndexedDB, and open about:blank.
+Raises when the browser can not be wiped.
+param [splinter.Browser] browser
+param [Logger] logger; None does not log the storage which could not be
+cleared
+"""
+def wipe_browser_session(browser, logger=None):
+    driver = browser.driver
+
+    origins = set()
+    handles = driver.window_handles
+    for handle in reversed(handles):
+        driver.switch_to.window(handle)
+        dismiss_alert(driver)
+        origins.add(driver.execute_script("return window.location.origin;"))
+        if handle != handles[0]:
+            driver.close()
+    driver.switch_to.window(handles[0])
+
+    driver.execute_async_script(CLEAR_STORAGE_SCRIPT)
+
+    # Chrome can also clear the storage the script can not reach (service
+    # workers, cache storage) of the origins which were open. This is best
+    # effort, the web storage of the first tab has been cleared above.
+    if hasattr(driver, "execute_cdp_cmd"):
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        for origin in origins:
+            # Pages like about:blank have the opaque origin "null"
+            if not origin or origin == "null":
+                continue
+            try:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin",
+                    {"origin": origin, "storageTypes": "all"})
+            except WebDriverException as e:
+                if logger != None:
+                    logger.warning("SessionWipe", "Could not clear the storage of {}: {}", origin, e)
+
+    driver.delete_all_cookies()
+    browser.visit("about:blank")
+
+
+"""
+Dismiss the alert of the current tab, if there is one.
+param [selenium.webdriver.Remote] driver
+"""
+def dismiss_alert(driver):
+    try:
+        driver.switch_to.alert.dismiss()
+    except NoAlertPresentException:
+        pass
@@ -0,0 +1,451 @@
+import os
+from collections import OrderedDict
+from urllib.parse import unquote, urljoin, urlsplit
+
+import lxml.html
+from lxml.cssselect import CSSSelector
+
+from .sut_backend import SutBackend
+
+"""
+A browserless SUT backend for load-testing the adapter pipeline.
+
+The {SimulatedSut} runs the stimuli on a {SimulatedBrowser}: an in-process
+lxml document which mimics the part of the splinter API a browser backend
+uses. The pages are served from a {SiteMap}, so the protocol, queueing,
+diffing and encoding costs of the adapter can be measured without the
+latency of WebDriver and Chrome, which are not even imported.
+
+Links navigate to their href, submit buttons to the action of their form,
+checkboxes toggle their checked attribute, radio buttons are checked and
+uncheck the other radio buttons of their group, and filling in a field sets
+its value. Scripts are not executed, so the page has settled as soon as an
+action returns and its updates are reported right away.
+"""
+class SimulatedSut(SutBackend):
+    uses_browser_pool = False
+
+    """
+    param [String] change_capture; only "xmldiff" is supported
+    param [BrowserPool] browser_pool; ignored, the simulated browser is not
+    pooled
+    param [LatencyTracker] latency; None when latencies are not tracked
+    param [DiffPool] diff_pool; worker processes the page sources are
+    compared in, None compares them in the calling thread
+    param [String] diff_engine; how page sources are compared, see
+    page_diff.DIFF_ENGINES
+    param [Float] selector_wait; ignored, the simulated page does not change
+    by itself
+    param [String] page_readiness; ignored, the simulated page has settled
+    as soon as an action returns
+    param [{String: Float}] ready_timeouts; ignored
+    param [Float] ready_quiet; ignored
+    param [Float] update_window; seconds the page updates are merged into
+    one page_update
+    param [Integer] update_budget; bytes of a page_update, 0 is unlimited
+    param [{String: [String]}] diff_scope; roots, ignore, attributes and
+    text of the DiffScope the page snapshots are limited to
+    param [String] snapshot_source; ignored, the simulated browser has no
+    DevTools Protocol
+    param [{String: Object}] browser_profile; ignored, the simulated browser
+    loads no resources
+    param [{String: Object}] browser_cache; ignored, the simulated browser
+    has no HTTP cache
+    param [String|{String: String}] site; directory the pages are served
+    from, or a site map of URL paths to page sources
+    """
+    def __init__(self, logger, responses, event_queue, change_capture="xmldiff",
+            browser_pool=None, latency=None, diff_pool=None, diff_engine="xmldiff",
+            selector_wait=0.5, page_readiness="event", ready_timeouts=None, ready_quiet=0.1,
+            update_window=0.0, update_budget=0, diff_scope=None, snapshot_source="html",
+            browser_profile=None, browser_cache=None, site=None):
+        super().__init__(logger, responses, event_queue, latency, update_window, update_budget,
+            diff_pool, diff_engine, diff_scope)
+        if change_capture != "xmldiff":
+            logger.warning("Sut", "The simulated browser does not run scripts, using xmldiff change capture")
+
+        self.site = SiteMap(site)
+        self.browser = None
+
+
+    """
+    Creates a new simulated browser.
+    param [Boolean] headless; ignored
+    """
+    def start(self, headless=True):
+        self.browser = SimulatedBrowser(self.site)
+
+
+    """
+    Perform any cleanup if the simulated browser has stopped
+    """
+    def stop(self):
+        self.logger.info("Sut", "The simulated browser has stopped testing the SUT")
+        self.logger.debug("Sut", "Snapshot cache: {}, unchanged snapshots: {}",
+            self.snapshots.stats(), self.unchanged_snapshots)
+        self.logger.debug("Sut", "Page updates: {}", self.updates.stats())
+        self.discard_page()
+        self.browser.quit()
+
+
+    """
+    Prepare the SUT for the next test case without restarting the browser.
+    """
+    def reset_session(self):
+        self.logger.info("Sut", "Resetting the simulated browser")
+        self.discard_page()
+        self.browser.reset()
+
+
+    """
+    Navigates to the specified URL and generates a response.
+    param [String] url
+    """
+    def visit(self, url):
+        self.browser.visit(url)
+        self.generate_response()
+
+
+    """
+    Clicks an element specified by the CSS selector and reports the page
+    updates.
+    param [String] css_selector
+    """
+    def click(self, css_selector):
+        self.act(css_selector, lambda elements: elements.click())
+        self.get_updates()
+
+
+    """
+    Clicks a link element specified by the CSS selector and generates a
+    response.
+    param [String] css_selector
+    """
+    def click_link(self, css_selector):
+        self.act(css_selector, lambda elements: elements.click())
+        self.generate_response()
+
+
+    """
+    Enters the provided value into an input field specified by the CSS
+    selector and reports the page updates.
+    param [String] css_selector
+    param [String] value
+    """
+    def fill_in(self, css_selector, value):
+        self.act(css_selector, lambda elements: elements.fill(value))
+        self.get_updates()
+
+
+    def accept_alert(self):
+        pass
+
+
+    """
+    Take a snapshot of the page and perform an action on the elements of a
+    selector.
+    param [String] css_selector
+    param [function] action; called with the SimulatedElementList
+    """
+    def act(self, css_selector, action):
+        self.take_snapshot()
+        action(self.browser.find_by_css(css_selector))
+
+
+    """
+    Generates a response containing the current page's title and URL.
+    """
+    def generate_response(self):
+        self.take_snapshot()
+        response = [
+            "page_title",
+            {"_title": "string", "_url": "string"},
+            {"_title": self.browser.title, "_url": self.browser.url}
+        ]
+        self.handle_response(response)
+
+
+    """
+    The source of the page which is compared; the diff scope is applied to
+    the lxml document, the simulated browser does not run scripts.
+    return [String]
+    """
+    def page_html(self):
+        if self.scope != None:
+            return self.scope.source_of(self.browser.document)
+        return self.browser.html
+
+
+"""
+The pages of the simulated SUT, by URL path. Pages of a directory are read
+when they are first visited; the index.html of a directory is served for
+its path.
+"""
+class SiteMap:
+    NOT_FOUND = "<html><head><title>404 Not Found</title></head><body><h1>Not Found</h1></body></html>"
+
+    """
+    param [String|{String: String}] site; directory, or URL paths to page
+    sources, None serves an empty site
+    """
+    def __init__(self, site=None):
+        self.directory = None
+        self.pages = {}
+
+        if isinstance(site, dict):
+            self.pages = dict(site)
+        elif site != None:
+            self.directory = os.path.abspath(site)
+
+
+    """
+    The page source for a URL: data:text/html URLs carry their own source,
+    other URLs are looked up by their path.
+    param [String] url
+    return [String]
+    """
+    def page(self, url):
+        if url.startswith("data:"):
+            header, _, data = url.partition(",")
+            return unquote(data)
+        if url == "about:blank":
+            return "<html><head></head><body></body></html>"
+
+        path = urlsplit(url).path or "/"
+        if path in self.pages:
+            return self.pages[path]
+
+        html = self.read(path)
+        if html != None:
+            self.pages[path] = html
+            return html
+        return self.NOT_FOUND
+
+
+    """
+    Read a page from the directory.
+    param [String] path
+    return [String] None when the page does not exist
+    """
+    def read(self, path):
+        if self.directory is None:
+            return None
+
+        file_path = os.path.normpath(os.path.join(self.directory, unquote(path).lstrip("/")))
+        if os.path.commonpath([self.directory, file_path]) != self.directory:
+            return None
+        if os.path.isdir(file_path):
+            file_path = os.path.join(file_path, "index.html")
+        if not os.path.isfile(file_path):
+            return None
+
+        with open(file_path, encoding="utf-8") as page:
+            return page.read()
+
+
+"""
+Raised when no element matches a CSS selector, like
+splinter.exceptions.ElementDoesNotExist.
+"""
+class ElementDoesNotExist(Exception):
+    pass
+
+
+"""
+An lxml document which mimics the part of the splinter.Browser API used by
+the SimulatedSut: visit, html, title, url, find_by_css and quit.
+"""
+class SimulatedBrowser:
+    # Compiled CSS selectors which are kept
+    MAX_SELECTORS = 256
+
+    # Seconds splinter waits for elements; the simulated page does not
+    # change by itself, so there is nothing to wait for
+    wait_time = 0
+
+    """
+    param [SiteMap] site
+    """
+    def __init__(self, site):
+        self.site = site
+        self.selectors = OrderedDict() # CSS selector -> CSSSelector, least recently used first
+        self.url = "about:blank"
+        self.document = lxml.html.document_fromstring(site.page(self.url))
+
+
+    """
+    Navigate to a URL.
+    param [String] url
+    """
+    def visit(self, url):
+        self.url = urljoin(self.url, url) if not url.startswith("data:") else url
+        self.document = lxml.html.document_fromstring(self.site.page(self.url))
+
+
+    """
+    The serialized current document.
+    return [String]
+    """
+    @property
+    def html(self):
+        return lxml.html.tostring(self.document, encoding="unicode")
+
+
+    """
+    The title of the current document.
+    return [String]
+    """
+    @property
+    def title(self):
+        return self.document.findtext(".//title") or ""
+
+
+    """
+    The elements matching a CSS selector.
+    param [String] css_selector
+    param [Float] wait_time; ignored
+    return [SimulatedElementList]
+    """
+    def find_by_css(self, css_selector, wait_time=None):
+        selector = self.selectors.get(css_selector)
+        if selector is None:
+            selector = CSSSelector(css_selector)
+            self.selectors[css_selector] = selector
+            if len(self.selectors) > self.MAX_SELECTORS:
+                self.selectors.popitem(last=False)
+        else:
+            self.selectors.move_to_end(css_selector)
+
+        return SimulatedElementList([SimulatedElement(self, element)
+            for element in selector(self.document)], css_selector)
+
+
+    """ Forget the current page. """
+    def reset(self):
+        self.visit("about:blank")
+
+
+    def quit(self):
+        self.document = None
+
+
+"""
+The elements matching a selector; actions apply to the first element, like a
+splinter ElementList.
+"""
+class SimulatedElementList(list):
+    """
+    param [[SimulatedElement]] elements
+    param [String] css_selector
+    """
+    def __init__(self, elements, css_selector):
+        super().__init__(elements)
+        self.css_selector = css_selector
+
+
+    @property
+    def first(self):
+        if not self:
+            raise ElementDoesNotExist("no elements could be found with css \"{}\"".format(self.css_selector))
+        return self[0]
+
+
+    def is_visible(self, wait_time=None):
+        return self.first.is_visible()
+
+
+    def click(self):
+        self.first.click()
+
+
+    def fill(self, value):
+        self.first.fill(value)
+
+
+class SimulatedElement:
+    """
+    param [SimulatedBrowser] browser
+    param [lxml.html.HtmlElement] element
+    """
+    def __init__(self, browser, element):
+        self.browser = browser
+        self.element = element
+
+
+    """
+    Whether the element and its ancestors are not hidden.
+    return [Boolean]
+    """
+    def is_visible(self):
+        for element in self.element.iterancestors():
+            if element.get("hidden") != None:
+                return False
+        return self.element.get("hidden") is None
+
+
+    """
+    Click the element: follow a link, submit a form, toggle a checkbox or
+    check a radio button.
+    """
+    def click(self):
+        element = self.element
+        if element.tag == "a" and element.get("href") != None:
+            self.browser.visit(element.get("href"))
+        elif element.tag == "input" and element.get("type") == "checkbox":
+            if element.get("checked") != None:
+                del element.attrib["checked"]
+            else:
+                element.set("checked", "checked")
+        elif element.tag == "input" and element.get("type") == "radio":
+            # A radio button stays checked, like in a browser
+            for other in self.radio_group():
+                if other is not element:
+                    other.attrib.pop("checked", None)
+            element.set("checked", "checked")
+        elif self.submits():
+            form = next(element.iterancestors("form"))
+            self.browser.visit(form.get("action") or self.browser.url)
+
+
+    """
+    The radio buttons of the group of the element: those with the same name
+    in the same form, or outside any form.
+    return [[lxml.html.HtmlElement]]
+    """
+    def radio_group(self):
+        element = self.element
+        name = element.get("name")
+        if not name:
+            return [element]
+
+        form = next(element.iterancestors("form"), None)
+        scope = form if form is not None else element.getroottree().getroot()
+        return [other for other in scope.iter("input")
+            if other.get("type") == "radio" and other.get("name") == name
+                and next(other.iterancestors("form"), None) is form]
+
+
+    """
+    Whether clicking the element submits its form.
+    return [Boolean]
+    """
+    def submits(self):
+        element = self.element
+        if element.tag == "button":
+            submit = element.get("type", "submit") == "submit"
+        elif element.tag == "input":
+            submit = element.get("type") in ("submit", "image")
+        else:
+            submit = False
+        return submit and next(element.iterancestors("form"), None) is not None
+
+
+    """
+    Fill in the element with a value.
+    param [String] value
+    """
+    def fill(self, value):
+        if self.element.tag == "textarea":
+            self.element.text = value
+        else:
+            self.element.set("value", value)
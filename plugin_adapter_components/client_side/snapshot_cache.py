@@ -0,0 +1,98 @@
+import hashlib
+from collections import OrderedDict
+from io import StringIO
+
+from lxml import etree
+
+"""
+The {SnapshotCache} keeps the parsed lxml trees of recent page snapshots,
+keyed by a content hash of the page source. It lets the diff path skip the
+comparison of identical snapshots and reuse the tree of the previous
+snapshot instead of parsing its source again.
+
+The cache is bounded both in number of entries and in the total size of the
+page sources it holds; the least recently used snapshots are evicted first.
+"""
+class SnapshotCache:
+    def __init__(self, max_entries=8, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # digest -> (tree, size)
+        self.size = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    """
+    Content hash of a page source.
+    param [String] html
+    return [bytes]
+    """
+    def digest(self, html):
+        return hashlib.blake2b(html.encode("utf-8"), digest_size=16).digest()
+
+
+    """
+    Parsed tree of a page source, taken from the cache when possible.
+    param [bytes] digest; content hash of the html
+    param [String|NodeTable] html; a node table builds its tree itself
+    return [lxml.etree._ElementTree]
+    """
+    def tree(self, digest, html):
+        entry = self.entries.get(digest)
+        if entry != None:
+            self.hits += 1
+            self.entries.move_to_end(digest)
+            return entry[0]
+
+        self.misses += 1
+        if isinstance(html, str):
+            tree = etree.parse(StringIO(html), etree.HTMLParser())
+            self.put(digest, tree, len(html))
+        else:
+            tree = html.to_etree()
+            self.put(digest, tree, html.size)
+        return tree
+
+
+    """
+    Add a parsed tree to the cache and evict the oldest entries when the
+    cache is over its bounds.
+    param [bytes] digest
+    param [lxml.etree._ElementTree] tree
+    param [Integer] size; size of the page source
+    """
+    def put(self, digest, tree, size):
+        if digest in self.entries:
+            self.size -= self.entries.pop(digest)[1]
+
+        self.entries[digest] = (tree, size)
+        self.size += size
+
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+
+    """ Remove all snapshots from the cache. """
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+    """
+    Counters of the cache.
+    return [{String: Integer}]
+    """
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
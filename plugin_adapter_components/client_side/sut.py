@@ -1,20 +1,81 @@
-from splinter import Browser
-from xmldiff import main
-from lxml import etree
-from io import StringIO 
+from selenium.common.exceptions import (ElementClickInterceptedException,
+    ElementNotInteractableException, StaleElementReferenceException)
+
+from .browser_launcher import BrowserLauncher
+from .cdp_snapshot import CdpSnapshot, NodeTable
+from .mutation_capture import MutationCapture
+from .page_readiness import PageReadiness
+from .selector_resolver import SelectorResolver
+from .session_wipe import wipe_browser_session
+from .sut_backend import SutBackend
 
 
 # This class executes labels on the SUT and generates responses
-class SeleniumSut:
+class SeleniumSut(SutBackend):
+    uses_browser_pool = True
+
     """
     Constructor
+    param [String] change_capture; how page updates are detected: "xmldiff"
+    diffs full page snapshots, "mutation" drains the records of a
+    MutationObserver injected into the page.
+    param [BrowserPool] browser_pool; pool the browser is taken from, None
+    launches a new browser on every start
+    param [LatencyTracker] latency; None when latencies are not tracked
+    param [DiffPool] diff_pool; worker processes the page sources are
+    compared in, None compares them in the calling thread
+    param [String] diff_engine; how page sources are compared, see
+    page_diff.DIFF_ENGINES
+    param [Float] selector_wait; seconds to wait for an element which is not
+    in the page snapshot
+    param [String] page_readiness; "event" waits until the page has settled
+    after every label before the response is sampled, "none" samples it
+    right away
+    param [{String: Float}] ready_timeouts; seconds the page may take to
+    settle, by label name
+    param [Float] ready_quiet; seconds without DOM changes after which the
+    page has settled
+    param [Float] update_window; seconds the page updates are merged into
+    one page_update
+    param [Integer] update_budget; bytes of a page_update, 0 is unlimited
+    param [{String: [String]}] diff_scope; roots, ignore, attributes and
+    text of the DiffScope the page snapshots are limited to, None compares
+    the whole page
+    param [String] snapshot_source; how the page snapshots are taken:
+    "html" serializes the page source, "cdp" captures the DOM as a node
+    table through the Chrome DevTools Protocol
+    param [{String: Object}] browser_profile; block_hosts and window_size of
+    the LeanProfile the browser is launched with, None launches stock Chrome
+    param [{String: Object}] browser_cache; directory, size_mb, slots and
+    max_age of the BrowserCache the browsers share across restarts, None
+    launches every browser with a cold cache
     """
-    def __init__(self, logger, responses, event_queue):
-        self.logger = logger
-        self.responses = responses
-        self.event_queue = event_queue
+    def __init__(self, logger, responses, event_queue, change_capture="xmldiff",
+            browser_pool=None, latency=None, diff_pool=None, diff_engine="xmldiff",
+            selector_wait=0.5, page_readiness="event", ready_timeouts=None, ready_quiet=0.1,
+            update_window=0.0, update_budget=0, diff_scope=None, snapshot_source="html",
+            browser_profile=None, browser_cache=None):
+        super().__init__(logger, responses, event_queue, latency, update_window, update_budget,
+            diff_pool, diff_engine, diff_scope)
+        self.browser_pool = browser_pool
+        self.launcher = BrowserLauncher(lean=browser_profile, cache=browser_cache)
         self.browser = None
-        self.page_source = ''
+        self.selectors = SelectorResolver(logger, selector_wait)
+
+        self.mutation_capture = None
+        if change_capture == "mutation":
+            self.mutation_capture = MutationCapture(logger)
+
+        if self.scope != None and self.mutation_capture != None:
+            logger.warning("Sut", "The diff scope only applies to full page diffs, not to mutation capture")
+
+        self.cdp = None
+        if snapshot_source == "cdp":
+            self.cdp = CdpSnapshot(logger)
+
+        self.readiness = None
+        if page_readiness == "event":
+            self.readiness = PageReadiness(logger, ready_timeouts, ready_quiet)
 
     """
     Special function: class name
@@ -28,29 +89,43 @@ class SeleniumSut:
     """
     def stop(self):
         self.logger.info("Sut", "Selenium has stopped testing the SUT")
-        self.responses = []
-        self.browser.quit()
+        self.logger.debug("Sut", "Snapshot cache: {}, unchanged snapshots: {}, selectors: {}",
+            self.snapshots.stats(), self.unchanged_snapshots, self.selectors.stats())
+        if self.readiness != None:
+            self.logger.debug("Sut", "Page readiness: {}", self.readiness.stats())
+        if self.cdp != None:
+            self.logger.debug("Sut", "CDP snapshots: {}", self.cdp.stats())
+        self.logger.debug("Sut", "Page updates: {}", self.updates.stats())
+        self.discard_page()
+
+        if self.browser_pool != None:
+            self.browser_pool.release(self.browser)
+        else:
+            self.launcher.quit(self.browser)
+            if self.launcher.cache != None:
+                self.logger.debug("Sut", "Browser cache: {}", self.launcher.cache.stats())
 
 
     """
-    Add the response  to the response stack from the
-    Handler class.
-    param [[String, {String : String}, {String: String}]] css_selector
+    Prepare the SUT for the next test case without restarting the browser:
+    the browser session is wiped and the page snapshots are forgotten.
+    Raises when the session could not be wiped.
     """
-    def handle_response(self, response):
-        self.logger.debug("Sut", "Add response: {}".format(response))
-        self.responses.append(response)
+    def reset_session(self):
+        self.logger.info("Sut", "Wiping the browser session")
+        self.discard_page()
+        wipe_browser_session(self.browser, self.logger)
+        self.selectors.invalidate()
 
 
     """
     Simulates a click on an element specified by the 
-    CSS selector
+    CSS selector, and reports the page updates once the page has settled.
     param [String] css_selector
     """
     def click(self, css_selector):
-        self.browser.find_by_css(css_selector).is_visible()
-        self.page_source = self.browser.html
-        self.browser.find_by_css(css_selector).click()
+        self.act(css_selector, lambda elements: elements.click())
+        self.report_when_settled("click")
     
     def accept_alert(self):
         self.browser.driver.switch_to.alert.accept()
@@ -62,9 +137,10 @@ class SeleniumSut:
     param [String] css_selector
     """
     def click_link(self, css_selector):
-        self.browser.find_by_css(css_selector).is_visible()
-        self.browser.find_by_css(css_selector).click()
+        self.act(css_selector, lambda elements: elements.click())
+        self.wait_until_ready("click_link")
         self.generate_response()
+        self.observe_mutations()
 
 
     """
@@ -72,77 +148,180 @@ class SeleniumSut:
     param [String] url
     """
     def visit(self, url):
+        self.prepare_readiness()
         self.browser.visit(url)
+        self.wait_until_ready("visit")
         self.generate_response()
+        self.observe_mutations()
 
 
     """
     Enters the provided value into an input field
-    specified by the CSS selector.
+    specified by the CSS selector, and reports the page updates once the
+    page has settled.
     param [String] css_selector
     param [String] value
     """
     def fill_in(self, css_selector, value):
-        self.page_source = self.browser.html
-        self.browser.find_by_css(css_selector).fill(value)
+        self.act(css_selector, lambda elements: elements.fill(value))
+        self.report_when_settled("fill_in")
+
+
+    """
+    Count the requests and DOM changes from before an action on, so the wait
+    after it sees the requests the action starts, when page readiness is
+    used.
+    """
+    def prepare_readiness(self):
+        if self.readiness != None:
+            self.readiness.install(self.browser)
+
+
+    """
+    Wait until the page has settled after a label, when page readiness is
+    used.
+    param [String] label
+    """
+    def wait_until_ready(self, label):
+        if self.readiness != None:
+            self.readiness.wait(self.browser, label)
+
+
+    """
+    Report the updates of an action on the page as soon as the page has
+    settled. Without page readiness the updates are left to the next idle
+    check of the handler.
+    param [String] label
+    """
+    def report_when_settled(self, label):
+        if self.readiness is None:
+            self.observe_mutations()
+            return
+
+        self.readiness.wait(self.browser, label)
+        self.get_updates()
+
 
+    """
+    Take a snapshot of the page, find the elements of a selector with the
+    help of the snapshot and perform an action on them. An element which can
+    not be used yet is waited for until it is visible, like before the
+    selector was checked against the snapshot.
+    param [String] css_selector
+    param [function] action; called with the splinter.ElementList
+    """
+    def act(self, css_selector, action):
+        self.take_snapshot()
+        elements = self.find(css_selector)
+        self.prepare_readiness()
+        try:
+            action(elements)
+        except StaleElementReferenceException:
+            # The element was replaced by an identical one
+            self.selectors.invalidate()
+            action(self.find(css_selector))
+        except (ElementNotInteractableException, ElementClickInterceptedException):
+            elements.is_visible(wait_time=self.browser.wait_time)
+            action(elements)
 
+
+    """
+    The elements matching a selector on the current snapshot.
+    param [String] css_selector
+    return [splinter.ElementList]
     """
-    Creates a new Selenium browser instance.
+    def find(self, css_selector):
+        tree = self.snapshots.tree(self.page_digest, self.page_source)
+        return self.selectors.resolve(self.browser, css_selector, self.page_digest, tree)
+
+
+    """
+    Takes a browser from the browser pool, or creates a new Selenium browser
+    instance when there is no pool.
     param [Boolean] headless
     """
     def start(self, headless=True):
-        self.browser = Browser('chrome', headless=headless)
-        self.browser.wait_time = 10
+        if self.browser_pool != None:
+            self.browser = self.browser_pool.acquire()
+        else:
+            self.launcher.headless = headless
+            self.browser = self.launcher.launch()
+        if self.readiness != None:
+            self.readiness.reset()
+        if self.cdp != None and not hasattr(self.browser.driver, "execute_cdp_cmd"):
+            self.logger.warning("Sut", "The browser does not support CDP, using page source snapshots")
+            self.cdp = None
 
 
     """
     Generates a response containing the current page's title and URL.
     """
     def generate_response(self):
-        self.page_source = self.browser.html
+        self.take_snapshot()
+        if isinstance(self.page_source, NodeTable):
+            # The snapshot has them, which saves two WebDriver calls
+            title = self.page_source.title or ""
+            url = self.page_source.url or self.browser.url
+        else:
+            title, url = self.browser.title, self.browser.url
         response = [
             "page_title",
             {"_title": "string", "_url": "string"},
-            {"_title": self.browser.title, "_url": self.browser.url}
+            {"_title": title, "_url": url}
         ]
         self.handle_response(response)
 
 
     """
-    Compares the page source before and after an action, 
-    detects updates, and generates a response.
+    Capture the page which is compared: a node table through CDP, or the
+    page source.
+    return [(String|NodeTable, bytes)] the snapshot and its content hash
     """
-    def get_updates(self):
+    def capture_page(self):
+        if self.cdp != None:
+            table = self.cdp.capture(self.browser, self.scope)
+            return table, table.digest()
+        return super().capture_page()
 
-        if not self.page_source:
-            return
 
-        before = self.page_source
-        after = self.browser.html
+    """
+    The source of the page which is compared, limited to the diff scope.
+    return [String]
+    """
+    def page_html(self):
+        if self.scope != None:
+            return self.scope.source(self.browser)
+        return self.browser.html
+
 
-        parser = etree.HTMLParser()
+    """
+    Make sure the current document is observed when page updates are
+    captured with a MutationObserver.
+    """
+    def observe_mutations(self):
+        if self.mutation_capture != None:
+            self.mutation_capture.install(self.browser)
 
-        before = etree.parse(StringIO(before), parser)
-        after = etree.parse(StringIO(after), parser)
 
-        results = main.diff_trees(before, after)
+    """
+    Detects the updates of the page since the previous check, and generates a
+    response. With mutation capture only the recorded mutations are drained;
+    otherwise, or when the document was replaced, the snapshots before and
+    after are compared.
+    """
+    def get_updates(self):
+        if not self.page_source:
+            return
 
-        nodes = {}
-        for result in results:
-            attributes = {}
-            fields = result._fields
-            for field in fields:
-                attributes[field] = str(getattr(result, field))
+        if self.mutation_capture != None:
+            nodes = self.mutation_capture.drain(self.browser)
+            if nodes is not None:
+                self.report_updates(nodes, self.correlation_id)
+                return
 
-            if type(result).__name__ not in ['MoveNode', 'RenameNode']:
-                if type(result).__name__ in nodes:
-                    nodes[type(result).__name__].append(attributes)
-                else:
-                    nodes[type(result).__name__] = [attributes]
+        super().get_updates()
 
-        if nodes:
-            response = ["page_update", {'nodes': 'struct'},{'nodes': nodes}]
-            self.handle_response(response)
 
-        self.page_source = self.browser.html
+    """ Observe the document which is compared from now on. """
+    def updates_checked(self):
+        self.observe_mutations()
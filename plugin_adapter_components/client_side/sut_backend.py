@@ -0,0 +1,283 @@
+from .diff_scope import DiffScope
+from .page_diff import diff_trees, group_actions
+from .snapshot_cache import SnapshotCache
+from .update_coalescer import UpdateCoalescer
+
+"""
+The {SutBackend} is the interface between the Handler and the system under
+test. The Handler executes the stimuli of AMP on a backend, and the backend
+puts the responses of the SUT on the response queue of the Handler.
+
+A backend implements #start, #stop, #visit, #click, #click_link, #fill_in and
+#page_html; #reset_session and #accept_alert are optional.
+
+The detection of page updates does not depend on the browser: the backend
+keeps a snapshot of the page, and #get_updates compares it with a new one,
+through the snapshot cache and optionally in the diff pool, and reports the
+updates through the update coalescer. A backend only provides the page
+source (#page_html), or overrides #capture_page to snapshot the page in
+another way.
+"""
+class SutBackend:
+    # Whether the backend runs in a browser taken from the BrowserPool
+    uses_browser_pool = False
+
+    """
+    param [Logger] logger
+    param [DispatchQueue] responses; response queue of the Handler
+    param [DispatchQueue] event_queue; stimulus queue of the Handler
+    param [LatencyTracker] latency; None when latencies are not tracked
+    param [Float] update_window; seconds the page updates are merged into
+    one page_update, 0 reports every update by itself
+    param [Integer] update_budget; bytes of a page_update, 0 is unlimited
+    param [DiffPool] diff_pool; worker processes the page sources are
+    compared in, None compares them in the calling thread
+    param [String] diff_engine; how page sources are compared, see
+    page_diff.DIFF_ENGINES
+    param [{String: [String]}] diff_scope; roots, ignore, attributes and
+    text of the DiffScope the page snapshots are limited to, None compares
+    the whole page
+    """
+    def __init__(self, logger, responses, event_queue, latency=None,
+            update_window=0.0, update_budget=0, diff_pool=None, diff_engine="xmldiff",
+            diff_scope=None):
+        self.logger = logger
+        self.responses = responses
+        self.event_queue = event_queue
+        self.latency = latency
+        self.correlation_id = None # of the stimulus which is being executed
+        self.updates = UpdateCoalescer(update_window, update_budget)
+
+        self.page_source = ''
+        self.page_digest = None
+        self.snapshots = SnapshotCache()
+        self.unchanged_snapshots = 0
+        self.diff_pool = diff_pool
+        self.diff_engine = diff_engine
+        self.diff_generation = 0 # diffs of an older generation are discarded
+
+        self.scope = None
+        if diff_scope:
+            self.scope = DiffScope(**diff_scope)
+
+
+    """ Prepare the SUT to start testing. """
+    def start(self):
+        raise NotImplementedError
+
+
+    """ Perform any cleanup when the SUT has stopped. """
+    def stop(self):
+        raise NotImplementedError
+
+
+    """
+    Prepare the SUT for the next test case without restarting it. Raises
+    when the SUT can not be reset in place, the Handler then restarts it.
+    """
+    def reset_session(self):
+        raise NotImplementedError
+
+
+    """
+    Navigates to the specified URL and generates a response.
+    param [String] url
+    """
+    def visit(self, url):
+        raise NotImplementedError
+
+
+    """
+    Simulates a click on an element specified by the CSS selector.
+    param [String] css_selector
+    """
+    def click(self, css_selector):
+        raise NotImplementedError
+
+
+    """
+    Simulates a click on a link element specified by the CSS selector and
+    generates a response.
+    param [String] css_selector
+    """
+    def click_link(self, css_selector):
+        raise NotImplementedError
+
+
+    """
+    Enters the provided value into an input field specified by the CSS
+    selector.
+    param [String] css_selector
+    param [String] value
+    """
+    def fill_in(self, css_selector, value):
+        raise NotImplementedError
+
+
+    """ Accepts the alert which is shown. """
+    def accept_alert(self):
+        raise NotImplementedError
+
+
+    """
+    The source of the page which is compared, limited to the diff scope.
+    return [String]
+    """
+    def page_html(self):
+        raise NotImplementedError
+
+
+    """
+    Capture the page which is compared.
+    return [(String|NodeTable, bytes)] the snapshot and its content hash
+    """
+    def capture_page(self):
+        html = self.page_html()
+        return html, self.snapshots.digest(html)
+
+
+    """
+    Store the current page as the snapshot later updates are compared with.
+    """
+    def take_snapshot(self):
+        self.page_source, self.page_digest = self.capture_page()
+
+
+    """
+    Forget the page snapshots, and drop the responses and page updates which
+    were not sent yet, including those of the diffs still in the diff pool.
+    """
+    def discard_page(self):
+        self.diff_generation += 1
+        self.responses.clear()
+        self.updates.clear()
+
+        self.page_source = ''
+        self.page_digest = None
+        self.snapshots.clear()
+
+
+    """
+    Detects the updates of the page since the previous check by comparing
+    the snapshots before and after, and generates a response; also called
+    while no stimuli arrive. With a diff pool the comparison is submitted to
+    a worker process and its response follows asynchronously.
+    """
+    def get_updates(self):
+        if not self.page_source:
+            return
+
+        after, after_digest = self.capture_page()
+
+        # Identical snapshots have no updates
+        if after_digest == self.page_digest:
+            self.unchanged_snapshots += 1
+            self.updates_checked()
+            return
+
+        if self.diff_pool != None:
+            generation = self.diff_generation
+            correlation_id = self.correlation_id
+            self.diff_pool.submit(snapshot_html(self.page_source), snapshot_html(after),
+                lambda nodes: self.diff_finished(nodes, generation, correlation_id),
+                self.diff_engine)
+        else:
+            before = self.snapshots.tree(self.page_digest, self.page_source)
+            after_tree = self.snapshots.tree(after_digest, after)
+
+            self.report_updates(group_actions(diff_trees(before, after_tree, self.diff_engine)),
+                self.correlation_id)
+
+        # The after snapshot is the before snapshot of the next check
+        self.page_source = after
+        self.page_digest = after_digest
+        self.updates_checked()
+
+
+    """
+    Called after every check for updates; e.g. to observe a new document.
+    """
+    def updates_checked(self):
+        pass
+
+
+    """
+    Report the updates of a diff which was computed by the diff pool, unless
+    the SUT was reset or stopped since it was submitted.
+    param [{String: [{String: String}]}] nodes
+    param [Integer] generation; diff generation when the diff was submitted
+    param [Integer] correlation_id; of the stimulus which was executed when
+    the diff was submitted
+    """
+    def diff_finished(self, nodes, generation, correlation_id):
+        if generation == self.diff_generation:
+            self.report_updates(nodes, correlation_id)
+
+
+    """
+    Add the response to the response queue of the Handler, together with the
+    correlation id of the stimulus which is being executed (None for updates
+    found while idle).
+    param [[String, {String : String}, {String: String}]] response
+    """
+    def handle_response(self, response):
+        self.queue_response(response, self.correlation_id)
+
+
+    """
+    Add the response to the response queue of the Handler.
+    param [[String, {String : String}, {String: String}]] response
+    param [Integer] correlation_id; of the stimulus which caused the response
+    """
+    def queue_response(self, response, correlation_id):
+        if response[0] != "page_update":
+            # The updates which were found before go first
+            self.flush_updates(force=True)
+
+        self.logger.debug("Sut", "Add response: {}", response)
+        self.responses.put((response, correlation_id))
+        if correlation_id != None and self.latency != None:
+            self.latency.stamp(correlation_id, "response_enqueued")
+
+
+    """
+    Generates a page_update response when there are updates, once the
+    updates of the update window are merged. The updates belong to the
+    stimulus which is being executed, e.g. a click which reports them when
+    the page has settled; updates found while idle have no correlation id.
+    param [{String: [{String: String}]}] nodes
+    param [Integer] correlation_id; of the stimulus which caused the updates
+    """
+    def report_updates(self, nodes, correlation_id):
+        if nodes:
+            if self.updates.belongs_to_other(correlation_id):
+                self.flush_updates(force=True)
+            self.updates.add(nodes, correlation_id)
+            self.flush_updates()
+
+
+    """
+    Generates the page_update of the merged updates when the update window
+    has passed.
+    param [Boolean] force; also when the window has not passed yet
+    """
+    def flush_updates(self, force=False):
+        if not force and not self.updates.due():
+            return
+
+        nodes, correlation_id = self.updates.take()
+        if nodes:
+            response = ["page_update", {'nodes': 'struct'},{'nodes': nodes}]
+            self.queue_response(response, correlation_id)
+
+
+"""
+The page source of a snapshot, for the diff pool which hands strings to its
+workers.
+param [String|NodeTable] snapshot
+return [String]
+"""
+def snapshot_html(snapshot):
+    if isinstance(snapshot, str):
+        return snapshot
+    return snapshot.html()
@@ -0,0 +1,245 @@
+import time
+from threading import Lock
+
+"""
+The {UpdateCoalescer} merges the page updates a SUT finds within a window of
+time into one page_update, and keeps the page_update within a byte budget.
+
+A page which animates or streams content otherwise produces a page_update on
+every idle check. The `nodes` of consecutive updates are concatenated per
+action name. An update of a text or attribute which was already updated in
+the window replaces the earlier update, so an element which changes on every
+check is reported once with its last value, and repeated identical updates
+are reported once. Inserted and deleted nodes shift the XPaths, so updates
+are only merged while no node was inserted or deleted in between.
+
+The updates of a window belong to the stimulus which caused them, so they
+are sent with its correlation id: the first stimulus which reports updates
+in the window. Updates found while idle join the window of the stimulus
+before them.
+
+When the merged update is larger than the budget, long field values are cut
+off first, with a "[truncated n chars]" marker; when that is not enough the
+remaining actions are dropped, and a `Truncated` entry records how many
+actions and bytes were left out.
+"""
+class UpdateCoalescer:
+    # Actions which set a value; a later one of the same node replaces an
+    # earlier one. Action name -> fields which identify what is set
+    SETTERS = {
+        "UpdateTextIn": ("node",),
+        "UpdateTextAfter": ("node",),
+        "UpdateAttrib": ("node", "name"),
+    }
+
+    # Actions which change the structure of the page
+    STRUCTURAL = ("InsertNode", "DeleteNode", "MoveNode")
+
+    # Characters a field value is cut off to when the update is over budget
+    FIELD_LIMIT = 256
+    TRUNCATED = "[truncated {} chars]"
+
+    # Bytes kept free for the Truncated entry, and the smallest budget
+    TRUNCATED_ROOM = 64
+    MIN_BUDGET = 2 * TRUNCATED_ROOM
+
+    """
+    param [Float] window; seconds updates are merged after the first one,
+    0 passes every update on by itself
+    param [Integer] budget; bytes of a page_update, 0 is unlimited, at
+    least MIN_BUDGET otherwise
+    """
+    def __init__(self, window=0.0, budget=0):
+        if 0 < budget < self.MIN_BUDGET:
+            raise ValueError("The update budget must be 0 or at least {} bytes, got {}".format(
+                self.MIN_BUDGET, budget))
+        self.window = window
+        self.budget = budget
+        self.lock = Lock()
+        self.nodes = {}
+        self.setters = {} # (action name, fields) -> index in self.nodes
+        self.first_at = None
+        self.correlation_id = None # of the stimulus the updates belong to
+
+        # Counters
+        self.merged = 0
+        self.deduplicated = 0
+        self.truncated = 0
+        self.dropped = 0
+
+
+    """
+    Add the nodes of an update to the window.
+    param [{String: [{String: String}]}] nodes
+    param [Integer] correlation_id; of the stimulus which caused the update,
+    None when it was found while idle
+    """
+    def add(self, nodes, correlation_id=None):
+        with self.lock:
+            if self.correlation_id is None:
+                self.correlation_id = correlation_id
+            if self.first_at is None:
+                self.first_at = time.monotonic()
+            else:
+                self.merged += 1
+
+            # Structural actions come first, like when the update is applied
+            if any(action_name in self.STRUCTURAL for action_name in nodes):
+                self.setters.clear()
+
+            for action_name, actions in nodes.items():
+                merged = self.nodes.setdefault(action_name, [])
+                fields = self.SETTERS.get(action_name)
+                for attributes in actions:
+                    if fields is None:
+                        merged.append(attributes)
+                        self.forget(action_name, attributes)
+                        continue
+
+                    key = (action_name,) + tuple(attributes.get(field) for field in fields)
+                    index = self.setters.get(key)
+                    if index is None:
+                        self.setters[key] = len(merged)
+                        merged.append(attributes)
+                        continue
+
+                    # Report the last value, compared with the first old value
+                    self.deduplicated += 1
+                    replaced = dict(attributes)
+                    if "oldtext" in merged[index]:
+                        replaced["oldtext"] = merged[index]["oldtext"]
+                    merged[index] = replaced
+
+
+    """
+    An attribute which is inserted or deleted ends the merging of its
+    updates; called with the lock held.
+    param [String] action_name
+    param [{String: String}] attributes
+    """
+    def forget(self, action_name, attributes):
+        if action_name in ("InsertAttrib", "DeleteAttrib"):
+            self.setters.pop(("UpdateAttrib", attributes.get("node"), attributes.get("name")), None)
+
+
+    """
+    Whether the window holds updates of another stimulus than the one
+    given, so they have to be sent before its updates are added.
+    param [Integer] correlation_id
+    return [Boolean]
+    """
+    def belongs_to_other(self, correlation_id):
+        with self.lock:
+            return self.first_at != None and correlation_id != None \
+                and self.correlation_id != correlation_id
+
+
+    """
+    Whether the window has passed and the merged update should be sent.
+    return [Boolean]
+    """
+    def due(self):
+        with self.lock:
+            return self.first_at != None and time.monotonic() - self.first_at >= self.window
+
+
+    """
+    Take the merged update of the window, within the budget.
+    return [({String: [{String: String}]}, Integer)] the nodes, None when
+    there is no update, and the correlation id they belong to
+    """
+    def take(self):
+        with self.lock:
+            nodes = {action_name: actions for action_name, actions in self.nodes.items() if actions}
+            correlation_id = self.correlation_id
+            self.clear_window()
+
+        if not nodes:
+            return None, correlation_id
+        if self.budget > 0 and nodes_size(nodes) > self.budget:
+            nodes = self.fit(nodes)
+        return nodes, correlation_id
+
+
+    """
+    Cut an update down to the budget.
+    param [{String: [{String: String}]}] nodes
+    return [{String: [{String: String}]}]
+    """
+    def fit(self, nodes):
+        self.truncated += 1
+        nodes = {action_name: [{field: self.cut(value) for field, value in attributes.items()}
+            for attributes in actions] for action_name, actions in nodes.items()}
+
+        size = nodes_size(nodes)
+        if size <= self.budget:
+            return nodes
+
+        # Keep the actions in order until the budget is spent, leaving room
+        # for the Truncated entry
+        remaining = self.budget - self.TRUNCATED_ROOM
+        kept = {}
+        dropped = 0
+        dropped_bytes = 0
+        for action_name, actions in nodes.items():
+            for attributes in actions:
+                action_size = len(action_name) + attributes_size(attributes)
+                if action_size <= remaining:
+                    kept.setdefault(action_name, []).append(attributes)
+                    remaining -= action_size
+                else:
+                    dropped += 1
+                    dropped_bytes += action_size
+
+        self.dropped += dropped
+        kept["Truncated"] = [{"actions": str(dropped), "bytes": str(dropped_bytes)}]
+        return kept
+
+
+    """
+    Cut off a long field value.
+    param [String] value
+    return [String]
+    """
+    def cut(self, value):
+        if len(value) <= self.FIELD_LIMIT:
+            return value
+        return value[:self.FIELD_LIMIT] + self.TRUNCATED.format(len(value) - self.FIELD_LIMIT)
+
+
+    """ Forget the updates of the window, e.g. on a reset. """
+    def clear(self):
+        with self.lock:
+            self.clear_window()
+
+
+    def clear_window(self):
+        self.nodes = {}
+        self.setters = {}
+        self.first_at = None
+        self.correlation_id = None
+
+
+    """
+    Counters of the coalescer.
+    return [{String: Integer}]
+    """
+    def stats(self):
+        with self.lock:
+            return {"merged": self.merged, "deduplicated": self.deduplicated,
+                "truncated": self.truncated, "dropped": self.dropped}
+
+
+"""
+Approximate size in bytes of the `nodes` of a page_update: the lengths of the
+action names, field names and values.
+param [{String: [{String: String}]}] nodes
+return [Integer]
+"""
+def nodes_size(nodes):
+    return sum(len(action_name) + attributes_size(attributes)
+        for action_name, actions in nodes.items() for attributes in actions)
+
+
+def attributes_size(attributes):
+    return sum(len(field) + len(value) for field, value in attributes.items())
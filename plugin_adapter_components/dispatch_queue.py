@@ -0,0 +1,107 @@
+import time
+from collections import deque
+from threading import Condition
+
+"""
+The {DispatchQueue} hands labels and responses over between the threads of
+the plugin adapter. It replaces the plain lists which were polled with
+sleeps: a consumer blocks on a condition variable and is woken up as soon as
+an item is put on the queue.
+
+Both ends of the queue are O(1), and the queue keeps counters on its depth
+and on how long items waited before they were taken off the queue.
+"""
+class DispatchQueue:
+    def __init__(self):
+        self.items = deque()
+        self.condition = Condition()
+        self.closed = False
+
+        # Counters
+        self.enqueued = 0
+        self.dequeued = 0
+        self.max_depth = 0
+        self.total_wait_ns = 0
+        self.max_wait_ns = 0
+
+
+    """ Special function: number of items waiting in the queue """
+    def __len__(self):
+        return len(self.items)
+
+
+    """
+    Put an item at the end of the queue and wake up a waiting consumer.
+    param [Object] item
+    """
+    def put(self, item):
+        with self.condition:
+            self.items.append((time.monotonic_ns(), item))
+            self.enqueued += 1
+            if len(self.items) > self.max_depth:
+                self.max_depth = len(self.items)
+            self.condition.notify()
+
+
+    """
+    Take the first item of the queue. Blocks until an item is available, the
+    timeout expires or the queue is closed.
+    param [Float] timeout; seconds to wait, None waits forever
+    return [Object] the item, or None when no item became available
+    """
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            if not self.items:
+                return None
+
+            enqueued_at, item = self.items.popleft()
+            self.dequeued += 1
+
+            waited = time.monotonic_ns() - enqueued_at
+            self.total_wait_ns += waited
+            if waited > self.max_wait_ns:
+                self.max_wait_ns = waited
+
+            return item
+
+
+    """ Remove all the items which are still waiting in the queue. """
+    def clear(self):
+        with self.condition:
+            self.items.clear()
+
+
+    """ Close the queue, all the waiting consumers are woken up. """
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+    """ Open a closed queue again, so consumers block on it again. """
+    def reopen(self):
+        with self.condition:
+            self.closed = False
+
+
+    """
+    Current depth and wait-time counters of the queue.
+    return [{String: Number}]
+    """
+    def stats(self):
+        with self.condition:
+            if self.dequeued:
+                mean_wait_ms = self.total_wait_ns / self.dequeued / 1e6
+            else:
+                mean_wait_ms = 0.0
+
+            return {
+                "depth": len(self.items),
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "dequeued": self.dequeued,
+                "mean_wait_ms": mean_wait_ms,
+                "max_wait_ms": self.max_wait_ns / 1e6,
+            }
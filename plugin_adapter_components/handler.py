@@ -1,12 +1,15 @@
+import importlib
 import sys
 import time
 from decimal import Decimal
-from threading import Thread
+from threading import Lock, RLock, Thread, active_count, current_thread
 from datetime import date
-from .client_side.sut import SeleniumSut
+from .dispatch_queue import DispatchQueue
+from .label_encoder import LabelEncoder
+from .outbound_scheduler import OutboundScheduler
 
 sys.path.insert(0, './api')
-from api.label_pb2 import Label
+from label_pb2 import Label
 """
 Domain specific adapter component. These are all the specific adapter methods
 that need to be implemented for a specific SUT.
@@ -22,19 +25,87 @@ Array = Value.Array
 Hash = Value.Hash
 Entry = Hash.Entry
 
+# The SUT backends the Handler can test, by name. The backends and their
+# dependencies (splinter, selenium, lxml, xmldiff) are only imported when
+# they are used, see Handler#preload.
+SUT_BACKENDS = {
+    "selenium": ".client_side.sut:SeleniumSut",
+    "simulated": ".client_side.simulated_sut:SimulatedSut",
+}
+
+# Modules the browser pool needs besides the SUT backend
+BROWSER_POOL_MODULES = [
+    ".client_side.browser_launcher",
+    ".client_side.browser_pool",
+    ".client_side.session_wipe",
+]
+
 
 class Handler:
-    def __init__(self, logger):
+    """
+    param [Logger] logger
+    param [{String: Object}] sut_options; keyword arguments for the SUT
+    param [{String: Integer}] pool_options; size and max_reuse of the
+    browser pool, None launches a new browser for every test case
+    param [String] reset_strategy; "relaunch" restarts the SUT on a reset,
+    "session" wipes the browser session and falls back to a relaunch when
+    the wipe fails
+    param [LatencyTracker] latency; None when latencies are not tracked
+    param [String] sut_backend; name of the SutBackend in SUT_BACKENDS
+    param [StartupProfile] startup; None when the startup is not profiled
+    param [Integer] diff_workers; worker processes the page updates are
+    computed in, 0 computes them in the event thread
+    param [{String: Number}] response_priorities; priority of the responses
+    by label name, lower priorities are sent first, see OutboundScheduler
+    """
+    def __init__(self, logger, sut_options=None, pool_options=None,
+            reset_strategy="relaunch", latency=None, sut_backend="selenium",
+            startup=None, diff_workers=0, response_priorities=None):
+        if sut_backend not in SUT_BACKENDS:
+            raise ValueError("Unknown SUT backend: {}".format(sut_backend))
+
         self.adapter_core = None  # callback to adapter; register separately
         self.configuration = []
+        self.sut_options = sut_options or {}
+        self.pool_options = pool_options
+        self.browser_pool = None
+        self.diff_workers = diff_workers
+        self.diff_pool = None
+        self.reset_strategy = reset_strategy
+        self.latency = latency
+        self.sut_backend_name = sut_backend
+        self.sut_backend = None # SutBackend class, imported by #load_sut_backend
+        self.preload_thread = None
+        self.startup = startup
+
+        # SUT which is started speculatively between the announcement and
+        # the configuration, see #warm_up
+        self.warm_up_lock = Lock()
+        self.warm_up_thread = None
+        self.warm_up_cancelled = False
+        self.warm_sut = None
+
+        # Encoders compiled from the label definitions, by label name
+        self.label_encoders = {}
 
         # Initialize empty SUT connections
         self.sut = None
+        self.sut_lock = RLock() # held while the SUT executes or is replaced
 
-        self.responses = []
+        # The workers which execute the stimuli and pass on the responses
+        # live as long as the Handler; a reset only replaces the SUT they use
+        self.responses = DispatchQueue()
+        self.event_queue = DispatchQueue()
         self.sut_thread = None
-        self.stop_sut_thread = False
-        self.event_queue = []
+        self.event_thread = None
+        self.response_priorities = response_priorities
+        self.outbound = None # OutboundScheduler the responses are sent by
+        self.stop_threads = False
+        self.worker_cpu = {} # worker name -> CPU seconds used by its thread
+        self.resets = 0
+
+        # Seconds without stimuli after which the SUT is checked for updates
+        self.idle_interval = 0.5
 
         # Initialize logger
         self.logger = logger
@@ -47,45 +118,266 @@ class Handler:
         self.adapter_core = adapter_core
 
 
-    def running_sut(self, stop):
-        while True:
-            if stop():
-                break
+    """
+    Import the SUT backend in a background thread, so its dependencies are
+    loaded while the adapter connects to AMP and announces itself, instead of
+    before connecting or after the configuration.
+    """
+    def preload(self):
+        self.preload_thread = Thread(target=self.preload_sut_backend,
+            name="sut-preload", daemon=True)
+        self.preload_thread.start()
 
-            if self.responses:
-                response = self.responses[0]
-                self.responses.pop(0)
-                self.response_received(response)
-            else:
-                time.sleep(0.1)
 
     """
-    SUT SPECIFIC
+    Preload the SUT backend; a failure is retried (and raised) by #start.
+    """
+    def preload_sut_backend(self):
+        try:
+            self.load_sut_backend()
+        except Exception as e:
+            self.logger.warning("Handler", "Preloading the SUT backend failed: {}", e)
+
+
+    """
+    Import the SUT backend, and the browser pool when it is used.
+    """
+    def load_sut_backend(self):
+        module_name, class_name = SUT_BACKENDS[self.sut_backend_name].split(":")
+        sut_backend = getattr(self.import_module(module_name), class_name)
+
+        if self.pool_options != None and sut_backend.uses_browser_pool:
+            for module_name in BROWSER_POOL_MODULES:
+                self.import_module(module_name)
+
+        self.sut_backend = sut_backend
+
+
+    """
+    Import a module of this package and profile the import.
+    param [String] module_name; relative to this package
+    return [module]
+    """
+    def import_module(self, module_name):
+        begin_ns = time.monotonic_ns()
+        module = importlib.import_module(module_name, __package__)
+        if self.startup != None:
+            self.startup.imported(module.__name__, begin_ns)
+        return module
 
-    The SUT has produced a response which needs to be passed on to AMP.
-    param[[key, type, value]]
+
+    """
+    Start the SUT in a background thread while the adapter waits for its
+    configuration, so #start only has to await the warm-up instead of a
+    browser cold start.
+    """
+    def warm_up(self):
+        with self.warm_up_lock:
+            if self.warm_up_thread != None or self.warm_sut != None:
+                return
+            self.warm_up_cancelled = False
+            self.warm_up_thread = Thread(target=self.warming_up, name="sut-warm-up", daemon=True)
+            self.warm_up_thread.start()
+
+
+    """
+    Create and start the SUT; a SUT which is warmed up after the warm-up was
+    cancelled is stopped again. A failure is retried (and raised) by #start.
     """
-    def response_received(self, response):
-        self.logger.debug("Handler", "response received: {}".format(response))
-        self.adapter_core.send_response(self.response(response[0], response[1], response[2]),
-            None, time.time_ns())
+    def warming_up(self):
+        self.logger.debug("Handler", "Warming up the SUT")
+        try:
+            sut = self.create_sut()
+            sut.start()
+        except Exception as e:
+            self.logger.warning("Handler", "Warming up the SUT failed: {}", e)
+            return
+
+        with self.warm_up_lock:
+            if not self.warm_up_cancelled:
+                self.warm_sut = sut
+                return
+
+        self.logger.debug("Handler", "The warm-up was cancelled, stopping the warmed up SUT")
+        sut.stop()
+
+
+    """
+    Cancel the warm-up of the SUT, e.g. when AMP sends an error or closes the
+    connection before the configuration.
+    param [Boolean] wait; wait until a warm-up which is still running has
+    finished (and stopped its SUT)
+    """
+    def cancel_warm_up(self, wait=False):
+        with self.warm_up_lock:
+            self.warm_up_cancelled = True
+            thread = self.warm_up_thread
+            sut = self.warm_sut
+            self.warm_sut = None
+
+        if sut != None:
+            sut.stop()
+        if wait and thread != None:
+            thread.join()
+
+
+    """
+    Await the warm-up of the SUT.
+    return [SutBackend] the warmed up SUT, None when it was not warmed up
+    """
+    def take_warm_sut(self):
+        with self.warm_up_lock:
+            thread = self.warm_up_thread
+        if thread != None:
+            thread.join()
+
+        with self.warm_up_lock:
+            sut = self.warm_sut
+            self.warm_sut = None
+            self.warm_up_thread = None
+        return sut
+
+
+    """
+    Create a SUT of the SUT backend, with its own response queue.
+    return [SutBackend]
+    """
+    def create_sut(self):
+        if self.preload_thread != None:
+            self.preload_thread.join()
+        if self.sut_backend is None:
+            self.load_sut_backend()
+
+        if self.pool_options != None and self.browser_pool is None \
+                and self.sut_backend.uses_browser_pool:
+            from .client_side.browser_launcher import BrowserLauncher
+            from .client_side.browser_pool import BrowserPool
+            from .client_side.session_wipe import wipe_browser_session
+
+            launcher = BrowserLauncher(lean=self.sut_options.get("browser_profile"),
+                cache=self.sut_options.get("browser_cache"))
+            self.browser_pool = BrowserPool(launcher, self.logger,
+                recycle=lambda browser: wipe_browser_session(browser, self.logger),
+                **self.pool_options)
+
+        if self.diff_workers > 0 and self.diff_pool is None:
+            from .client_side.diff_pool import DiffPool
+            self.diff_pool = DiffPool(self.diff_workers, self.logger)
+
+        return self.sut_backend(self.logger, self.responses, self.event_queue,
+            browser_pool=self.browser_pool, latency=self.latency,
+            diff_pool=self.diff_pool, **self.sut_options)
+
+
+    """
+    Execute a loop until the stop condition is met, pass the responses of the
+    SUT on to the outbound scheduler as soon as they are put on the response
+    queue.
+    param [function] stop
+    """
+    def running_sut(self, stop):
+        responses = self.responses
+        while not stop():
+            # The timeout only bounds how long a stop request set from
+            # another thread can go unnoticed; responses wake us directly.
+            item = responses.get(timeout=self.idle_interval)
+            if item is not None:
+                response, correlation_id = item
+                self.outbound.put(response, correlation_id)
+            self.worker_cpu["responses"] = time.thread_time()
+
+
+    """
+    Encode and serialize a response of the SUT for the outbound scheduler.
+    param [[key, type, value]] response
+    param [Integer] timestamp
+    return [bytes] None when the response can not be sent
+    """
+    def encode_response(self, response, timestamp):
+        self.logger.debug("Handler", "response received: {}", response)
+        return self.adapter_core.response_frame(self.response(response[0], response[1], response[2]),
+            timestamp)
+
 
     """
     SUT SPECIFIC
 
-    Prepare the SUT to start testing.
+    Prepare the SUT to start testing, with the warmed up SUT when there is
+    one.
     """
     def start(self):
-        self.responses = []
-        self.sut = SeleniumSut(self.logger, self.responses, self.event_queue)
-        self.sut.start()
-        self.stop_thread = False
-        self.stop_event_thread = False
-        self.sut_thread = Thread(target=self.running_sut, args=(lambda: self.stop_sut_thread,))
-        self.event_thread = Thread(target=self.running_event, args=(lambda: self.stop_event_thread,))
+        sut = self.take_warm_sut()
+        if sut is None:
+            sut = self.create_sut()
+            sut.start()
+        else:
+            self.logger.debug("Handler", "Starting with the warmed up SUT")
+
+        with self.sut_lock:
+            self.sut = sut
+        self.start_workers()
+
+
+    """
+    Start the worker threads, unless they are already running.
+    """
+    def start_workers(self):
+        if self.sut_thread != None:
+            return
+
+        self.stop_threads = False
+        # The queues are shared with the SUTs, so they are reopened rather
+        # than replaced after #stop_workers closed them
+        self.responses.reopen()
+        self.event_queue.reopen()
+        self.outbound = OutboundScheduler(self.encode_response,
+            lambda frame, correlation_id: self.adapter_core.send_frame(frame, correlation_id),
+            self.logger, self.response_priorities)
+        self.outbound.start()
+        self.sut_thread = Thread(target=self.running_sut, args=(lambda: self.stop_threads,),
+            name="handler-responses")
+        self.event_thread = Thread(target=self.running_event, args=(lambda: self.stop_threads,),
+            name="handler-events")
         self.event_thread.start()
         self.sut_thread.start()
 
+
+    """
+    Stop the worker threads and wait until they have finished; responses
+    which were not sent yet are dropped.
+    param [Float] timeout; seconds to wait for each worker
+    """
+    def stop_workers(self, timeout=10):
+        self.stop_threads = True
+        self.responses.close()
+        self.event_queue.close()
+
+        for thread in [self.event_thread, self.sut_thread]:
+            if thread != None and thread is not current_thread():
+                thread.join(timeout)
+                if thread.is_alive():
+                    self.logger.warning("Handler", "Worker {} did not stop within {} s", thread.name, timeout)
+        if self.outbound != None:
+            self.outbound.close(timeout)
+
+        self.sut_thread = None
+        self.event_thread = None
+
+
+    """
+    Thread and CPU usage of the adapter, to check that long test suites do
+    not leak threads or CPU.
+    return [{String: Number}]
+    """
+    def worker_stats(self):
+        return {
+            "threads": active_count(),
+            "process_cpu_s": round(time.process_time(), 3),
+            "response_worker_cpu_s": round(self.worker_cpu.get("responses", 0.0), 3),
+            "event_worker_cpu_s": round(self.worker_cpu.get("events", 0.0), 3),
+            "resets": self.resets,
+        }
+
     """
     SUT SPECIFIC
 
@@ -94,29 +386,69 @@ class Handler:
     """
     def reset(self):
         self.logger.info("Handler", "Resetting the sut for new test cases")
-        self.stop()
-        self.start()
+        self.resets += 1
+        self.logger.debug("Handler", "Workers: {}", self.worker_stats())
+
+        with self.sut_lock:
+            self.event_queue.clear()
+            if self.outbound != None:
+                self.outbound.clear()
+
+            if self.reset_strategy == "session":
+                try:
+                    self.sut.reset_session()
+                    return
+                except Exception as e:
+                    self.logger.warning("Handler", "In-session reset failed, relaunching the browser: {}", e)
+
+            self.stop(final=False)
+            self.start()
 
-        
 
     """
     SUT SPECIFIC
 
     Stop the SUT from testing.
+    param [Boolean] final; False when the SUT is restarted afterwards, the
+    workers and the browser pool are then kept
     """
-    def stop(self):
+    def stop(self, final=True):
         self.logger.info("Handler", "Stopping the plugin adapter from plugin handler")
 
-        self.sut.stop()
-        self.sut = None
+        if final:
+            self.cancel_warm_up(wait=True)
 
-        self.stop_sut_thread = True
-        self.sut_thread.join()
-        self.sut_thread = None
+        if final:
+            # Stop taking stimuli before the SUT is stopped
+            self.stop_workers()
+
+        with self.sut_lock:
+            sut = self.sut
+            self.sut = None
+        if sut != None:
+            sut.stop()
+
+        if final:
+            self.logger.debug("Handler", "Response queue: {}", self.responses.stats())
+            self.logger.debug("Handler", "Event queue: {}", self.event_queue.stats())
+            if self.outbound != None:
+                self.logger.debug("Handler", "Outbound: {}", self.outbound.stats())
+            self.logger.debug("Handler", "Workers: {}", self.worker_stats())
+            self.close_pools()
 
         self.logger.debug("Handler", "Finished stopping the plugin adapter from plugin handler")
 
 
+    """ Close the browser pool and the diff pool. """
+    def close_pools(self):
+        if self.browser_pool != None:
+            self.browser_pool.close()
+            self.browser_pool = None
+        if self.diff_pool != None:
+            self.diff_pool.close()
+            self.diff_pool = None
+
+
     """
     Generate a protobuf Stimulus Label.
     return [label_pb2.Label]
@@ -126,12 +458,21 @@ class Handler:
 
 
     """
-    Generate a protobuf Response Label.
+    Generate a protobuf Response Label. Labels with values are encoded by the
+    encoder compiled from the label definition in #supported_labels when
+    there is one.
     return [label_pb2.Label]
     """  
     def response(self, label_name, parameters_type, parameters_value=None):
         if parameters_value == None or parameters_value == {}:
+            # A label definition, compile its encoder for the responses
+            self.label_encoders[label_name] = LabelEncoder(label_name, 1,
+                parameters_type, self.logger)
             return self.generate_type_label(label_name, 1, parameters_type)
+
+        encoder = self.label_encoders.get(label_name)
+        if encoder != None and encoder.matches(parameters_type):
+            return encoder.encode(parameters_value)
         else:
             return self.generate_value_label(label_name, 1, parameters_type, parameters_value)
 
@@ -165,7 +506,7 @@ class Handler:
     return [String] The physical label.
     """
     def stimulate(self, label):
-        self.event_queue.append(label)
+        self.event_queue.put(label)
 
 
 
@@ -231,7 +572,7 @@ class Handler:
             elif param_type == "struct":
                 pb_value.struct.CopyFrom(self.encodeDict(value))
             else:
-                self.logger.warning("Handler", "UNKNOWN TYPE FOR PARAM/STIMULUS in generate value: {}".format(param_type))
+                self.logger.warning("Handler", "UNKNOWN TYPE FOR PARAM/STIMULUS in generate value: {}", param_type)
 
             param = Parameter(name=param_name, value=pb_value)
             pb_params += [param]
@@ -279,7 +620,7 @@ class Handler:
         elif param_type == "struct":
             value = {}
         else:
-            self.logger.warning("Handler", "UNKNOWN TYPE FOR PARAM/STIMULUS in generate type: {}".format(param_type))
+            self.logger.warning("Handler", "UNKNOWN TYPE FOR PARAM/STIMULUS in generate type: {}", param_type)
 
         return pb_value, value
 
@@ -325,27 +666,56 @@ class Handler:
     param [function] stop
     """
     def running_event(self, stop):
-        while True:
+        while not stop():
+            label = self.event_queue.get(timeout=self.idle_interval)
             if stop():
                 break
 
-            if self.event_queue:
-                label = self.event_queue[0]
-                self.event_queue.pop(0)
-                match label.label:
-                    case 'click':
-                        self.sut.click(label.parameters[0].value.string)
-                    case 'visit':
-                        self.sut.visit(label.parameters[0].value.string)
-                    case 'fill_in':
-                        self.sut.fill_in(label.parameters[0].value.string, label.parameters[1].value.string)
-                    case 'click_link':
-                        self.sut.click_link(label.parameters[0].value.string)
-                    case _:
-                        self.logger.warning("Handler", f"Unknown label: {label.label}")
-            else:
-                self.sut.get_updates()
-                time.sleep(0.5)
+            # The SUT is not replaced while it executes a label
+            with self.sut_lock:
+                sut = self.sut
+                if sut is None:
+                    # Between a stop and a start of the SUT
+                    continue
+
+                try:
+                    if label is not None:
+                        self.execute(sut, label)
+                    else:
+                        sut.get_updates()
+                    sut.flush_updates()
+                except Exception as e:
+                    self.logger.error("Handler", "The SUT failed: {}", e)
+                finally:
+                    sut.correlation_id = None
+            self.worker_cpu["events"] = time.thread_time()
+
+
+    """
+    Execute a stimulus label on the SUT.
+    param [SutBackend] sut
+    param [label_pb2.Label] label
+    """
+    def execute(self, sut, label):
+        correlation_id = label.correlation_id
+        if self.latency != None:
+            self.latency.stamp(correlation_id, "dequeued")
+
+        sut.correlation_id = correlation_id
+        match label.label:
+            case 'click':
+                sut.click(label.parameters[0].value.string)
+            case 'visit':
+                sut.visit(label.parameters[0].value.string)
+            case 'fill_in':
+                sut.fill_in(label.parameters[0].value.string, label.parameters[1].value.string)
+            case 'click_link':
+                sut.click_link(label.parameters[0].value.string)
+            case _:
+                self.logger.warning("Handler", f"Unknown label: {label.label}")
+
+        if self.latency != None:
+            self.latency.stamp(correlation_id, "sut_done")
 
 
     """
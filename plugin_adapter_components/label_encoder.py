@@ -0,0 +1,187 @@
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, './api')
+from label_pb2 import Label
+
+"""
+The {LabelEncoder} builds the protobuf Label of one label type with filled in
+parameter values.
+
+The encoder is compiled once from the parameter types of the label: every
+parameter gets a setter which writes its value directly into the message
+that is being built. Arrays, structs and their nested values are added in
+place with `add()`, so no intermediate messages are created and no subtree
+is copied, contrary to the CopyFrom based encoding in the {Handler}.
+
+The encoding is the same as the one of Handler.generate_value_label and
+Handler.encodeToValue.
+"""
+class LabelEncoder:
+    """
+    param [String] label_name
+    param [label_pb2.Label.LabelType] label_type
+    param [dict] parameters_type
+    param [Logger] logger
+    """
+    def __init__(self, label_name, label_type, parameters_type, logger):
+        self.label_name = label_name
+        self.label_type = label_type
+        self.parameters_type = dict(parameters_type)
+        self.logger = logger
+
+        self.setters = [(param_name, self.compile_setter(param_type))
+            for param_name, param_type in parameters_type.items()]
+
+
+    """
+    Check if the encoder was compiled for the given parameter types.
+    param [dict] parameters_type
+    return [Boolean]
+    """
+    def matches(self, parameters_type):
+        return self.parameters_type == parameters_type
+
+
+    """
+    Generate a protobuf Label containing parameters with filled in values.
+    param [dict] parameters_value
+    return [label_pb2.Label]
+    """
+    def encode(self, parameters_value):
+        pb_label = Label(label=self.label_name, type=self.label_type,
+            channel="extern")
+
+        parameters = pb_label.parameters
+        for param_name, setter in self.setters:
+            param = parameters.add()
+            param.name = param_name
+            setter(param.value, parameters_value.get(param_name))
+
+        pb_label.timestamp = time.time_ns()
+
+        return pb_label
+
+
+    """
+    Select the setter of a parameter type.
+    param [String] param_type
+    return [function] setter(pb_value, value)
+    """
+    def compile_setter(self, param_type):
+        setter = PARAMETER_SETTERS.get(param_type)
+        if setter is None:
+            self.logger.warning("LabelEncoder", "UNKNOWN TYPE FOR PARAM/STIMULUS in generate value: {}", param_type)
+            return set_nothing
+        return setter
+
+
+def set_nothing(pb_value, value):
+    pass
+
+def set_string(pb_value, value):
+    pb_value.string = value
+
+def set_integer(pb_value, value):
+    pb_value.integer = value
+
+def set_decimal(pb_value, value):
+    pb_value.decimal = value
+
+def set_boolean(pb_value, value):
+    pb_value.boolean = value
+
+def set_date(pb_value, value):
+    pb_value.date = value
+
+def set_time(pb_value, value):
+    pb_value.time = value
+
+
+"""
+Encode a list into the array of a protobuf Value, in place.
+param [label_pb2.Label.Parameter.Value] pb_value
+param [list] source
+"""
+def set_array(pb_value, source):
+    pb_array = pb_value.array
+    pb_array.SetInParent()
+    values = pb_array.values
+    for item in source:
+        encode_value(values.add(), item)
+
+
+"""
+Encode a dictionary into the struct of a protobuf Value, in place.
+param [label_pb2.Label.Parameter.Value] pb_value
+param [dict] source
+"""
+def set_struct(pb_value, source):
+    pb_hash = pb_value.struct
+    pb_hash.SetInParent()
+    entries = pb_hash.entries
+    for key, item in source.items():
+        pb_entry = entries.add()
+        pb_entry.key.string = key
+        encode_value(pb_entry.value, item)
+
+
+"""
+Encode a value into a protobuf Value, in place. Values of an unsupported
+type leave the Value empty.
+param [label_pb2.Label.Parameter.Value] pb_value
+param [any] var
+"""
+def encode_value(pb_value, var):
+    setter = VALUE_SETTERS.get(type(var))
+    if setter is None:
+        setter = value_setter_of_subclass(var)
+    setter(pb_value, var)
+
+
+"""
+Setter of a value whose type is a subclass of a supported type, checked in
+the same order as Handler.encodeToValue.
+param [any] var
+return [function]
+"""
+def value_setter_of_subclass(var):
+    for value_type, setter in SUBCLASS_SETTERS:
+        if isinstance(var, value_type):
+            return setter
+    return set_nothing
+
+
+# Setters of the parameter types used in the label definitions
+PARAMETER_SETTERS = {
+    "string": set_string,
+    "integer": set_integer,
+    "decimal": set_decimal,
+    "boolean": set_boolean,
+    "date": set_date,
+    "time": set_time,
+    "array": set_array,
+    "struct": set_struct,
+}
+
+# Setters of nested values by Python type. Booleans are encoded as integers,
+# like Handler.encodeToValue does (bool is a subclass of int).
+VALUE_SETTERS = {
+    str: set_string,
+    int: set_integer,
+    float: set_decimal,
+    bool: set_integer,
+    date: set_date,
+    list: set_array,
+    dict: set_struct,
+}
+
+SUBCLASS_SETTERS = [
+    (str, set_string),
+    (int, set_integer),
+    (float, set_decimal),
+    (date, set_date),
+    (list, set_array),
+    (dict, set_struct),
+]
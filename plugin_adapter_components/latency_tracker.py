@@ -0,0 +1,262 @@
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+
+"""
+The {LatencyTracker} follows every stimulus label through the adapter
+pipeline and keeps latency histograms per label name and pipeline stage.
+
+A stimulus is identified by its correlation id. It is stamped when it passes
+each of the STAGES; the time since the previous stamp of the same label is
+recorded as the latency of the stage, and the time since the label was
+received is recorded as the `total` when its response frame is written;
+the trace of the label is then dropped, so only the labels in flight are
+followed.
+
+The percentiles (p50/p95/p99) are computed over the most recent samples, and
+can be written as JSON or as Prometheus text exposition to a file or served
+on a localhost HTTP endpoint. A dump requested from a signal handler is
+written by a reporter thread, as the handler may interrupt a thread holding
+the lock.
+"""
+class LatencyTracker:
+    STAGES = [
+        "received",          # frame received by the BrokerConnection
+        "confirmed",         # confirmation sent by the AdapterCore
+        "dequeued",          # taken off the event queue by the Handler
+        "sut_done",          # SUT action finished
+        "response_enqueued", # response put on the response queue
+        "response_written",  # response frame written to the websocket
+    ]
+
+    QUANTILES = [0.5, 0.95, 0.99]
+
+    """
+    param [Integer] max_traces; number of labels which are followed at once
+    param [Integer] max_samples; number of samples kept per label and stage
+    """
+    def __init__(self, max_traces=10000, max_samples=10000):
+        self.max_traces = max_traces
+        self.max_samples = max_samples
+        self.lock = Lock()
+        self.traces = OrderedDict() # correlation_id -> [label_name, received_ns, last_ns, stages]
+        self.samples = {} # (label_name, stage) -> deque of latencies in ns
+        self.totals = {} # (label_name, stage) -> [count, sum in ns]
+        self.server = None
+        self.report_path = None
+        self.report_requested = Event()
+        self.closed = False
+
+
+    """
+    Start following a stimulus label.
+    param [Integer] correlation_id
+    param [String] label_name
+    param [Integer] received_ns; time.monotonic_ns() when the frame arrived
+    """
+    def begin(self, correlation_id, label_name, received_ns=None):
+        if received_ns is None:
+            received_ns = time.monotonic_ns()
+
+        with self.lock:
+            self.traces[correlation_id] = [label_name, received_ns, received_ns, {"received"}]
+            self.traces.move_to_end(correlation_id)
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+
+
+    """
+    Stamp a stage of a stimulus label. Only the first time a label passes a
+    stage is recorded.
+    param [Integer] correlation_id
+    param [String] stage
+    """
+    def stamp(self, correlation_id, stage):
+        now = time.monotonic_ns()
+
+        with self.lock:
+            trace = self.traces.get(correlation_id)
+            if trace is None or stage in trace[3]:
+                return
+
+            label_name, received_ns, last_ns, stages = trace
+            stages.add(stage)
+            trace[2] = now
+            self.record(label_name, stage, now - last_ns)
+
+            if stage == "response_written":
+                self.record(label_name, "total", now - received_ns)
+                del self.traces[correlation_id]
+
+
+    """
+    Add a latency sample; the lock must be held.
+    param [String] label_name
+    param [String] stage
+    param [Integer] latency_ns
+    """
+    def record(self, label_name, stage, latency_ns):
+        key = (label_name, stage)
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen=self.max_samples)
+            self.totals[key] = [0, 0]
+
+        self.samples[key].append(latency_ns)
+        self.totals[key][0] += 1
+        self.totals[key][1] += latency_ns
+
+
+    """
+    Percentiles per label name and stage, in milliseconds.
+    return [{String: {String: {String: Number}}}]
+    """
+    def summary(self):
+        with self.lock:
+            snapshot = [(key, sorted(samples), list(self.totals[key]))
+                for key, samples in self.samples.items()]
+
+        summary = {}
+        for (label_name, stage), samples, (count, total_ns) in snapshot:
+            stats = {"count": count, "mean_ms": total_ns / count / 1e6}
+            for quantile in self.QUANTILES:
+                stats["p{}".format(int(quantile * 100))] = percentile(samples, quantile) / 1e6
+            summary.setdefault(label_name, {})[stage] = stats
+
+        return summary
+
+
+    """
+    The histograms as JSON.
+    return [String]
+    """
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2, sort_keys=True)
+
+
+    """
+    The histograms as Prometheus text exposition (summaries in seconds).
+    return [String]
+    """
+    def to_prometheus(self):
+        name = "adapter_label_stage_latency_seconds"
+        lines = [
+            "# HELP {} Latency of an adapter pipeline stage per label.".format(name),
+            "# TYPE {} summary".format(name),
+        ]
+
+        with self.lock:
+            snapshot = [(key, sorted(samples), list(self.totals[key]))
+                for key, samples in self.samples.items()]
+
+        for (label_name, stage), samples, (count, total_ns) in sorted(snapshot):
+            labels = 'label="{}",stage="{}"'.format(label_name, stage)
+            for quantile in self.QUANTILES:
+                lines.append('{}{{{},quantile="{}"}} {:.9f}'.format(name, labels,
+                    quantile, percentile(samples, quantile) / 1e9))
+            lines.append("{}_sum{{{}}} {:.9f}".format(name, labels, total_ns / 1e9))
+            lines.append("{}_count{{{}}} {}".format(name, labels, count))
+
+        return "\n".join(lines) + "\n"
+
+
+    """
+    Write the histograms to a file: Prometheus text exposition for files
+    ending in .prom or .txt, JSON otherwise.
+    param [String] path
+    """
+    def dump(self, path):
+        if path.endswith(".prom") or path.endswith(".txt"):
+            content = self.to_prometheus()
+        else:
+            content = self.to_json()
+
+        with open(path, "w") as report:
+            report.write(content)
+
+
+    """
+    Write the histograms to a file whenever a dump is requested, from a
+    reporter thread.
+    param [String] path
+    """
+    def report_to(self, path):
+        self.report_path = path
+        Thread(target=self.report, name="latency-report", daemon=True).start()
+
+
+    """
+    Request a dump of the histograms to the report file. Only sets a flag,
+    so it is safe to call from a signal handler.
+    """
+    def request_dump(self):
+        self.report_requested.set()
+
+
+    """ Reporter thread: dump the histograms on every request. """
+    def report(self):
+        while True:
+            self.report_requested.wait()
+            self.report_requested.clear()
+            if self.closed:
+                return
+            try:
+                self.dump(self.report_path)
+            except OSError:
+                pass
+
+
+    """
+    Serve the histograms on localhost: /metrics as Prometheus text
+    exposition and /latency.json as JSON.
+    param [Integer] port
+    """
+    def serve(self, port):
+        tracker = self
+
+        class LatencyRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = tracker.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/latency.json":
+                    body, content_type = tracker.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), LatencyRequestHandler)
+        Thread(target=self.server.serve_forever, name="latency-endpoint", daemon=True).start()
+
+
+    """ Stop serving the histograms and the reporter thread. """
+    def close(self):
+        self.closed = True
+        self.report_requested.set()
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+"""
+Nearest-rank percentile of sorted samples.
+param [[Integer]] samples
+param [Float] quantile
+return [Integer]
+"""
+def percentile(samples, quantile):
+    if not samples:
+        return 0
+    return samples[max(0, math.ceil(quantile * len(samples)) - 1)]
@@ -7,10 +7,14 @@ of a BLE-chip through PyBluez.
 
 """
 
-import inspect
-import types
-from typing import cast
+import atexit
+import logging
+import sys
+import time
 from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from queue import SimpleQueue
+from threading import Thread
 
 class Logger:
     #Constants used to indicate the log level
@@ -23,6 +27,8 @@ class Logger:
 
     def __init__(self):
         self.logLevel = self.LOG_WARNING     # By default show only the warnings and errors
+        self.capture_caller = True           # Add the name of the calling function
+        self.writer = None                   # Background writer; None prints on the calling thread
 
 
     """
@@ -34,51 +40,95 @@ class Logger:
 
 
     """
-    Dump a logger info message to the stdout
+    Write the log entries from a background thread instead of the calling
+    thread.
+    param [String] path; file to write to, None writes to the stdout
+    param [Integer] max_bytes; size at which the log file is rotated
+    param [Integer] backups; number of rotated log files which are kept
+    """
+    def log_to(self, path=None, max_bytes=10 * 1024 * 1024, backups=3):
+        self.close()
+        self.writer = LogWriter(path, max_bytes, backups)
+        atexit.register(self.close)
+
+
+    """ Write the pending log entries and stop the background writer. """
+    def close(self):
+        if self.writer != None:
+            writer = self.writer
+            self.writer = None
+            writer.close()
+
+
+    """
+    Dump a logger info message to the stdout. The message is only formatted
+    with the arguments when the entry is logged.
     param [String] class_name; shall be the class name of the function calling the logger
     param [String] msg; shall contain message to log
+    param [Object] args; values for the {} fields in the message
     """
-    def info(self, class_name, msg):
+    def info(self, class_name, msg, *args):
         if self.LOG_INFO <= self.logLevel:
-            fname = inspect.currentframe().f_back.f_code.co_name
-            m = "[{}] INFO    {}::{}: {}".format(self.timestamp(), class_name, fname, msg)
-            self.log_entry(self.LOG_INFO, m)
+            self.log(self.LOG_INFO, "INFO", class_name, msg, args)
 
 
     """
-    Dump a logger debug message to the stdout
+    Dump a logger debug message to the stdout. The message is only formatted
+    with the arguments when the entry is logged.
     param [String] class_name; shall be the class name of the function calling the logger
     param [String] msg; shall contain message to log
+    param [Object] args; values for the {} fields in the message
     """
-    def debug(self, class_name, msg):
+    def debug(self, class_name, msg, *args):
         if self.LOG_DEBUG <= self.logLevel:
-            fname = inspect.currentframe().f_back.f_code.co_name
-            m = "[{}] DEBUG   {}::{}: {}".format(self.timestamp(), class_name, fname, msg)
-            self.log_entry(self.LOG_DEBUG, m)
+            self.log(self.LOG_DEBUG, "DEBUG", class_name, msg, args)
 
 
     """
-    Dump a logger warning message to the stdout
+    Dump a logger warning message to the stdout. The message is only
+    formatted with the arguments when the entry is logged.
     param [String] class_name; shall be the class name of the function calling the logger
     param [String] msg; shall contain message to log
+    param [Object] args; values for the {} fields in the message
     """
-    def warning(self, class_name, msg):
+    def warning(self, class_name, msg, *args):
         if self.LOG_WARNING <= self.logLevel:
-            fname = inspect.currentframe().f_back.f_code.co_name
-            m = "[{}] WARNING {}::{}: {}".format(self.timestamp(), class_name, fname, msg)
-            self.log_entry(self.LOG_WARNING, m)
+            self.log(self.LOG_WARNING, "WARNING", class_name, msg, args)
 
 
     """
-    Dump a logger error message to the stdout
+    Dump a logger error message to the stdout. The message is only formatted
+    with the arguments when the entry is logged.
     param [String] class_name; shall be the class name of the function calling the logger
     param [String] msg; shall contain message to log
+    param [Object] args; values for the {} fields in the message
     """
-    def error(self, class_name, msg):
+    def error(self, class_name, msg, *args):
         if self.LOG_ERROR <= self.logLevel:
-            fname = inspect.currentframe().f_back.f_code.co_name
-            m = "[{}] ERROR   {}::{}: {}".format(self.timestamp(), class_name, fname, msg)
-            self.log_entry(self.LOG_ERROR, m)
+            self.log(self.LOG_ERROR, "ERROR", class_name, msg, args)
+
+
+    """
+    Format a log entry and hand it to the writer.
+    param [Integer] level
+    param [String] level_name
+    param [String] class_name
+    param [String] msg
+    param [(Object)] args
+    """
+    def log(self, level, level_name, class_name, msg, args):
+        if args:
+            msg = msg.format(*args)
+
+        source = class_name
+        if self.capture_caller:
+            # Frame 0 is this method, 1 the level method, 2 its caller
+            source = "{}::{}".format(class_name, sys._getframe(2).f_code.co_name)
+
+        if self.writer != None:
+            self.writer.write(time.time(), level_name, source, msg)
+        else:
+            self.log_entry(level, format_entry(time.time(), level_name, source, msg))
 
 
     """
@@ -96,3 +146,73 @@ class Logger:
     """
     def timestamp(self):
         return datetime.now()
+
+
+"""
+Format a log entry as a line.
+param [Float] created; seconds since the epoch
+param [String] level_name
+param [String] source
+param [String] msg
+return [String]
+"""
+def format_entry(created, level_name, source, msg):
+    return "[{}] {:<7} {}: {}".format(datetime.fromtimestamp(created), level_name, source, msg)
+
+
+"""
+The {LogWriter} writes log entries from a background thread, to the stdout or
+to a rotating log file. Entries are put on a queue by the logging threads and
+only formatted and written by the writer thread.
+"""
+class LogWriter:
+    """
+    param [String] path; file to write to, None writes to the stdout
+    param [Integer] max_bytes; size at which the log file is rotated
+    param [Integer] backups; number of rotated log files which are kept
+    """
+    def __init__(self, path=None, max_bytes=10 * 1024 * 1024, backups=3):
+        self.file_handler = None
+        if path != None:
+            self.file_handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                backupCount=backups, encoding="utf-8")
+
+        self.entries = SimpleQueue()
+        self.thread = Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+
+    """
+    Queue a log entry.
+    param [Float] created
+    param [String] level_name
+    param [String] source
+    param [String] msg
+    """
+    def write(self, created, level_name, source, msg):
+        self.entries.put((created, level_name, source, msg))
+
+
+    """ Write the queued entries until the writer is closed. """
+    def run(self):
+        while True:
+            entry = self.entries.get()
+            if entry is None:
+                break
+
+            line = format_entry(*entry)
+            if self.file_handler != None:
+                self.file_handler.emit(logging.makeLogRecord({"msg": line}))
+            else:
+                sys.stdout.write(line + "\n")
+
+            if self.entries.empty():
+                sys.stdout.flush()
+
+
+    """ Write the queued entries and stop the writer thread. """
+    def close(self):
+        self.entries.put(None)
+        self.thread.join()
+        if self.file_handler != None:
+            self.file_handler.close()
@@ -0,0 +1,277 @@
+import heapq
+import time
+from collections import deque
+from threading import Condition, Thread
+
+from .dispatch_queue import DispatchQueue
+
+"""
+The {OutboundScheduler} sends the responses of the SUT to AMP by priority of
+their label type instead of strictly first in, first out, so a small
+page_title response which AMP waits for is not queued behind a page_update of
+megabytes.
+
+The responses of one stimulus (correlation id) are still sent in the order
+they were produced, as are the responses without a correlation id; only
+responses of different stimuli overtake each other.
+
+Large responses are encoded and serialized by an encoder thread as soon as
+they are queued, so the sender only writes their frame once their turn has
+come, and small responses are not held up by the encoding. The scheduler
+keeps the queueing delay, from queueing to sending, per label type.
+"""
+class OutboundScheduler:
+    # Lower priorities are sent first
+    DEFAULT_PRIORITIES = {
+        "page_title": 0,
+        "page_update": 1,
+    }
+    DEFAULT_PRIORITY = 1
+
+    """
+    param [function] encode; called with a response and its timestamp,
+    returns the serialized frame, or None when it can not be sent
+    param [function] send; called with a frame and its correlation id
+    param [Logger] logger
+    param [{String: Number}] priorities; by label name, on top of
+    DEFAULT_PRIORITIES
+    param [Integer] large_size; values in a response from which it is
+    encoded by the encoder thread, see payload_size
+    """
+    def __init__(self, encode, send, logger, priorities=None, large_size=500):
+        self.encode = encode
+        self.send = send
+        self.logger = logger
+        self.priorities = dict(self.DEFAULT_PRIORITIES)
+        self.priorities.update(priorities or {})
+        self.large_size = large_size
+
+        self.condition = Condition()
+        self.ready = [] # heap of (priority, sequence, Outbound) which may be sent
+        self.chains = {} # correlation id -> deque of Outbound, in production order
+        self.sequence = 0
+        self.generation = 0 # responses of an older generation were cleared
+        self.closed = False
+
+        self.large = DispatchQueue()
+        self.sender_thread = None
+        self.encoder_thread = None
+
+        # Counters, by label name
+        self.sent = {}
+        self.total_wait_ns = {}
+        self.max_wait_ns = {}
+        self.encoded_off_path = 0
+
+
+    """ Start the sender and the encoder thread. """
+    def start(self):
+        self.sender_thread = Thread(target=self.sending, name="outbound-sender")
+        self.encoder_thread = Thread(target=self.encoding, name="outbound-encoder")
+        self.sender_thread.start()
+        self.encoder_thread.start()
+
+
+    """
+    Queue a response of the SUT.
+    param [[String, dict, dict]] response; label name, parameter types and
+    parameter values
+    param [Integer] correlation_id; of the stimulus which caused the response
+    """
+    def put(self, response, correlation_id=None):
+        large = payload_size(response[2]) >= self.large_size
+        outbound = Outbound(response, correlation_id, time.time_ns(),
+            self.priorities.get(response[0], self.DEFAULT_PRIORITY), large)
+
+        with self.condition:
+            if self.closed:
+                return
+            outbound.sequence = self.sequence
+            outbound.generation = self.generation
+            self.sequence += 1
+
+            chain = self.chains.setdefault(correlation_id, deque())
+            chain.append(outbound)
+            if len(chain) == 1 and not large:
+                self.push(outbound)
+
+        if large:
+            self.large.put(outbound)
+
+
+    """
+    Make a response available to the sender; called with the condition held.
+    param [Outbound] outbound
+    """
+    def push(self, outbound):
+        heapq.heappush(self.ready, (outbound.priority, outbound.sequence, outbound))
+        self.condition.notify()
+
+
+    """
+    Send the responses by priority until the scheduler is closed.
+    """
+    def sending(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.ready or self.closed)
+                if self.closed:
+                    return
+                _, _, outbound = heapq.heappop(self.ready)
+
+            waited = time.monotonic_ns() - outbound.queued_at
+            try:
+                if not outbound.encoded:
+                    outbound.frame = self.encode(outbound.response, outbound.timestamp)
+                if outbound.frame != None:
+                    self.send(outbound.frame, outbound.correlation_id)
+            except Exception as e:
+                self.logger.error("OutboundScheduler", "Sending a response failed: {}", e)
+
+            label_name = outbound.response[0]
+            with self.condition:
+                self.sent[label_name] = self.sent.get(label_name, 0) + 1
+                self.total_wait_ns[label_name] = self.total_wait_ns.get(label_name, 0) + waited
+                self.max_wait_ns[label_name] = max(self.max_wait_ns.get(label_name, 0), waited)
+                self.advance(outbound)
+
+
+    """
+    Remove a sent response from its chain and make the next response of the
+    chain available; called with the condition held.
+    param [Outbound] outbound
+    """
+    def advance(self, outbound):
+        chain = self.chains.get(outbound.correlation_id)
+        if chain is None or not chain or chain[0] is not outbound:
+            # The responses were cleared while this one was sent
+            return
+
+        chain.popleft()
+        if not chain:
+            del self.chains[outbound.correlation_id]
+        elif not chain[0].large or chain[0].encoded:
+            self.push(chain[0])
+
+
+    """
+    Encode the large responses in the order they were queued.
+    """
+    def encoding(self):
+        while True:
+            outbound = self.large.get()
+            if outbound is None:
+                return
+            if outbound.generation != self.generation:
+                continue
+
+            try:
+                outbound.frame = self.encode(outbound.response, outbound.timestamp)
+            except Exception as e:
+                self.logger.error("OutboundScheduler", "Encoding a response failed: {}", e)
+                outbound.frame = None
+
+            with self.condition:
+                outbound.encoded = True
+                self.encoded_off_path += 1
+                chain = self.chains.get(outbound.correlation_id)
+                if chain and chain[0] is outbound:
+                    self.push(outbound)
+
+
+    """ Drop the responses which were not sent yet, e.g. on a reset. """
+    def clear(self):
+        with self.condition:
+            self.generation += 1
+            self.ready.clear()
+            self.chains.clear()
+        self.large.clear()
+
+
+    """
+    Stop the sender and the encoder; responses which were not sent yet are
+    dropped.
+    param [Float] timeout; seconds to wait for each thread
+    """
+    def close(self, timeout=10):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.large.close()
+
+        for thread in [self.sender_thread, self.encoder_thread]:
+            if thread != None:
+                thread.join(timeout)
+                if thread.is_alive():
+                    self.logger.warning("OutboundScheduler", "Thread {} did not stop within {} s", thread.name, timeout)
+
+
+    """
+    Number of responses which were not sent yet.
+    return [Integer]
+    """
+    def __len__(self):
+        with self.condition:
+            return sum(len(chain) for chain in self.chains.values())
+
+
+    """
+    Queueing delay per label type, and how many responses were encoded by
+    the encoder thread.
+    return [{String: Object}]
+    """
+    def stats(self):
+        with self.condition:
+            labels = {label_name: {
+                    "sent": sent,
+                    "mean_wait_ms": round(self.total_wait_ns[label_name] / sent / 1e6, 3),
+                    "max_wait_ms": round(self.max_wait_ns[label_name] / 1e6, 3),
+                } for label_name, sent in self.sent.items()}
+            return {"labels": labels, "encoded_off_path": self.encoded_off_path,
+                "pending": sum(len(chain) for chain in self.chains.values())}
+
+
+"""
+A response waiting to be sent.
+"""
+class Outbound:
+    """
+    param [[String, dict, dict]] response
+    param [Integer] correlation_id
+    param [Integer] timestamp; nanoseconds since the epoch when the response
+    was queued
+    param [Number] priority
+    param [Boolean] large; encoded by the encoder thread
+    """
+    def __init__(self, response, correlation_id, timestamp, priority, large):
+        self.response = response
+        self.correlation_id = correlation_id
+        self.timestamp = timestamp
+        self.queued_at = time.monotonic_ns()
+        self.priority = priority
+        self.large = large
+        self.sequence = 0
+        self.generation = 0
+        self.encoded = False
+        self.frame = None
+
+
+"""
+Estimate the size of a response by the number of values in its parameters,
+counting at most three levels deep: a page_update counts the fields of its
+n actions, a few values per action.
+param [Object] value
+param [Integer] depth
+return [Integer]
+"""
+def payload_size(value, depth=3):
+    if isinstance(value, dict):
+        values = value.values()
+    elif isinstance(value, (list, tuple)):
+        values = value
+    else:
+        return 1
+
+    if depth == 0:
+        return len(values)
+    return sum(payload_size(item, depth - 1) for item in values)
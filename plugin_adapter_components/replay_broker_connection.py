@@ -0,0 +1,237 @@
+import sys
+import time
+from threading import Condition
+
+from .broker_connection import BrokerConnection
+from .session_recorder import ADAPTER_NAME, INBOUND, OUTBOUND, read_session
+
+sys.path.insert(0, './api')
+import message_pb2
+
+"""
+The {ReplayBrokerConnection} replays a session log which was recorded by the
+{SessionRecorder} instead of connecting to AMP.
+
+The recorded inbound messages are fed to the {AdapterCore} at their original
+pace, or faster, and the outbound messages of the adapter are captured
+instead of sent. An inbound message is only fed once the adapter has sent
+as many messages as were recorded before it, so e.g. a reset does not drop
+responses which were sent before the reset in the recorded session. Afterwards #verify compares the captured outbound stream
+with the recorded one. The comparison leaves out what differs between runs
+by nature:
+- the timestamps of the labels, including those of the label definitions in
+  the announcement;
+- the page_updates found while idle, which depend on when the idle checks
+  happen to run;
+- the order of the messages of different stimuli, which the outbound
+  scheduler sends by priority. The messages of one stimulus (correlation id),
+  and the messages without a stimulus, are compared in their order;
+- the errors which were sent after the last inbound message, when the
+  recorded connection was closed.
+"""
+class ReplayBrokerConnection(BrokerConnection):
+    """
+    param [String] path; session log to replay
+    param [Logger] logger
+    param [Float] speed; replay speed factor, 0 feeds the messages without
+    waiting
+    param [Float] drain; seconds to wait for outstanding outbound messages
+    after the last inbound message
+    param [LatencyTracker] latency; None when latencies are not tracked
+    """
+    def __init__(self, path, logger, speed=1.0, drain=5.0, latency=None):
+        super().__init__(path, "", False, logger, latency)
+        self.speed = speed
+        self.drain = drain
+        self.closed = False
+
+        self.name = "" # the name the adapter announced itself with
+        self.inbound = [] # (timestamp, frame, compared messages recorded before it)
+        outbound = []
+        compared = 0
+        for direction, timestamp, frame, correlation_id in read_session(path):
+            if direction == INBOUND:
+                self.inbound.append((timestamp, frame, compared))
+            elif direction == OUTBOUND:
+                outbound.append((timestamp, frame, correlation_id))
+                if not is_idle_update(normalize(frame), correlation_id):
+                    compared += 1
+            elif direction == ADAPTER_NAME:
+                self.name = frame.decode("utf-8")
+
+        # The replay ends without the errors of a closing connection
+        last_inbound = self.inbound[-1][0] if self.inbound else 0
+        self.expected = [(frame, correlation_id) # (frame, correlation id)
+            for timestamp, frame, correlation_id in outbound
+            if timestamp < last_inbound or not normalize(frame).HasField("error")]
+        self.expected_compared = sum(1 for frame, correlation_id in self.expected
+            if not is_idle_update(normalize(frame), correlation_id))
+
+        self.condition = Condition()
+        self.produced = []
+        self.produced_compared = 0
+
+
+    """ Replay the session, blocks until it is fed and drained. """
+    def connect(self):
+        self.logger.info("BrokerConnection", "Replaying {} inbound messages", len(self.inbound))
+        self.on_open(None)
+
+        started_at = time.monotonic()
+        first_timestamp = self.inbound[0][0] if self.inbound else 0
+        for timestamp, frame, compared_before in self.inbound:
+            if self.closed:
+                break
+
+            with self.condition:
+                if not self.condition.wait_for(lambda: self.produced_compared >= compared_before,
+                        timeout=self.drain):
+                    self.logger.warning("BrokerConnection", "Fed a message after {} s without the {} messages recorded before it",
+                        self.drain, compared_before - self.produced_compared)
+
+            if self.speed > 0:
+                due = started_at + (timestamp - first_timestamp) / 1e9 / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            self.on_message(None, frame)
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.produced_compared >= self.expected_compared,
+                timeout=self.drain)
+
+        self.on_close(None, 1000, "Replay finished")
+
+
+    """
+    Handler for when the replay is finished.
+    param [None] ws
+    param [Integer] close_status_code
+    param [String] close_msg
+    """
+    def on_close(self, ws, close_status_code, close_msg):
+        self.logger.info("BrokerConnection", "The stop reason is: {}", close_msg)
+
+        # Stop the SUT response handler thread
+        if self.adapter_core != None and self.adapter_core.handler != None:
+            self.adapter_core.handler.stop_threads = True
+            self.adapter_core.handler.stop()
+
+
+    """
+    Stop feeding the recorded messages.
+    param [String] reason
+    param [Integer] code
+    """
+    def close(self, reason="", code=-1):
+        self.logger.info("BrokerConnection", "Closing the replay due to: {}", reason)
+        self.closed = True
+
+        if self.adapter_core != None and self.adapter_core.handler != None:
+            self.adapter_core.handler.stop_threads = True
+
+
+    """
+    Capture a message of the adapter instead of sending it.
+    param [bytes] frame
+    param [Integer] correlation_id; of the stimulus a response belongs to
+    """
+    def send_frame(self, frame, correlation_id=None):
+        idle_update = is_idle_update(normalize(frame), correlation_id)
+        with self.condition:
+            self.produced.append((frame, correlation_id))
+            if not idle_update:
+                self.produced_compared += 1
+            self.condition.notify_all()
+
+        if correlation_id != None and self.latency != None:
+            self.latency.stamp(correlation_id, "response_written")
+
+
+    """
+    Compare the captured outbound messages with the recorded ones.
+    return [(Boolean, String)] whether the streams match and a description
+    """
+    def verify(self):
+        with self.condition:
+            produced = list(self.produced)
+
+        expected_streams = streams(self.expected)
+        produced_streams = streams(produced)
+
+        for key in list(expected_streams) + [key for key in produced_streams
+                if key not in expected_streams]:
+            expected = expected_streams.get(key, [])
+            actual = produced_streams.get(key, [])
+            for index, (expected_message, actual_message) in enumerate(zip(expected, actual)):
+                if expected_message != actual_message:
+                    return False, "Outbound message {} of {} differs:\nrecorded: {}\nreplayed: {}".format(
+                        index, describe(key), expected_message, actual_message)
+
+            if len(expected) != len(actual):
+                return False, "Recorded {} outbound messages of {}, replayed {}".format(
+                    len(expected), describe(key), len(actual))
+
+        compared = sum(len(messages) for messages in produced_streams.values())
+        return True, "All {} outbound messages match ({} idle page updates left out)".format(
+            compared, len(produced) - compared)
+
+
+"""
+Split outbound messages into the streams which keep their order: one per
+stimulus, and one of the messages without a stimulus. The page_updates
+found while idle are left out.
+param [[(bytes, Integer)]] messages; frames and their correlation ids
+return [{Integer: [message_pb2.Message]}] normalized messages by correlation
+id, None for the messages without a stimulus
+"""
+def streams(messages):
+    result = {}
+    for frame, correlation_id in messages:
+        pb_message = normalize(frame)
+        if is_idle_update(pb_message, correlation_id):
+            continue
+        if correlation_id is None and pb_message.HasField("label"):
+            if pb_message.label.correlation_id:
+                # A stimulus which is confirmed
+                correlation_id = pb_message.label.correlation_id
+        result.setdefault(correlation_id, []).append(pb_message)
+    return result
+
+
+"""
+Whether an outbound message is a page_update which was found while idle.
+param [message_pb2.Message] pb_message
+param [Integer] correlation_id
+return [Boolean]
+"""
+def is_idle_update(pb_message, correlation_id):
+    return correlation_id is None and pb_message.HasField("label") \
+        and pb_message.label.label == "page_update"
+
+
+"""
+param [Integer] correlation_id
+return [String]
+"""
+def describe(correlation_id):
+    if correlation_id is None:
+        return "the messages without a stimulus"
+    return "stimulus {}".format(correlation_id)
+
+
+"""
+Decode an outbound frame and clear the fields which differ between runs.
+param [bytes] frame
+return [message_pb2.Message]
+"""
+def normalize(frame):
+    pb_message = message_pb2.Message()
+    pb_message.ParseFromString(frame)
+    if pb_message.HasField("label"):
+        pb_message.label.timestamp = 0
+    elif pb_message.HasField("announcement"):
+        for pb_label in pb_message.announcement.labels:
+            pb_label.timestamp = 0
+    return pb_message
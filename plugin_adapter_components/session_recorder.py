@@ -0,0 +1,85 @@
+import struct
+import time
+from threading import Lock
+
+"""
+The {SessionRecorder} records the broker traffic of a session in a compact
+binary session log, so slow sessions can be replayed offline.
+
+The log starts with the MAGIC bytes, followed by one record per message:
+a header with the direction (INBOUND or OUTBOUND), a time.monotonic_ns()
+timestamp, the correlation id of the stimulus an outbound message belongs to
+(0 for none) and the length of the frame, followed by the serialized
+message_pb2.Message frame itself. The first record holds the name the adapter
+announced itself with, as UTF-8 (direction ADAPTER_NAME). Records are written
+through a buffered file.
+"""
+
+MAGIC = b"AXSL\x02"
+RECORD_HEADER = struct.Struct("<BQQI") # direction, timestamp in ns, correlation id, frame length
+
+INBOUND = 0
+OUTBOUND = 1
+ADAPTER_NAME = 2
+
+
+class SessionRecorder:
+    """
+    param [String] path
+    param [String] name; the name the adapter announces itself with
+    param [Integer] buffer_size; bytes buffered before they are written
+    """
+    def __init__(self, path, name="", buffer_size=1024 * 1024):
+        self.path = path
+        self.lock = Lock()
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(MAGIC)
+        self.record(ADAPTER_NAME, name.encode("utf-8"))
+
+
+    """
+    Record a frame.
+    param [Integer] direction; INBOUND or OUTBOUND
+    param [bytes] frame; serialized message_pb2.Message
+    param [Integer] correlation_id; of the stimulus an outbound message
+    belongs to
+    """
+    def record(self, direction, frame, correlation_id=None):
+        header = RECORD_HEADER.pack(direction, time.monotonic_ns(), correlation_id or 0,
+            len(frame))
+        with self.lock:
+            if self.file != None:
+                self.file.write(header)
+                self.file.write(frame)
+
+
+    """ Write the buffered records and close the log. """
+    def close(self):
+        with self.lock:
+            if self.file != None:
+                self.file.close()
+                self.file = None
+
+
+"""
+Read the records of a session log.
+param [String] path
+return [generator((Integer, Integer, bytes, Integer))] direction, timestamp,
+frame and correlation id, None for none
+"""
+def read_session(path):
+    with open(path, "rb") as log:
+        if log.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a session log".format(path))
+
+        while True:
+            header = log.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+
+            direction, timestamp, correlation_id, length = RECORD_HEADER.unpack(header)
+            frame = log.read(length)
+            if len(frame) < length:
+                return
+
+            yield direction, timestamp, frame, correlation_id or None
@@ -0,0 +1,109 @@
+import sys
+import time
+from threading import Lock
+
+"""
+The {StartupProfile} times the startup of the plugin adapter: the imports of
+plugin_adapter.py, the connection with AMP, the announcement, the
+configuration and the SUT being ready, and the imports of the SUT backend
+which are preloaded in the background meanwhile.
+
+All times are relative to the start of the process (the first line of
+plugin_adapter.py). The report is written to the stderr in the style of
+`python -X importtime`, and the time until the announcement is held against
+an optional budget, so adapters which are scaled automatically become
+available in time.
+"""
+class StartupProfile:
+    """
+    param [Integer] started_ns; time.monotonic_ns() at the start of the
+    process
+    param [Logger] logger
+    param [Boolean] report; write the report to the stderr once the SUT is
+    ready
+    param [Float] budget_ms; milliseconds from the start of the process
+    until the announcement, None when there is no budget
+    """
+    def __init__(self, started_ns, logger, report=True, budget_ms=None):
+        self.started_ns = started_ns
+        self.logger = logger
+        self.report = report
+        self.budget_ms = budget_ms
+        self.lock = Lock()
+        self.events = [] # (name, ns since the start)
+        self.imports = [] # (module, ns since the start, duration in ns)
+        self.finished = False
+
+
+    """
+    Record that the startup passed an event; only the first occurrence is
+    recorded. The budget is checked when the announcement is sent.
+    param [String] name
+    param [Integer] at_ns; time.monotonic_ns() of the event, None is now
+    """
+    def mark(self, name, at_ns=None):
+        if at_ns is None:
+            at_ns = time.monotonic_ns()
+        elapsed_ns = at_ns - self.started_ns
+        with self.lock:
+            if any(event == name for event, _ in self.events):
+                return
+            self.events.append((name, elapsed_ns))
+
+        if name == "announced" and self.budget_ms != None and elapsed_ns / 1e6 > self.budget_ms:
+            self.logger.warning("StartupProfile", "Announced after {:.1f} ms, over the budget of {:.1f} ms",
+                elapsed_ns / 1e6, self.budget_ms)
+
+
+    """
+    Record the import of a module.
+    param [String] module
+    param [Integer] begin_ns; time.monotonic_ns() before the import
+    """
+    def imported(self, module, begin_ns):
+        end_ns = time.monotonic_ns()
+        with self.lock:
+            self.imports.append((module, begin_ns - self.started_ns, end_ns - begin_ns))
+
+
+    """
+    The report lines: the events with the time since the start and since the
+    previous event, followed by the preloaded imports.
+    return [[String]]
+    """
+    def lines(self):
+        with self.lock:
+            events = list(self.events)
+            imports = list(self.imports)
+
+        lines = ["startup: {:>10} | {:>10} | event".format("total [ms]", "step [ms]")]
+        previous_ns = 0
+        for name, elapsed_ns in events:
+            lines.append("startup: {:>10.1f} | {:>10.1f} | {}".format(
+                elapsed_ns / 1e6, (elapsed_ns - previous_ns) / 1e6, name))
+            previous_ns = elapsed_ns
+
+        for module, begin_ns, duration_ns in imports:
+            lines.append("startup: {:>10.1f} | {:>10.1f} | preloaded {}".format(
+                (begin_ns + duration_ns) / 1e6, duration_ns / 1e6, module))
+
+        if self.budget_ms != None:
+            announced = [elapsed_ns for name, elapsed_ns in events if name == "announced"]
+            status = "not announced" if not announced else \
+                "{:.1f} ms".format(announced[0] / 1e6)
+            lines.append("startup: budget until announced {:.1f} ms, took {}".format(
+                self.budget_ms, status))
+
+        return lines
+
+
+    """ Write the report to the stderr, once. """
+    def finish(self):
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+
+        if self.report:
+            sys.stderr.write("\n".join(self.lines()) + "\n")
+            sys.stderr.flush()
@@ -0,0 +1,66 @@
+import sys
+import argparse
+
+from plugin_adapter_components.logger import Logger
+from plugin_adapter_components.adapter_core import AdapterCore
+from plugin_adapter_components.replay_broker_connection import ReplayBrokerConnection
+from plugin_adapter_components.handler import Handler
+
+"""
+Replay a recorded session log against the plugin adapter and verify that the
+adapter produces the recorded outbound messages.
+return [Boolean] whether the outbound streams match
+"""
+def replay_session(path, log_level, speed=1.0, drain=5.0, sut_options=None,
+        reset_strategy="relaunch", sut_backend="selenium"):
+    logger = Logger()
+    logger.log_level(log_level & logger.LOG_ALL)
+
+    broker_connection = ReplayBrokerConnection(path, logger, speed, drain)
+    handler = Handler(logger, sut_options, reset_strategy=reset_strategy,
+        sut_backend=sut_backend)
+
+    # The announcement is compared too, so the recorded name is announced
+    adapter_core = AdapterCore(broker_connection.name, broker_connection, handler, logger)
+
+    broker_connection.register_adapter_core(adapter_core)
+    handler.register_adapter_core(adapter_core)
+    handler.preload()
+
+    adapter_core.start()
+
+    matches, description = broker_connection.verify()
+    print(description)
+    return matches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s','--session',
+        help='Session log recorded with --record_session', required=True)
+    parser.add_argument('-sp','--speed', type=float, default=1.0,
+        help='Replay speed factor: 1 is the original pace, 0 is as fast as possible', required=False)
+    parser.add_argument('-d','--drain', type=float, default=5.0,
+        help='Seconds to wait for the outstanding outbound messages', required=False)
+    parser.add_argument('-ll','--log_level', type=int, default=Logger.LOG_WARNING,
+        help='AMP Adapter logger level: 1 = error, 2 = warning, 4 = info, 8 = debug or 15 = all', required=False)
+    parser.add_argument('--sut', choices=['selenium', 'simulated'], default='selenium',
+        help='SUT backend: "selenium" (Chrome) or "simulated" (browserless lxml pages)', required=False)
+    parser.add_argument('--sut_site',
+        help='Directory the simulated SUT serves its pages from', required=False)
+    parser.add_argument('-cc','--change_capture', choices=['xmldiff', 'mutation'], default='xmldiff',
+        help='Page update detection: "xmldiff" (full page diff) or "mutation" (in-page MutationObserver)', required=False)
+    parser.add_argument('-rs','--reset_strategy', choices=['relaunch', 'session'], default='relaunch',
+        help='Reset: "relaunch" restarts the browser, "session" wipes the browser session', required=False)
+
+    args = parser.parse_args()
+
+    sut_options = {
+        "change_capture": args.change_capture,
+    }
+    if args.sut == "simulated":
+        sut_options["site"] = args.sut_site
+
+    matches = replay_session(args.session, args.log_level, args.speed, args.drain,
+        sut_options, args.reset_strategy, args.sut)
+    sys.exit(0 if matches else 1)
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+from plugin_adapter_components.client_side.diff_pool import DiffPool
+from plugin_adapter_components.client_side.simulated_sut import SimulatedSut
+from plugin_adapter_components.dispatch_queue import DispatchQueue
+from plugin_adapter_components.logger import Logger
+
+SITE = {
+    "/": "<html><head><title>Form</title></head><body><form><input id=\"name\"></form></body></html>",
+}
+
+# Runs the pool in a process of its own, whose resource tracker reports the
+# shared memory which was not cleaned up when the process exits
+POOL_SCRIPT = """
+import sys
+import time
+sys.path.insert(0, {repository!r})
+from plugin_adapter_components.client_side.diff_pool import DiffPool
+from plugin_adapter_components.logger import Logger
+
+if __name__ == "__main__":
+    pool = DiffPool(2, Logger(), max_pending=2)
+    results = []
+    for index in range(12):
+        pool.submit("<html><body><p>{{}}</p></body></html>".format(index),
+            "<html><body><p>{{}}</p></body></html>".format(index + 1), results.append)
+    deadline = time.monotonic() + 60
+    while len(results) < 12 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pool.close()
+"""
+
+
+def page(index):
+    return "<html><body><p>{}</p></body></html>".format(index)
+
+
+class DiffPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = Logger()
+        self.logger.log_level(Logger.LOG_ERROR)
+        self.pool = DiffPool(1, self.logger, max_pending=1)
+
+
+    def tearDown(self):
+        self.pool.close()
+
+
+    """
+    Wait until a condition holds.
+    param [function] condition
+    """
+    def wait_for(self, condition, timeout=30):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+
+    def test_busy_pool_keeps_every_diff(self):
+        results = []
+        for index in range(6):
+            self.pool.submit(page(index), page(index + 1),
+                lambda nodes, index=index: results.append((index, nodes)))
+
+        self.wait_for(lambda: len(results) == 6)
+        self.assertEqual([index for index, _ in results], list(range(6)))
+        self.assertTrue(all(nodes for _, nodes in results))
+        self.assertEqual(self.pool.stats()["waited"], 5)
+
+
+    def test_sut_reports_the_updates_of_every_stimulus(self):
+        responses = DispatchQueue()
+        sut = SimulatedSut(self.logger, responses, DispatchQueue(), diff_pool=self.pool,
+            site=SITE)
+        sut.start()
+        sut.visit("http://sut.test/")
+
+        correlation_ids = list(range(40, 46))
+        for correlation_id in correlation_ids:
+            sut.correlation_id = correlation_id
+            sut.fill_in("#name", "value {}".format(correlation_id))
+
+        updates = []
+        def drained():
+            while len(responses):
+                response, correlation_id = responses.get()
+                if response[0] == "page_update":
+                    updates.append(correlation_id)
+            return len(updates) == len(correlation_ids)
+
+        self.wait_for(drained)
+        self.assertEqual(updates, correlation_ids)
+        sut.stop()
+
+
+    def test_workers_leak_no_shared_memory(self):
+        result = subprocess.run([sys.executable, "-c", POOL_SCRIPT.format(repository=REPOSITORY)],
+            capture_output=True, text=True, timeout=120)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn("leaked shared_memory", result.stderr)
+        self.assertNotIn("Traceback", result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
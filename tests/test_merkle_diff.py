@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+
+from lxml import etree
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+from plugin_adapter_components.client_side.page_diff import diff_trees, group_actions
+
+# Pages before and after a change which both engines express with the same
+# actions
+CHANGES = [
+    ("<html><body><h1>Title</h1><p>Some longer text here</p></body></html>",
+     "<html><body><h1>Title</h1><p>Some other longer text here</p></body></html>"),
+    ("<html><body class=\"a\"><p>One</p></body></html>",
+     "<html><body class=\"b\"><p>One</p></body></html>"),
+    ("<html><body><div id=\"a\"><span>x</span></div><div id=\"b\"><span>y</span></div></body></html>",
+     "<html><body><div id=\"a\"><span>x</span></div><div id=\"b\"><span>z</span></div></body></html>"),
+    ("<html><body><div><p id=\"x\">A</p></div><div><p>B</p></div></body></html>",
+     "<html><body><div><p id=\"y\">A</p></div><div><p>B</p>after</div></body></html>"),
+    ("<html><body><p>One</p></body></html>",
+     "<html><body><p>One</p><p>Two</p></body></html>"),
+    ("<html><body><p>One</p><p>Two</p></body></html>",
+     "<html><body><p>One</p></body></html>"),
+]
+
+
+class MerkleDiffTest(unittest.TestCase):
+    def test_same_xpaths_as_xmldiff(self):
+        for before, after in CHANGES:
+            with self.subTest(before=before, after=after):
+                nodes = {}
+                for engine in ["xmldiff", "merkle"]:
+                    actions = diff_trees(etree.ElementTree(etree.fromstring(before)),
+                        etree.ElementTree(etree.fromstring(after)), engine)
+                    nodes[engine] = group_actions(actions)
+
+                self.assertTrue(nodes["merkle"])
+                self.assertEqual(nodes["merkle"], nodes["xmldiff"])
+
+
+    def test_xpaths_always_have_an_index(self):
+        actions = diff_trees(etree.ElementTree(etree.fromstring(CHANGES[1][0])),
+            etree.ElementTree(etree.fromstring(CHANGES[1][1])), "merkle")
+
+        self.assertEqual([action.node for action in actions], ["/html/body[1]"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import unittest
+from threading import Thread
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+sys.path.insert(0, os.path.join(REPOSITORY, "api"))
+sys.path.insert(0, os.path.join(REPOSITORY, "benchmarks"))
+
+from fake_amp import FakeAmp
+from plugin_adapter import start_plugin_adapter
+from plugin_adapter_components.logger import Logger
+from plugin_adapter_components.session_recorder import ADAPTER_NAME, read_session
+from replay_session import replay_session
+
+SITE = {
+    "/": "<html><head><title>Home</title></head><body><a id=\"next\" href=\"/next\">Next</a></body></html>",
+    "/next": "<html><head><title>Next</title></head><body><p id=\"done\">Done</p></body></html>",
+}
+
+SCRIPT = {
+    "count": 6,
+    "rate": 5,
+    "reset_every": 2,
+    "drain": 0.5,
+    "stimuli": [
+        {"label": "visit", "parameters": {"_url": "http://sut.test/"}},
+        {"label": "click_link", "parameters": {"_css_selector": "#next"}},
+    ],
+}
+
+
+class ReplaySessionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "session.axsl")
+        self.sut_options = {"site": SITE}
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    """ Record a session against the fake AMP broker. """
+    def record(self):
+        amp = FakeAmp(SCRIPT)
+        amp.start()
+
+        adapter = Thread(target=start_plugin_adapter, args=("channel@tester", amp.url,
+            "token", Logger.LOG_ERROR, False), kwargs={"sut_options": self.sut_options,
+            "record_session": self.path, "sut_backend": "simulated"})
+        adapter.start()
+        self.assertTrue(amp.wait(60), "The recorded session did not finish")
+        adapter.join(30)
+        self.assertFalse(adapter.is_alive(), "The adapter did not stop")
+        self.assertEqual(amp.errors, [])
+        self.assertEqual(amp.stimuli_confirmed, SCRIPT["count"])
+
+
+    def test_recorded_session_replays(self):
+        self.record()
+
+        records = list(read_session(self.path))
+        self.assertEqual(records[0][0], ADAPTER_NAME)
+        self.assertEqual(records[0][2], b"channel@tester")
+
+        self.assertTrue(replay_session(self.path, Logger.LOG_ERROR, speed=0, drain=5.0,
+            sut_options=self.sut_options, sut_backend="simulated"))
+
+
+if __name__ == '__main__':
+    unittest.main()